@@ -3,25 +3,322 @@ Flask API服务 - 英文语音合成接口
 提供RESTful API接口用于英文文本转语音
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
+from flask_sock import Sock
+import io
+import json
+import base64
 import os
+import sys
+import signal
 import logging
 from datetime import datetime
 import uuid
+import hmac
 from tts_service import tts_service
+from cost_estimator import BulkCostEstimator
+from duplex_session import DuplexSynthesisSession
+from scheduler import resolve_priority
+from rate_limiter import SharedRateLimiter
+from health_prober import UpstreamProber
+from traffic_capture import TrafficRecorder
+from lesson_composer import LessonComposer, ComposeError, tee_to_file
+from profiler import SamplingProfiler, request_tracker
+from audio_slimmer import parse_slim_options
+from memory_budget import MemoryBudget, MemoryBudgetExceeded
+from peer_cache import CACHE_KEY_PATTERN
+from deadline import parse_timeout_ms, remaining, expired
+from tiered_store import TieredAudioStore
+from output_index import OutputIndex
+from audio_cache import make_cache_key
+from request_log import LogPipeline
+from voice_fanout import VoiceFanout
+from werkzeug.utils import secure_filename
 
 # 创建Flask应用
 app = Flask(__name__)
+sock = Sock(app)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 日志经有界队列由后台线程写出，每个请求输出一条JSONL记录
+log_pipeline = LogPipeline.from_config(tts_service.model_configs.get('logging'))
+log_pipeline.install()
+
+# 按租户限流（所有工作进程共享同一额度）
+rate_limit_config = dict(tts_service.model_configs.get('rate_limits', {}))
+if os.getenv('TTS_RATE_LIMIT_ENABLED', 'true').lower() != 'true':
+    rate_limit_config['enabled'] = False
+rate_limiter = SharedRateLimiter(rate_limit_config, path=os.getenv('TTS_RATE_LIMIT_FILE'))
+
+# 按估算的在途音频字节数进行准入控制（每个工作进程独立的内存上限）
+memory_budget = MemoryBudget(tts_service.model_configs.get('memory_budget'))
+
+# 后台上游探测，用于深度就绪检查
+prober = UpstreamProber.from_env(tts_service)
+prober.start()
+
+# 按需采集请求形态，供 replay.py 回放（设置TTS_CAPTURE_FILE开启）
+recorder = TrafficRecorder.from_env()
+
+# 按需运行的采样分析器（管理接口，需设置ADMIN_TOKEN）
+profiler = SamplingProfiler(request_tracker)
+
 # 创建输出目录
 OUTPUT_DIR = "audio_outputs"
 if not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
 
+# 输出目录分层存储：长时间未访问的文件在后台压缩移入冷层，下载时透明提升
+audio_store = TieredAudioStore(
+    OUTPUT_DIR, tts_service.model_configs.get('storage'), is_pending=tts_service.audio_writer.is_pending
+)
+audio_store.start()
+
+# 已保存音频的内容索引：同一句子再次请求时直接复用输出目录中的文件，启动时在后台加载上次的快照
+output_index = OutputIndex(
+    OUTPUT_DIR, tts_service.model_configs.get('output_index'),
+    resolve=audio_store.resolve, is_pending=tts_service.audio_writer.is_pending
+)
+tts_service.output_index = output_index
+output_index.start()
+
+
+def get_request_priority():
+    """从请求头(X-Priority)或客户端API Key(X-API-Key)确定优先级类别"""
+    return resolve_priority(
+        tts_service.scheduler_config,
+        request.headers.get('X-Priority'),
+        request.headers.get('X-API-Key')
+    )
+
+
+def get_tenant_id():
+    """
+    租户标识：在rate_limits.tenants或scheduler.api_key_classes中登记过的客户端API Key，否则使用客户端IP。
+    未登记的Key不作为租户，避免客户端轮换Key值获得新的满额令牌桶
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key and (rate_limiter.is_known_tenant(api_key)
+                    or api_key in tts_service.scheduler_config.get('api_key_classes', {})):
+        return api_key
+    return request.remote_addr or 'anonymous'
+
+
+def check_rate_limit(chars: int):
+    """检查租户限流，超限时返回429响应，否则返回None"""
+    request_tracker.set_stage('rate_limit')
+    allowed, info = rate_limiter.check(get_tenant_id(), chars)
+    g.rate_limit = info
+    if allowed:
+        return None
+    response = jsonify({
+        'success': False,
+        'error': '请求过于频繁',
+        'message': f"超出限流额度，请在{info['retry_after']}秒后重试"
+    })
+    response.headers['Retry-After'] = str(max(1, int(info['retry_after'] + 0.999)))
+    return response, 429
+
+
+@app.before_request
+def track_request_begin():
+    """登记请求的处理阶段，供 /api/admin/inflight 查看"""
+    request_tracker.begin(request.endpoint)
+
+
+@app.teardown_request
+def track_request_end(error=None):
+    request_tracker.end()
+
+
+# 请求记录中从合成结果复制的字段
+REQUEST_LOG_FIELDS = ('model', 'voice', 'format', 'sample_rate', 'text_length', 'cache_hit', 'cost',
+                      'audio_bytes', 'bytes_saved')
+
+
+def annotate_request_log(result):
+    """把合成结果的元数据附加到本次请求的日志记录"""
+    fields = {key: result[key] for key in REQUEST_LOG_FIELDS if key in result}
+    if 'audio' in result:
+        fields['audio_bytes'] = len(result['audio'])
+    elif 'audio_data' in result:
+        fields['audio_bytes'] = len(result['audio_data']) * 3 // 4 - result['audio_data'][-2:].count('=')
+    if not result.get('success'):
+        fields['error'] = result.get('message')
+    g.log_fields = fields
+
+
+@app.after_request
+def log_request(response):
+    """输出本次请求的结构化记录（流式响应的耗时只计到响应头发出）"""
+    timings = request_tracker.timings() or {}
+    fields = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': timings.get('elapsed_ms'),
+        'stages': timings.get('stages'),
+        'bytes': response.content_length,
+        'streamed': response.is_streamed,
+        'priority': request.headers.get('X-Priority')
+    }
+    fields.update(g.get('log_fields', {}))
+    log_pipeline.log_request(fields, response.status_code)
+    return response
+
+
+def check_admin_token():
+    """校验管理接口令牌（X-Admin-Token），未配置ADMIN_TOKEN时管理接口不可用"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({
+            'success': False,
+            'error': '管理接口未启用',
+            'message': '请设置ADMIN_TOKEN环境变量'
+        }), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({
+            'success': False,
+            'error': '管理令牌无效',
+            'message': '认证失败'
+        }), 401
+    return None
+
+
+def index_saved_file(result, text: str, filename: str):
+    """把保存的文件登记到内容索引（瘦身后的音频与缓存键不对应，不登记）"""
+    output_index.record(
+        make_cache_key(result['model'], result['voice'], result['format'], result['sample_rate'], text),
+        filename
+    )
+
+
+def get_request_deadline(data):
+    """从X-Timeout-Ms请求头或timeout_ms字段获取截止时间，格式错误时抛出ValueError"""
+    return parse_timeout_ms(request.headers.get('X-Timeout-Ms') or data.get('timeout_ms'))
+
+
+def parse_sample_rate(value):
+    """校验请求中的采样率，未指定时返回None，不是正整数时抛出ValueError"""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        sample_rate = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('sample_rate必须是正整数')
+    if sample_rate <= 0:
+        raise ValueError('sample_rate必须是正整数')
+    return sample_rate
+
+
+def deadline_exceeded_response():
+    return jsonify({
+        'success': False,
+        'error': '请求超时',
+        'message': '请求已超过截止时间'
+    }), 504
+
+
+def estimate_memory(text_length: int, voice, format, sample_rate, binary: bool = False, slim: bool = False) -> int:
+    """估算请求占用的内存，音频大小优先使用按实际上游结果学习的预测"""
+    format = format or tts_service.current_config['default_format']
+    sample_rate = sample_rate or tts_service.current_config['default_sample_rate']
+    audio_bytes = tts_service.latency_model.predict_bytes(
+        tts_service.current_model, voice, format, sample_rate, text_length
+    )
+    return memory_budget.estimate(text_length, sample_rate, format, binary, slim, audio_bytes=audio_bytes)
+
+
+def admit_request(size: int, deadline=None):
+    """按内存预算准入，预算不足且排队超时时返回503响应（超过截止时间时返回504），否则返回None"""
+    request_tracker.set_stage('memory_wait')
+    timeout = remaining(deadline)
+    if timeout is not None:
+        timeout = min(timeout, memory_budget.config['max_wait'])
+    try:
+        g.memory_reservation = memory_budget.acquire(size, timeout)
+    except MemoryBudgetExceeded as e:
+        if expired(deadline):
+            return deadline_exceeded_response()
+        logger.warning(f"内存预算不足，拒绝请求: 预估={size}字节, {e}")
+        response = jsonify({
+            'success': False,
+            'error': '服务繁忙',
+            'message': f'内存预算不足: {e}'
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return None
+
+
+@app.after_request
+def release_memory_on_close(response):
+    """响应体发送完毕（包括流式响应）后才释放内存预留"""
+    reservation = g.get('memory_reservation')
+    if reservation:
+        response.call_on_close(lambda: memory_budget.release(reservation))
+    return response
+
+
+@app.teardown_request
+def release_memory_on_error(error=None):
+    """请求异常终止时释放内存预留（重复释放无副作用）"""
+    reservation = g.get('memory_reservation')
+    if reservation and error is not None:
+        memory_budget.release(reservation)
+
+
+@app.after_request
+def add_rate_limit_headers(response):
+    """在响应中附加X-RateLimit-*头"""
+    info = g.get('rate_limit')
+    if info:
+        response.headers['X-RateLimit-Limit'] = str(info['limit'])
+        response.headers['X-RateLimit-Remaining'] = str(info['remaining'])
+        response.headers['X-RateLimit-Reset'] = str(info['reset'])
+        response.headers['X-RateLimit-Limit-Chars'] = str(info['limit_chars'])
+        response.headers['X-RateLimit-Remaining-Chars'] = str(info['remaining_chars'])
+        response.headers['X-RateLimit-Reset-Chars'] = str(info['reset_chars'])
+    return response
+
+
+# 二进制响应中携带的合成结果元数据
+AUDIO_META_HEADERS = {
+    'X-TTS-Model': 'model',
+    'X-TTS-Voice': 'voice',
+    'X-TTS-Format': 'format',
+    'X-TTS-Sample-Rate': 'sample_rate',
+    'X-TTS-Text-Length': 'text_length',
+    'X-TTS-Cost': 'cost',
+    'X-TTS-Cache-Hit': 'cache_hit',
+    'X-TTS-Bytes-Saved': 'bytes_saved',
+    'X-TTS-Saved-File': 'saved_file'
+}
+
+
+def wants_binary_audio(format: str) -> bool:
+    """客户端是否通过Accept头要求直接返回音频二进制（默认仍返回JSON）"""
+    best = request.accept_mimetypes.best_match(
+        ['application/json', 'application/octet-stream', f'audio/{format}']
+    )
+    return best is not None and best != 'application/json'
+
+
+def binary_audio_response(result):
+    """以音频二进制返回合成结果，元数据放在X-TTS-*响应头中"""
+    response = Response(result['audio'], mimetype=f"audio/{result['format']}")
+    for header, key in AUDIO_META_HEADERS.items():
+        if key in result:
+            value = result[key]
+            response.headers[header] = str(value).lower() if isinstance(value, bool) else str(value)
+    return response
+
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -33,6 +330,38 @@ def health_check():
     })
 
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """存活检查：进程能够响应请求即返回200"""
+    return jsonify({
+        'status': 'alive',
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """深度就绪检查：当前模型的上游最近探测成功才返回200，否则返回503"""
+    model_name = tts_service.current_model
+    ready = prober.is_model_ready(model_name)
+    upstream = prober.get_stats()
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'model': model_name,
+        'upstream': upstream['models'].get(model_name),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
+
+@app.route('/api/health/upstream', methods=['GET'])
+def upstream_stats():
+    """获取各模型上游探测的滚动延迟和错误统计"""
+    return jsonify({
+        'success': True,
+        'prober': prober.get_stats()
+    })
+
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
     """获取可用的模型列表"""
@@ -114,6 +443,358 @@ def get_voices():
         }), 500
 
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """获取合成缓存统计信息"""
+    try:
+        return jsonify({
+            'success': True,
+            'cache': tts_service.get_cache_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取缓存统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取缓存统计失败: {e}'
+        }), 500
+
+
+def check_peer_request(key: str):
+    """校验节点间缓存请求：需启用分布式缓存（必须配置TTS_PEER_TOKEN）、X-Peer-Token正确且键格式正确"""
+    peer_cache = tts_service.peer_cache
+    if not peer_cache:
+        return jsonify({
+            'success': False,
+            'error': '分布式缓存未启用',
+            'message': '请配置peer_cache或TTS_PEERS'
+        }), 404
+    if not hmac.compare_digest(request.headers.get('X-Peer-Token', ''), peer_cache.token):
+        return jsonify({
+            'success': False,
+            'error': '节点令牌无效',
+            'message': '认证失败'
+        }), 401
+    if not CACHE_KEY_PATTERN.match(key):
+        return jsonify({
+            'success': False,
+            'error': '参数错误',
+            'message': '缓存键格式错误'
+        }), 400
+    return None
+
+
+def read_request_body(limit: int) -> bytes:
+    """读取请求体，最多读取limit字节"""
+    chunks = []
+    size = 0
+    while size < limit:
+        chunk = request.stream.read(min(65536, limit - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b''.join(chunks)
+
+
+@app.route('/api/cache/<key>', methods=['GET'])
+def get_cache_entry(key):
+    """节点间读取：返回本节点缓存中的音频，不触发合成"""
+    error = check_peer_request(key)
+    if error:
+        return error
+    audio_data = tts_service.cache.get(key)
+    if audio_data is None:
+        return jsonify({
+            'success': False,
+            'error': '未命中',
+            'message': '缓存中不存在该键'
+        }), 404
+    return Response(audio_data, mimetype='application/octet-stream')
+
+
+@app.route('/api/cache/<key>', methods=['PUT'])
+def put_cache_entry(key):
+    """节点间复制：写入本节点缓存（不再继续复制）"""
+    error = check_peer_request(key)
+    if error:
+        return error
+    # 分块传输的请求没有Content-Length，读取时同样限制长度
+    max_bytes = tts_service.peer_cache.max_entry_bytes
+    audio_data = b''
+    if not request.content_length or request.content_length <= max_bytes:
+        audio_data = read_request_body(max_bytes + 1)
+    if (request.content_length or 0) > max_bytes or len(audio_data) > max_bytes:
+        return jsonify({
+            'success': False,
+            'error': '参数错误',
+            'message': '缓存条目过大'
+        }), 413
+    if not audio_data:
+        return jsonify({
+            'success': False,
+            'error': '参数错误',
+            'message': '缓存内容不能为空'
+        }), 400
+    if not tts_service.cache.put(key, audio_data):
+        return jsonify({
+            'success': False,
+            'error': '服务器内部错误',
+            'message': '写入缓存失败'
+        }), 500
+    return jsonify({'success': True}), 201
+
+
+@app.route('/api/writer/stats', methods=['GET'])
+def get_writer_stats():
+    """获取后台音频写入器统计"""
+    return jsonify({
+        'success': True,
+        'writer': tts_service.audio_writer.get_stats()
+    })
+
+
+@app.route('/api/memory/stats', methods=['GET'])
+def get_memory_stats():
+    """获取内存预算的当前用量和准入统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'memory': memory_budget.get_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取内存预算统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取内存预算统计失败: {e}'
+        }), 500
+
+
+@app.route('/api/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    """获取调度器各优先级类别的队列统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'schedulers': tts_service.get_scheduler_stats(),
+            'deadlines': tts_service.get_deadline_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取调度统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取调度统计失败: {e}'
+        }), 500
+
+
+@app.route('/api/latency/stats', methods=['GET'])
+def get_latency_stats():
+    """获取各模型/音色的上游延迟回归系数"""
+    try:
+        return jsonify({
+            'success': True,
+            'latency': tts_service.get_latency_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取延迟统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取延迟统计失败: {e}'
+        }), 500
+
+
+@app.route('/api/keys/stats', methods=['GET'])
+def get_key_pool_stats():
+    """获取各上游API Key的负载、摘除状态和调用统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'keys': tts_service.get_key_pool_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取API Key统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取API Key统计失败: {e}'
+        }), 500
+
+
+@app.route('/api/packing/stats', methods=['GET'])
+def get_packing_stats():
+    """获取短文本打包统计（合并批次数、节省的上游调用数、切分失败数）"""
+    try:
+        return jsonify({
+            'success': True,
+            'packing': tts_service.get_packing_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取打包统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取打包统计失败: {e}'
+        }), 500
+
+
+@app.route('/api/prefetch/stats', methods=['GET'])
+def get_prefetch_stats():
+    """获取预取统计（命中数、预算丢弃数、内存中的预取结果等）"""
+    try:
+        return jsonify({
+            'success': True,
+            'prefetch': tts_service.prefetcher.get_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取预取统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取预取统计失败: {e}'
+        }), 500
+
+
+# 课文ID的最大长度
+MAX_LESSON_ID_LENGTH = 128
+
+
+@app.route('/api/lessons', methods=['POST'])
+def register_lesson():
+    """
+    登记课文句子顺序，之后合成请求可用 context 指明当前句子，服务端自动预取后续句子
+    
+    请求参数:
+    {
+        "lesson_id": "课文ID",
+        "sentences": ["第一句", "第二句", ...],
+        "voice": "音色 (可选，用于立即预取开头的句子)",
+        "format": "音频格式 (可选)",
+        "sample_rate": "采样率 (可选)",
+        "prefetch_first": "是否立即预取开头的句子 (可选，默认true)"
+    }
+    """
+    try:
+        data = request.get_json()
+        lesson_id = data.get('lesson_id') if data else None
+        sentences = data.get('sentences') if data else None
+        if not lesson_id or not isinstance(sentences, list) or not all(isinstance(s, str) for s in sentences):
+            return jsonify({
+                'success': False,
+                'error': 'lesson_id和sentences(字符串列表)不能为空',
+                'message': '请求参数错误'
+            }), 400
+        
+        # 登记前校验全部参数，避免写入无法使用的课文
+        max_sentences = tts_service.prefetcher.config['max_lesson_sentences']
+        max_length = tts_service.current_config['max_text_length']
+        try:
+            sample_rate = parse_sample_rate(data.get('sample_rate'))
+            if len(str(lesson_id)) > MAX_LESSON_ID_LENGTH:
+                raise ValueError(f'lesson_id不能超过{MAX_LESSON_ID_LENGTH}个字符')
+            if len(sentences) > max_sentences:
+                raise ValueError(f'sentences不能超过{max_sentences}句')
+            if any(len(sentence) > max_length for sentence in sentences):
+                raise ValueError(f'每句不能超过{max_length}个字符')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '请求参数错误'
+            }), 400
+        
+        tts_service.prefetcher.lessons.register(str(lesson_id), sentences)
+        prefetched = 0
+        if data.get('prefetch_first', True):
+            prefetched = tts_service.prefetcher.schedule(
+                sentences, data.get('voice'), data.get('format'), sample_rate
+            )
+        
+        return jsonify({
+            'success': True,
+            'lesson_id': lesson_id,
+            'sentences': len(sentences),
+            'prefetch_scheduled': prefetched
+        })
+    except Exception as e:
+        logger.error(f"登记课文失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '服务器内部错误'
+        }), 500
+
+
+@app.route('/api/lessons/<lesson_id>', methods=['DELETE'])
+def delete_lesson(lesson_id):
+    """删除已登记的课文"""
+    if tts_service.prefetcher.lessons.delete(lesson_id):
+        return jsonify({'success': True, 'lesson_id': lesson_id})
+    return jsonify({
+        'success': False,
+        'error': '课文不存在',
+        'message': f'未找到课文: {lesson_id}'
+    }), 404
+
+
+@app.route('/api/admin/profile', methods=['GET'])
+def admin_profile():
+    """
+    对当前进程进行采样分析
+    
+    查询参数:
+        seconds: 采样时长（1-60秒，默认10）
+        interval_ms: 采样间隔（默认5毫秒）
+        top: 内存分配排行条数（默认20）
+        memory: 是否同时统计tracemalloc（默认true）
+        format: json（默认）或collapsed（直接返回可用于flamegraph.pl的折叠栈文本）
+    """
+    denied = check_admin_token()
+    if denied:
+        return denied
+    try:
+        seconds = min(max(float(request.args.get('seconds', 10)), 1), 60)
+        interval = min(max(float(request.args.get('interval_ms', 5)), 1), 1000) / 1000
+        top = int(request.args.get('top', 20))
+        trace_memory = request.args.get('memory', 'true').lower() == 'true'
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': '参数格式错误',
+            'message': '请求参数错误'
+        }), 400
+    
+    logger.info(f"开始采样分析: {seconds}秒")
+    result = profiler.profile(seconds, interval, top, trace_memory)
+    if result is None:
+        return jsonify({
+            'success': False,
+            'error': '已有分析任务在运行',
+            'message': '请稍后重试'
+        }), 409
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(result['collapsed'] + '\n', mimetype='text/plain')
+    result['inflight'] = request_tracker.snapshot()
+    return jsonify(dict(success=True, **result))
+
+
+@app.route('/api/logging/stats', methods=['GET'])
+def get_logging_stats():
+    """获取日志队列的积压、丢弃和采样统计"""
+    return jsonify({
+        'success': True,
+        'logging': log_pipeline.get_stats()
+    })
+
+
+@app.route('/api/admin/inflight', methods=['GET'])
+def admin_inflight():
+    """在途请求按接口和处理阶段的分布"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    return jsonify({
+        'success': True,
+        'inflight': request_tracker.snapshot()
+    })
+
+
 @app.route('/api/synthesize', methods=['POST'])
 def synthesize_speech():
     """
@@ -128,8 +809,15 @@ def synthesize_speech():
         "speed": "语速 (可选，默认1.0)",
         "volume": "音量 (可选，默认1.0)",
         "pitch": "音调 (可选，默认1.0)",
-        "save_file": "是否保存文件 (可选，默认false)"
+        "save_file": "是否保存文件 (可选，默认false)",
+        "slim": {"trim_silence": true, "sample_rate": 8000, "mono": true} (可选，裁剪静音并降采样),
+        "next_texts": ["接下来可能请求的句子", ...] (可选，在后台低优先级预取),
+        "context": {"lesson_id": "已登记的课文ID", "index": 当前句子序号} (可选，预取课文后续句子),
+        "timeout_ms": 截止时间（可选，也可用X-Timeout-Ms请求头，超过后返回504）
     }
+    
+    请求头 Accept 为 audio/* 或 application/octet-stream 时直接返回音频二进制，
+    合成结果元数据放在 X-TTS-* 响应头中
     """
     try:
         # 获取请求数据
@@ -154,13 +842,35 @@ def synthesize_speech():
         # 获取可选参数
         voice = data.get('voice', 'Jennifer')
         format = data.get('format', 'wav')
-        sample_rate = data.get('sample_rate', 22050)
         speed = data.get('speed', 1.0)
         volume = data.get('volume', 1.0)
         pitch = data.get('pitch', 1.0)
         save_file = data.get('save_file', False)
+        try:
+            sample_rate = parse_sample_rate(data.get('sample_rate', 22050))
+            slim = parse_slim_options(data.get('slim'))
+            deadline = get_request_deadline(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '请求参数错误'
+            }), 400
+        
+        logger.debug("收到语音合成请求: 文本长度=%d, 音色=%s", len(text), voice)
+        
+        recorder.record('synthesize', text, tts_service.current_model, voice, format, sample_rate,
+                        request.headers.get('X-Priority'))
+        
+        limited = check_rate_limit(len(text))
+        if limited:
+            return limited
         
-        logger.info(f"收到语音合成请求: 文本长度={len(text)}, 音色={voice}")
+        binary = wants_binary_audio(format)
+        
+        rejected = admit_request(estimate_memory(len(text), voice, format, sample_rate, binary, bool(slim)), deadline)
+        if rejected:
+            return rejected
         
         # 调用TTS服务
         result = tts_service.synthesize_speech(
@@ -170,21 +880,41 @@ def synthesize_speech():
             sample_rate=sample_rate,
             speed=speed,
             volume=volume,
-            pitch=pitch
+            pitch=pitch,
+            priority=get_request_priority(),
+            return_bytes=binary,
+            slim=slim,
+            deadline=deadline
         )
+        annotate_request_log(result)
+        
+        # 在后台预取接下来可能请求的句子
+        if result['success']:
+            next_texts = data.get('next_texts')
+            if not isinstance(next_texts, list):
+                next_texts = tts_service.prefetcher.next_texts_for(data.get('context'))
+            if next_texts:
+                tts_service.prefetcher.schedule(next_texts, voice, format, sample_rate)
         
         # 如果需要保存文件
         if save_file and result['success']:
             filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{format}"
             filepath = os.path.join(OUTPUT_DIR, filename)
             
-            if tts_service.save_audio_to_file(result['audio_data'], filepath):
+            # 文件名立即返回，音频由后台写入器原子落盘
+            if tts_service.save_audio_async(result['audio'] if binary else result['audio_data'], filepath):
                 result['saved_file'] = filename
                 result['file_path'] = filepath
+                if not slim:
+                    index_saved_file(result, text, filename)
         
         # 返回结果
         if result['success']:
+            if binary:
+                return binary_audio_response(result)
             return jsonify(result)
+        elif result.get('deadline_exceeded'):
+            return deadline_exceeded_response()
         else:
             return jsonify(result), 500
             
@@ -219,12 +949,32 @@ def synthesize_and_download():
         text = data['text']
         voice = data.get('voice', 'Jennifer')
         format = data.get('format', 'wav')
-        sample_rate = data.get('sample_rate', 22050)
         speed = data.get('speed', 1.0)
         volume = data.get('volume', 1.0)
         pitch = data.get('pitch', 1.0)
+        try:
+            sample_rate = parse_sample_rate(data.get('sample_rate', 22050))
+            slim = parse_slim_options(data.get('slim'))
+            deadline = get_request_deadline(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '请求参数错误'
+            }), 400
+        
+        logger.debug("收到语音合成下载请求: 文本长度=%d, 音色=%s", len(text), voice)
+        
+        recorder.record('file', text, tts_service.current_model, voice, format, sample_rate,
+                        request.headers.get('X-Priority'))
         
-        logger.info(f"收到语音合成下载请求: 文本长度={len(text)}, 音色={voice}")
+        limited = check_rate_limit(len(text))
+        if limited:
+            return limited
+        
+        rejected = admit_request(estimate_memory(len(text), voice, format, sample_rate, slim=bool(slim)), deadline)
+        if rejected:
+            return rejected
         
         # 调用TTS服务
         result = tts_service.synthesize_speech(
@@ -234,29 +984,33 @@ def synthesize_and_download():
             sample_rate=sample_rate,
             speed=speed,
             volume=volume,
-            pitch=pitch
+            pitch=pitch,
+            priority=get_request_priority(),
+            slim=slim,
+            deadline=deadline,
+            return_bytes=True
         )
+        annotate_request_log(result)
         
         if result['success']:
             # 生成文件名
-            filename = f"speech_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+            filename = f"speech_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.{format}"
             filepath = os.path.join(OUTPUT_DIR, filename)
             
-            # 保存文件
-            if tts_service.save_audio_to_file(result['audio_data'], filepath):
-                # 返回文件下载
-                return send_file(
-                    filepath,
-                    as_attachment=True,
-                    download_name=filename,
-                    mimetype=f'audio/{format}'
-                )
+            # 保存文件（后台写入），直接从内存返回下载内容；写入队列已满时只跳过保存，不影响本次下载
+            if tts_service.save_audio_async(result['audio'], filepath):
+                if not slim:
+                    index_saved_file(result, text, filename)
             else:
-                return jsonify({
-                    'success': False,
-                    'error': '保存音频文件失败',
-                    'message': '文件保存失败'
-                }), 500
+                logger.warning(f"音频写入队列已满，跳过保存: {filename}")
+            return send_file(
+                io.BytesIO(result['audio']),
+                as_attachment=True,
+                download_name=filename,
+                mimetype=f'audio/{format}'
+            )
+        elif result.get('deadline_exceeded'):
+            return deadline_exceeded_response()
         else:
             return jsonify(result), 500
             
@@ -269,9 +1023,249 @@ def synthesize_and_download():
         }), 500
 
 
+@app.route('/api/synthesize/voices', methods=['POST'])
+def synthesize_voices():
+    """
+    同一段文本按多个音色并发合成（流式）
+    
+    请求参数:
+    {
+        "text": "要转换的文本",
+        "voices": ["音色1", "音色2"] 或 "all" (可选，默认all，即当前模型的全部音色),
+        "format": "音频格式 (可选)",
+        "sample_rate": "采样率 (可选)",
+        "slim": 同 /api/synthesize (可选),
+        "timeout_ms": 截止时间 (可选，也可用X-Timeout-Ms请求头)
+    }
+    
+    响应为JSONL，每个音色合成完成后立即输出一行（含voice字段，失败时success为false），
+    最后一行为汇总 {"summary": true, "succeeded": ..., "failed": ...}
+    """
+    try:
+        data = request.get_json()
+        if not data or not data.get('text'):
+            return jsonify({
+                'success': False,
+                'error': 'text参数不能为空',
+                'message': '请求参数错误'
+            }), 400
+        
+        text = data['text']
+        format = data.get('format')
+        try:
+            sample_rate = parse_sample_rate(data.get('sample_rate'))
+            fanout = VoiceFanout(
+                tts_service, text,
+                voices=data.get('voices', 'all'),
+                format=format,
+                sample_rate=sample_rate,
+                priority=get_request_priority(),
+                deadline=get_request_deadline(data),
+                slim=parse_slim_options(data.get('slim'))
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '请求参数错误'
+            }), 400
+        
+        logger.debug("收到多音色合成请求: 文本长度=%d, 音色数=%d, 并发=%d", len(text), len(fanout.voices), fanout.concurrency)
+        
+        limited = check_rate_limit(len(text) * len(fanout.voices))
+        if limited:
+            return limited
+        
+        # 同时进行中的合成结果同时在内存中
+        rejected = admit_request(fanout.concurrency * estimate_memory(
+            len(text), None, format, sample_rate, slim=bool(fanout.slim)
+        ), fanout.deadline)
+        if rejected:
+            return rejected
+        
+        def generate():
+            for record in fanout.stream():
+                yield json.dumps(record, ensure_ascii=False) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        logger.error(f"多音色合成接口错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '服务器内部错误'
+        }), 500
+
+
+@app.route('/api/download/<filename>', methods=['GET'])
+def download_file(filename):
+    """下载已保存的音频文件，位于冷存储时先解压提升"""
+    if secure_filename(filename) != filename or filename.startswith('.'):
+        return jsonify({
+            'success': False,
+            'error': '文件名无效',
+            'message': '请求参数错误'
+        }), 400
+    try:
+        # 刚提交保存的文件可能仍在后台写入队列中
+        tts_service.audio_writer.wait(os.path.join(OUTPUT_DIR, filename), timeout=5)
+        path = audio_store.resolve(filename)
+        if path is None:
+            return jsonify({
+                'success': False,
+                'error': '文件不存在',
+                'message': f'未找到音频文件: {filename}'
+            }), 404
+        return send_file(os.path.abspath(path), as_attachment=True, download_name=filename)
+    except Exception as e:
+        logger.error(f"下载音频文件失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '服务器内部错误'
+        }), 500
+
+
+@app.route('/api/storage/stats', methods=['GET'])
+def get_storage_stats():
+    """获取音频文件分层存储和内容索引统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'storage': audio_store.get_stats(),
+            'index': output_index.get_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取存储统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取存储统计失败: {e}'
+        }), 500
+
+
+@app.route('/api/compose', methods=['POST'])
+def compose_lesson():
+    """
+    合成整条课文音轨，以单个WAV流式返回
+    
+    请求参数:
+    {
+        "segments": [
+            {"text": "第一句", "pause_ms": 800},
+            {"pause_ms": 2000},
+            {"text": "第二句", "voice": "音色 (可选)"}
+        ],
+        "voice": "默认音色 (可选)",
+        "sample_rate": "采样率 (可选)",
+        "lookahead": "同时合成的片段数 (可选，默认4)",
+        "save_file": "是否同时保存到服务器 (可选，默认false)"
+    }
+    
+    片段并发合成、按顺序输出，内存占用与课文长度无关。流式返回的WAV头中RIFF/data大小为占位值，
+    保存到服务器的文件在合成结束后回填实际大小
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': '请求数据不能为空',
+                'message': '请求参数错误'
+            }), 400
+        
+        try:
+            composer = LessonComposer(
+                tts_service,
+                data.get('segments'),
+                voice=data.get('voice'),
+                sample_rate=parse_sample_rate(data.get('sample_rate')),
+                priority=get_request_priority(),
+                lookahead=min(int(data.get('lookahead', 4)), 8)
+            )
+        except (ValueError, TypeError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '请求参数错误'
+            }), 400
+        
+        logger.debug("收到课文音轨合成请求: 片段数=%d, 文本长度=%d", len(composer.plan), composer.text_length)
+        
+        limited = check_rate_limit(composer.text_length)
+        if limited:
+            return limited
+        
+        # 预读窗口内的片段同时在内存中
+        text_params = [params for kind, params in composer.plan if kind == 'text']
+        rejected = admit_request(composer.lookahead * memory_budget.estimate(
+            max(len(params['text']) for params in text_params), text_params[0]['sample_rate'], 'wav', binary=True
+        ))
+        if rejected:
+            return rejected
+        
+        # 第一个片段合成完成后才开始响应，失败时仍可返回错误状态码
+        chunks = composer.stream()
+        try:
+            header = next(chunks)
+        except ComposeError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '课文音轨合成失败'
+            }), 500
+        
+        def body():
+            yield header
+            yield from chunks
+        
+        audio = body()
+        headers = {
+            'X-TTS-Segments': str(sum(1 for kind, _ in composer.plan if kind == 'text')),
+            'X-TTS-Text-Length': str(composer.text_length),
+            'X-TTS-Estimated-Cost': str(composer.estimate_cost())
+        }
+        if data.get('save_file', False):
+            filename = f"lesson_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.wav"
+            audio = tee_to_file(audio, os.path.join(OUTPUT_DIR, filename))
+            headers['X-TTS-Saved-File'] = filename
+        
+        def generate():
+            try:
+                yield from audio
+            except ComposeError as e:
+                # 响应已开始，只能中断音频流
+                logger.error(f"课文音轨合成中断: {e}")
+        
+        return Response(stream_with_context(generate()), mimetype='audio/wav', headers=headers)
+        
+    except Exception as e:
+        logger.error(f"课文音轨合成接口错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '服务器内部错误'
+        }), 500
+
+
+@sock.route('/api/ws/synthesize')
+def synthesize_duplex(ws):
+    """
+    WebSocket双工语音合成接口
+    
+    客户端保持一个连接，持续推送 {"type": "synthesize", "id": "...", "text": "..."}，
+    服务端将音频分片以带id标记的二进制帧流式返回，协议详见 duplex_session.py
+    """
+    tenant_id = get_tenant_id()
+    DuplexSynthesisSession(
+        ws, tts_service,
+        check_limit=lambda chars: rate_limiter.check(tenant_id, chars)
+    ).serve()
+
+
 @app.route('/api/cost', methods=['POST'])
 def calculate_cost():
-    """计算文本转语音成本"""
+    """计算文本转语音成本，并按实际上游延迟预测耗时和音频大小（可选voice、format、sample_rate）"""
     try:
         data = request.get_json()
         
@@ -283,13 +1277,23 @@ def calculate_cost():
             }), 400
         
         text = data['text']
+        try:
+            sample_rate = parse_sample_rate(data.get('sample_rate'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '请求参数错误'
+            }), 400
         cost = tts_service.calculate_cost(text)
+        prediction = tts_service.predict(text, data.get('voice'), data.get('format'), sample_rate)
         
         return jsonify({
             'success': True,
             'text_length': len(text),
             'cost': cost,
             'currency': 'CNY',
+            'prediction': prediction,
             'message': '成本计算成功'
         })
         
@@ -302,6 +1306,23 @@ def calculate_cost():
         }), 500
 
 
+@app.route('/api/cost/bulk', methods=['POST'])
+def calculate_cost_bulk():
+    """
+    批量计算成本（流式）
+    
+    请求体为JSONL，每行一个对象 {"text": "...", "id": "可选", "voice": "可选"}；
+    响应为JSONL，逐行返回所有模型的估算结果，最后一行为汇总
+    """
+    estimator = BulkCostEstimator(tts_service)
+    
+    def generate():
+        for record in estimator.estimate(request.stream):
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.errorhandler(404)
 def not_found(error):
     """404错误处理"""
@@ -328,5 +1349,8 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'True').lower() == 'true'
     
+    # SIGTERM默认直接结束进程，不执行atexit中的收尾（后台写入、请求日志、音频文件索引快照），改为正常退出
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     logger.info(f"启动TTS服务: {host}:{port}")
     app.run(host=host, port=port, debug=debug)
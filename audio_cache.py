@@ -0,0 +1,231 @@
+"""
+跨进程共享的语音合成缓存
+基于SQLite(WAL模式)索引 + 内容寻址的音频文件目录，同一主机上的多个工作进程可安全读写
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+# 命中后刷新访问时间的最小间隔（秒），避免每次命中都产生写事务
+ACCESS_UPDATE_INTERVAL = 60
+
+
+def make_cache_key(model: str, voice: str, format: str, sample_rate: int, text: str) -> str:
+    """根据合成参数生成缓存键"""
+    payload = json.dumps([model, voice, format, int(sample_rate), text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SharedAudioCache:
+    """共享音频缓存 - 支持原子写入、按字节配额LRU淘汰、重启后保留"""
+
+    def __init__(self, cache_dir: str = 'tts_cache', max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.db_path = os.path.join(cache_dir, 'index.db')
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._init_db()
+
+    @classmethod
+    def from_env(cls) -> Optional['SharedAudioCache']:
+        """根据环境变量创建缓存实例，未启用时返回None"""
+        if os.getenv('TTS_CACHE_ENABLED', 'True').lower() != 'true':
+            return None
+        cache_dir = os.getenv('TTS_CACHE_DIR', 'tts_cache')
+        max_bytes = int(float(os.getenv('TTS_CACHE_MAX_MB', 1024)) * 1024 * 1024)
+        return cls(cache_dir=cache_dir, max_bytes=max_bytes)
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """创建索引表"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'digest TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, digest TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries(digest)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_accessed ON blobs(accessed_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('total_bytes', 0)")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _blob_path(self, digest: str) -> str:
+        """内容寻址的文件路径"""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取缓存的音频数据，未命中返回None"""
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT e.digest, b.accessed_at FROM entries e JOIN blobs b ON b.digest = e.digest '
+                'WHERE e.key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            digest, accessed_at = row
+            try:
+                with open(self._blob_path(digest), 'rb') as f:
+                    audio_data = f.read()
+            except FileNotFoundError:
+                self._drop_missing_blob(conn, digest)
+                return None
+
+            now = time.time()
+            if now - accessed_at > ACCESS_UPDATE_INTERVAL:
+                conn.execute('UPDATE blobs SET accessed_at = ? WHERE digest = ?', (now, digest))
+            return audio_data
+        except sqlite3.Error as e:
+            logger.error(f"读取缓存失败: {e}")
+            return None
+
+    def _drop_missing_blob(self, conn: sqlite3.Connection, digest: str):
+        """
+        文件已丢失时在同一事务中删除指向它的所有索引和blobs记录，并从总字节数中扣除
+
+        事务内再次确认文件不存在，避免删掉其他进程刚重新写入的文件的索引
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT size FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if row is not None and not os.path.exists(self._blob_path(digest)):
+                conn.execute('DELETE FROM entries WHERE digest = ?', (digest,))
+                conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                conn.execute("UPDATE meta SET value = value - ? WHERE name = 'total_bytes'", (row[0],))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def contains(self, key: str) -> bool:
+        """检查缓存中是否存在指定键（不读取音频数据）"""
+        try:
+            row = self._connect().execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logger.error(f"查询缓存失败: {e}")
+            return False
+
+    def put(self, key: str, audio_data: bytes) -> bool:
+        """原子写入缓存：先写临时文件再重命名，然后在事务中登记索引"""
+        digest = hashlib.sha256(audio_data).hexdigest()
+        blob_path = self._blob_path(digest)
+        size = len(audio_data)
+
+        try:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), prefix='.tmp-')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(audio_data)
+                    os.replace(tmp_path, blob_path)
+                except Exception:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+
+            conn = self._connect()
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO blobs (digest, size, accessed_at) VALUES (?, ?, ?)',
+                    (digest, size, now)
+                )
+                if cursor.rowcount:
+                    conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (size,))
+                else:
+                    conn.execute('UPDATE blobs SET accessed_at = ? WHERE digest = ?', (now, digest))
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries (key, digest, created_at) VALUES (?, ?, ?)',
+                    (key, digest, now)
+                )
+                evicted = self._evict(conn)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            # 事务提交后再删除文件，保证索引中不会出现指向已删除文件的记录
+            for old_digest in evicted:
+                try:
+                    os.unlink(self._blob_path(old_digest))
+                except FileNotFoundError:
+                    pass
+            return True
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"写入缓存失败: {e}")
+            return False
+
+    def _evict(self, conn: sqlite3.Connection) -> List[str]:
+        """按最近访问时间淘汰，直到总字节数不超过配额（需在事务内调用）"""
+        total = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+
+        while total > self.max_bytes:
+            rows = conn.execute(
+                'SELECT digest, size FROM blobs ORDER BY accessed_at LIMIT 64'
+            ).fetchall()
+            if not rows:
+                break
+            for digest, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM entries WHERE digest = ?', (digest,))
+                conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                total -= size
+                evicted.append(digest)
+
+        conn.execute("UPDATE meta SET value = ? WHERE name = 'total_bytes'", (total,))
+        return evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        conn = self._connect()
+        total = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+        entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        blobs = conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+        return {
+            'cache_dir': self.cache_dir,
+            'entries': entries,
+            'blobs': blobs,
+            'total_bytes': total,
+            'max_bytes': self.max_bytes
+        }
@@ -0,0 +1,167 @@
+"""
+音频瘦身
+对上游返回的WAV做可选的后处理：按短时能量裁掉首尾静音、多声道混为单声道、
+降采样到客户端需要的最低采样率，并报告节省的字节数。非PCM WAV（如mp3）原样返回
+"""
+
+import io
+import wave
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MIN_SAMPLE_RATE = 8000
+# 能量检测的帧长
+FRAME_MS = 10
+# 降采样低通滤波器的阶数
+FILTER_TAPS = 63
+
+_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def parse_slim_options(options: Any) -> Optional[Dict[str, Any]]:
+    """
+    校验请求中的slim参数，未指定时返回None，参数错误时抛出ValueError
+
+    {"trim_silence": true, "sample_rate": 16000, "mono": true, "threshold_db": -40, "padding_ms": 50}
+    """
+    if options is None or options is False:
+        return None
+    if options is True:
+        options = {'trim_silence': True}
+    if not isinstance(options, dict):
+        raise ValueError('slim参数必须是对象')
+
+    sample_rate = options.get('sample_rate')
+    if sample_rate is not None and (not isinstance(sample_rate, int) or sample_rate < MIN_SAMPLE_RATE):
+        raise ValueError(f'slim.sample_rate必须是不小于{MIN_SAMPLE_RATE}的整数')
+    threshold_db = options.get('threshold_db', -40)
+    padding_ms = options.get('padding_ms', 50)
+    if not isinstance(threshold_db, (int, float)) or not -90 <= threshold_db <= 0:
+        raise ValueError('slim.threshold_db必须在-90到0之间')
+    if not isinstance(padding_ms, (int, float)) or not 0 <= padding_ms <= 1000:
+        raise ValueError('slim.padding_ms必须在0到1000之间')
+
+    return {
+        'trim_silence': bool(options.get('trim_silence', False)),
+        'sample_rate': sample_rate,
+        'mono': bool(options.get('mono', False)),
+        'threshold_db': float(threshold_db),
+        'padding_ms': float(padding_ms)
+    }
+
+
+def _read_wav(audio: bytes) -> Optional[Tuple[np.ndarray, int, int]]:
+    """解析PCM WAV为 (float32样本[帧数, 声道数]，采样率，采样位宽)，不是可处理的WAV时返回None"""
+    try:
+        with wave.open(io.BytesIO(audio), 'rb') as wav:
+            channels, sample_width, sample_rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    dtype = _DTYPES.get(sample_width)
+    if dtype is None:
+        return None
+
+    samples = np.frombuffer(frames, dtype=dtype)
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).astype(np.float32)
+    if sample_width == 1:
+        samples = (samples - 128.0) / 128.0
+    else:
+        samples /= float(2 ** (8 * sample_width - 1))
+    return samples, sample_rate, sample_width
+
+
+def _write_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """把float32样本写为16位PCM WAV"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def _trim_bounds(samples: np.ndarray, sample_rate: int, threshold_db: float, padding_ms: float) -> Tuple[int, int]:
+    """按帧RMS能量找出第一个和最后一个有声帧，返回保留的样本区间；没有有声帧时不裁剪"""
+    frame = max(1, sample_rate * FRAME_MS // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return 0, len(samples)
+
+    energy = np.square(samples[:count * frame]).mean(axis=1).reshape(count, frame).mean(axis=1)
+    voiced = np.flatnonzero(energy > 10 ** (threshold_db / 10))
+    if len(voiced) == 0:
+        return 0, len(samples)
+
+    padding = int(sample_rate * padding_ms / 1000)
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return start, end
+
+
+def _resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """降采样：先用加窗sinc低通滤波抗混叠，再线性插值到目标采样率"""
+    cutoff = 0.45 * target_rate / source_rate
+    taps = np.arange(FILTER_TAPS) - (FILTER_TAPS - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(FILTER_TAPS)
+    kernel /= kernel.sum()
+
+    length = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(length) * (source_rate / target_rate)
+    source_positions = np.arange(len(samples))
+    channels = [
+        np.interp(positions, source_positions, np.convolve(samples[:, channel], kernel, mode='same'))
+        for channel in range(samples.shape[1])
+    ]
+    return np.stack(channels, axis=1).astype(np.float32)
+
+
+def slim_audio(audio: bytes, options: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    按选项处理音频
+
+    Args:
+        audio: 上游返回的音频
+        options: parse_slim_options 返回的选项
+
+    Returns:
+        (处理后的音频, {"original_bytes", "bytes", "bytes_saved", "trimmed_ms", "sample_rate", "channels"})，
+        无法处理的格式原样返回，sample_rate和channels为None
+    """
+    info = {'original_bytes': len(audio), 'bytes': len(audio), 'bytes_saved': 0,
+            'trimmed_ms': 0, 'sample_rate': None, 'channels': None}
+    parsed = _read_wav(audio)
+    if parsed is None:
+        return audio, info
+    samples, sample_rate, _ = parsed
+
+    if options['trim_silence']:
+        start, end = _trim_bounds(samples, sample_rate, options['threshold_db'], options['padding_ms'])
+        info['trimmed_ms'] = round((len(samples) - (end - start)) * 1000 / sample_rate)
+        samples = samples[start:end]
+    if options['mono'] and samples.shape[1] > 1:
+        samples = samples.mean(axis=1, keepdims=True)
+    target_rate = options['sample_rate']
+    # 短于滤波器长度的片段无法滤波，不降采样
+    if target_rate and target_rate < sample_rate and len(samples) >= FILTER_TAPS:
+        samples = _resample(samples, sample_rate, target_rate)
+        sample_rate = target_rate
+
+    slimmed = _write_wav(samples, sample_rate)
+    # 处理后反而更大（如原始为8位PCM）时保留原始音频
+    if len(slimmed) >= len(audio):
+        return audio, dict(info, sample_rate=parsed[1], channels=parsed[0].shape[1], trimmed_ms=0)
+
+    info.update({
+        'bytes': len(slimmed),
+        'bytes_saved': len(audio) - len(slimmed),
+        'sample_rate': sample_rate,
+        'channels': samples.shape[1]
+    })
+    return slimmed, info
@@ -0,0 +1,200 @@
+"""
+后台音频写入器
+在请求线程之外持久化音频文件：先写临时文件再原子重命名，按批次执行fsync，
+写入队列满时对调用方施加背压
+"""
+
+import os
+import queue
+import atexit
+import base64
+import logging
+import threading
+from typing import Optional, Union, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _tmp_path(path: str) -> str:
+    """同目录下的临时文件路径（同一文件系统内重命名才是原子的）"""
+    return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+
+
+def write_file_atomic(path: str, data: bytes, fsync: bool = True):
+    """原子写入文件：写入临时文件后重命名，崩溃时不会留下截断的文件"""
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def fsync_directory(directory: str):
+    """同步目录项，确保重命名在断电后依然有效"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AudioWriter:
+    """有界队列 + 单个后台线程的音频写入器"""
+
+    def __init__(self, max_queue: int = 256, batch_size: int = 32, put_timeout: float = 2.0):
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.written_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self._thread = threading.Thread(target=self._run, name='audio-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> 'AudioWriter':
+        """根据环境变量创建写入器"""
+        return cls(
+            max_queue=int(os.getenv('TTS_WRITER_QUEUE_SIZE', 256)),
+            batch_size=int(os.getenv('TTS_WRITER_BATCH_SIZE', 32)),
+            put_timeout=float(os.getenv('TTS_WRITER_PUT_TIMEOUT', 2.0))
+        )
+
+    def submit(self, path: str, data: Union[bytes, str], is_base64: bool = False) -> bool:
+        """
+        提交写入任务，文件名在提交时即被占用
+
+        队列满时最多阻塞put_timeout秒，仍无法入队则返回False
+        """
+        done = threading.Event()
+        with self._lock:
+            self._pending[path] = done
+        try:
+            self._queue.put((path, data, is_base64, done), timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(path, None)
+                self.rejected_total += 1
+            logger.error(f"音频写入队列已满，放弃保存: {path}")
+            return False
+
+    def is_pending(self, path: str) -> bool:
+        """文件是否已提交但尚未落盘"""
+        with self._lock:
+            return path in self._pending
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> bool:
+        """等待指定文件写入完成，文件不在队列中时立即返回"""
+        with self._lock:
+            done = self._pending.get(path)
+        if done is None:
+            return True
+        return done.wait(timeout)
+
+    def _run(self):
+        """后台线程：每次取出一批任务，全部写完后统一同步目录"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write_batch(batch)
+            if stop:
+                break
+
+    def _write_batch(self, batch: List[Tuple[str, Union[bytes, str], bool, threading.Event]]):
+        """写入一批文件：先全部写入临时文件，再集中fsync并重命名，目录fsync按批次合并"""
+        written = []
+        for path, data, is_base64, _ in batch:
+            tmp_path = _tmp_path(path)
+            try:
+                if is_base64:
+                    data = base64.b64decode(data)
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                written.append((path, tmp_path))
+            except Exception as e:
+                self._discard(tmp_path)
+                self.failed_total += 1
+                logger.error(f"保存音频文件失败: {path}, {e}")
+
+        directories = set()
+        for path, tmp_path in written:
+            try:
+                fd = os.open(tmp_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.replace(tmp_path, path)
+                directories.add(os.path.dirname(path))
+                self.written_total += 1
+                logger.debug("音频文件已保存: %s", path)
+            except Exception as e:
+                self._discard(tmp_path)
+                self.failed_total += 1
+                logger.error(f"保存音频文件失败: {path}, {e}")
+
+        for directory in directories:
+            fsync_directory(directory)
+
+        with self._lock:
+            for path, _, _, done in batch:
+                self._pending.pop(path, None)
+                done.set()
+
+    @staticmethod
+    def _discard(tmp_path: str):
+        """清理写入失败的临时文件"""
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+    def close(self, timeout: float = 10.0):
+        """停止写入线程，等待队列中的任务写完"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error("音频写入队列已满，无法正常停止写入线程")
+            return
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取写入统计"""
+        return {
+            'queued': self._queue.qsize(),
+            'pending': len(self._pending),
+            'written_total': self.written_total,
+            'failed_total': self.failed_total,
+            'rejected_total': self.rejected_total
+        }
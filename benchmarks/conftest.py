@@ -0,0 +1,137 @@
+"""
+性能基准测试配置
+使用本地替身上游（零延迟）测量服务自身在上游之外增加的开销，
+结果与 benchmarks/baseline.json 中的基线比较，变慢超过阈值时测试失败
+
+环境变量:
+    TTS_BENCH_THRESHOLD  允许的变慢比例（默认0.25，即25%）
+    TTS_BENCH_ROUNDS     每项测量的轮数（默认7，取最快一轮）
+    TTS_BENCH_SAVE       设为true时把本次结果写入基线文件
+
+基线与机器相关，不纳入版本库；没有基线时只报告结果
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import statistics
+
+import pytest
+
+# 服务模块位于仓库根目录，直接运行 pytest benchmarks 时根目录不在导入路径中
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# 必须在导入服务模块之前设置：替身上游、独立的临时缓存和共享内存文件、关闭限流和探测
+_TMP_DIR = tempfile.mkdtemp(prefix='tts-bench-')
+if not os.getenv('DASHSCOPE_API_KEY'):
+    os.environ['DASHSCOPE_API_KEY'] = 'benchmark'
+os.environ.update({
+    'TTS_UPSTREAM': 'stub',
+    'TTS_STUB_FIRST_PACKET_MS': '0',
+    'TTS_STUB_MS_PER_CHAR': '0',
+    'TTS_STUB_ERROR_RATE': '0',
+    'TTS_CACHE_ENABLED': 'false',
+    'TTS_CACHE_DIR': _TMP_DIR,
+    'TTS_RATE_LIMIT_ENABLED': 'false',
+    'TTS_RATE_LIMIT_FILE': os.path.join(_TMP_DIR, 'ratelimit'),
+    'TTS_KEY_POOL_FILE': os.path.join(_TMP_DIR, 'keypool'),
+    'TTS_PROBE_INTERVAL': '0'
+})
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+THRESHOLD = float(os.getenv('TTS_BENCH_THRESHOLD', 0.25))
+ROUNDS = int(os.getenv('TTS_BENCH_ROUNDS', 7))
+# 每轮的最短时长，单次调用太快时自动增加每轮的调用次数
+MIN_ROUND_SECONDS = 0.01
+
+_results = {}
+
+
+def _load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+_baseline = _load_baseline()
+
+
+class Benchmark:
+    """测量函数的单次调用耗时，并与基线比较"""
+
+    def __call__(self, name: str, func, *args, **kwargs):
+        # 计时期间关闭INFO日志，避免pytest日志捕获的开销计入结果
+        logging.disable(logging.INFO)
+        try:
+            func(*args, **kwargs)
+            number = 1
+            while True:
+                elapsed = self._run(number, func, args, kwargs)
+                if elapsed >= MIN_ROUND_SECONDS or number >= 1 << 20:
+                    break
+                number *= 2
+            timings = [elapsed / number] + [self._run(number, func, args, kwargs) / number for _ in range(ROUNDS - 1)]
+        finally:
+            logging.disable(logging.NOTSET)
+
+        result = {'min': min(timings), 'median': statistics.median(timings), 'number': number}
+        _results[name] = result
+
+        baseline = _baseline.get(name)
+        if baseline and result['min'] > baseline['min'] * (1 + THRESHOLD):
+            pytest.fail(
+                f"{name} 变慢: {result['min'] * 1e6:.1f}us，基线 {baseline['min'] * 1e6:.1f}us，"
+                f"超过阈值 {THRESHOLD:.0%}"
+            )
+        return result
+
+    @staticmethod
+    def _run(number, func, args, kwargs) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args, **kwargs)
+        return time.perf_counter() - start
+
+
+@pytest.fixture
+def benchmark():
+    return Benchmark()
+
+
+@pytest.fixture(scope='session')
+def service():
+    from tts_service import tts_service
+    # 上游Key的每秒请求数额度不属于服务自身开销
+    tts_service.key_pool.rate_limit_enabled = False
+    return tts_service
+
+
+@pytest.fixture(scope='session')
+def client(service):
+    from app import app
+    return app.test_client()
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section('TTS服务基准')
+    for name, result in sorted(_results.items()):
+        line = f"{name:<40} {result['min'] * 1e6:>10.1f}us  (中位数 {result['median'] * 1e6:.1f}us)"
+        baseline = _baseline.get(name)
+        if baseline:
+            line += f"  基线 {baseline['min'] * 1e6:.1f}us  {result['min'] / baseline['min'] - 1:+.1%}"
+        terminalreporter.write_line(line)
+
+
+def pytest_sessionfinish(session):
+    if _results and os.getenv('TTS_BENCH_SAVE', 'false').lower() == 'true':
+        baseline = dict(_baseline, **_results)
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,79 @@
+"""
+TTSService热点路径和Flask接口的基准测试
+"""
+
+import os
+import base64
+
+SENTENCE = "The quick brown fox jumps over the lazy dog near the riverbank."
+PARAGRAPH = " ".join([SENTENCE] * 8)
+
+
+def _voice(service):
+    return next(iter(service.current_config['voices']))
+
+
+def test_validate_text(benchmark, service):
+    benchmark('validate_text', service.validate_text, SENTENCE)
+
+
+def test_calculate_cost(benchmark, service):
+    benchmark('calculate_cost', service.calculate_cost, PARAGRAPH)
+
+
+def test_resolve_and_build_params(benchmark, service):
+    voice = _voice(service)
+
+    def build():
+        params = service._resolve_params(SENTENCE, voice, None, None)
+        service._build_api_params(params['model'], params['text'], params['voice'],
+                                  params['format'], params['sample_rate'])
+
+    benchmark('synthesize.build_params', build)
+
+
+def test_build_result_base64(benchmark, service):
+    params = service._resolve_params(PARAGRAPH, _voice(service), None, None)
+    audio = service._synthesize_audio(params)['audio']
+    benchmark('synthesize.build_result_base64', service._build_result, audio, 0.0, params)
+
+
+def test_synthesize_speech(benchmark, service):
+    result = benchmark('synthesize_speech', service.synthesize_speech, SENTENCE, _voice(service))
+    assert result['min'] > 0
+
+
+def test_synthesize_speech_bytes(benchmark, service):
+    benchmark('synthesize_speech.return_bytes', service.synthesize_speech, SENTENCE, _voice(service),
+              return_bytes=True)
+
+
+def test_save_audio_to_file(benchmark, service, tmp_path):
+    params = service._resolve_params(SENTENCE, _voice(service), None, None)
+    audio_base64 = base64.b64encode(service._synthesize_audio(params)['audio']).decode('utf-8')
+    path = os.path.join(tmp_path, 'bench.wav')
+    benchmark('save_audio_to_file', service.save_audio_to_file, audio_base64, path)
+    assert os.path.getsize(path) > 0
+
+
+def test_handler_health(benchmark, client):
+    benchmark('handler.health', client.get, '/api/health')
+
+
+def test_handler_cost(benchmark, client):
+    benchmark('handler.cost', client.post, '/api/cost', json={'text': PARAGRAPH})
+
+
+def test_handler_synthesize_json(benchmark, client, service):
+    payload = {'text': SENTENCE, 'voice': _voice(service)}
+    response = client.post('/api/synthesize', json=payload)
+    assert response.status_code == 200, response.get_json()
+    benchmark('handler.synthesize_json', client.post, '/api/synthesize', json=payload)
+
+
+def test_handler_synthesize_binary(benchmark, client, service):
+    payload = {'text': SENTENCE, 'voice': _voice(service)}
+    headers = {'Accept': 'audio/wav'}
+    response = client.post('/api/synthesize', json=payload, headers=headers)
+    assert response.status_code == 200
+    benchmark('handler.synthesize_binary', client.post, '/api/synthesize', json=payload, headers=headers)
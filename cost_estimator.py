@@ -0,0 +1,161 @@
+"""
+批量成本估算
+逐行读取JSONL文本，针对所有已配置模型流式输出逐行估算和汇总结果
+已缓存或在本次上传中重复的文本计为零成本，超过模型文本长度上限的行不计费，
+去重记录存放在临时SQLite中，内存占用恒定
+"""
+
+import json
+import logging
+import sqlite3
+from typing import Iterable, Iterator, Dict, Any, Optional
+
+from audio_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# 每累计多少行提交一次去重表事务
+COMMIT_INTERVAL = 1000
+
+
+class BulkCostEstimator:
+    """批量成本估算器"""
+
+    def __init__(self, tts_service):
+        self.tts_service = tts_service
+        self.models = tts_service.model_configs['models']
+
+    def _open_seen_table(self) -> sqlite3.Connection:
+        """创建临时去重表（空文件名为SQLite私有临时库，超出页缓存后落盘）"""
+        conn = sqlite3.connect('')
+        conn.execute('PRAGMA cache_size=-8192')
+        conn.execute('CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+        return conn
+
+    def _parse_row(self, line: bytes) -> Optional[Dict[str, Any]]:
+        """解析一行JSONL，支持对象或纯字符串"""
+        line = line.strip()
+        if not line:
+            return None
+        row = json.loads(line)
+        if isinstance(row, str):
+            row = {'text': row}
+        if not isinstance(row, dict) or not isinstance(row.get('text'), str) or not row['text']:
+            raise ValueError('text参数不能为空')
+        for field in ('voice', 'format'):
+            if row.get(field) is not None and not isinstance(row[field], str):
+                raise ValueError(f'{field}必须是字符串')
+        sample_rate = row.get('sample_rate')
+        if sample_rate is not None:
+            try:
+                if isinstance(sample_rate, bool):
+                    raise ValueError
+                row['sample_rate'] = int(sample_rate)
+            except (TypeError, ValueError):
+                raise ValueError('sample_rate必须是整数')
+        return row
+
+    @staticmethod
+    def _resolve(row: Dict[str, Any], field: str, default: Any) -> Any:
+        """与合成接口一致，未指定的参数使用模型默认值"""
+        return default if row.get(field) is None else row[field]
+
+    def estimate(self, lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+        """逐行估算成本，最后输出一条汇总记录"""
+        seen = self._open_seen_table()
+        cache = self.tts_service.cache
+        totals = {
+            model_name: {
+                'cost': 0.0,
+                'billable_chars': 0,
+                'cached_rows': 0,
+                'duplicate_rows': 0,
+                'oversized_rows': 0
+            }
+            for model_name in self.models
+        }
+        row_count = 0
+        error_count = 0
+        total_chars = 0
+
+        try:
+            for line_no, line in enumerate(lines, 1):
+                try:
+                    row = self._parse_row(line)
+                except ValueError as e:
+                    error_count += 1
+                    yield {'line': line_no, 'success': False, 'error': str(e)}
+                    continue
+                if row is None:
+                    continue
+
+                row_count += 1
+                text = row['text']
+                total_chars += len(text)
+
+                estimates = {}
+                for model_name, config in self.models.items():
+                    model_total = totals[model_name]
+                    cost = self.tts_service.calculate_cost(text, model_name)
+                    duplicate = cached = False
+                    # 超长文本会被合成接口拒绝，不计费也不参与去重
+                    oversized = len(text) > config['max_text_length']
+                    if oversized:
+                        model_total['oversized_rows'] += 1
+                        cost = 0.0
+                    else:
+                        # 按补全默认值后的合成缓存键去重，与缓存命中判断一致
+                        cache_key = make_cache_key(
+                            model_name,
+                            self._resolve(row, 'voice', config['default_voice']),
+                            self._resolve(row, 'format', config['default_format']),
+                            self._resolve(row, 'sample_rate', config['default_sample_rate']),
+                            text
+                        )
+                        duplicate = seen.execute(
+                            'INSERT OR IGNORE INTO seen (digest) VALUES (?)', (bytes.fromhex(cache_key)[:16],)
+                        ).rowcount == 0
+                        if not duplicate and cache:
+                            cached = cache.contains(cache_key)
+                        if duplicate:
+                            model_total['duplicate_rows'] += 1
+                            cost = 0.0
+                        elif cached:
+                            model_total['cached_rows'] += 1
+                            cost = 0.0
+                        else:
+                            model_total['billable_chars'] += len(text)
+
+                    estimates[model_name] = {
+                        'cost': cost,
+                        'cached': cached,
+                        'duplicate': duplicate,
+                        'oversized': oversized
+                    }
+                if row_count % COMMIT_INTERVAL == 0:
+                    seen.commit()
+
+                yield {
+                    'line': line_no,
+                    'id': row.get('id'),
+                    'success': True,
+                    'text_length': len(text),
+                    'duplicate': all(estimate['duplicate'] for estimate in estimates.values()),
+                    'estimates': estimates
+                }
+        finally:
+            seen.close()
+
+        # 汇总成本按计费字符总数计算，避免逐行四舍五入的累积误差
+        for model_name, model_total in totals.items():
+            price_per_10k = self.models[model_name]['price_per_10k_chars']
+            model_total['cost'] = round(model_total['billable_chars'] / 10000 * price_per_10k, 4)
+
+        yield {
+            'summary': True,
+            'rows': row_count,
+            'errors': error_count,
+            'total_chars': total_chars,
+            'currency': 'CNY',
+            'models': totals
+        }
@@ -0,0 +1,41 @@
+"""
+请求截止时间
+客户端通过X-Timeout-Ms请求头或timeout_ms字段给出等待上限，换算为单调时钟上的截止时间，
+随合成参数传递到内存准入、调度排队和上游调用各环节
+"""
+
+import time
+from typing import Any, Optional
+
+# 允许的最长等待时间（毫秒）
+MAX_TIMEOUT_MS = 600000
+
+
+def parse_timeout_ms(value: Any) -> Optional[float]:
+    """
+    把超时毫秒数换算为截止时间（time.monotonic），未指定时返回None
+
+    Raises:
+        ValueError: 不是1到MAX_TIMEOUT_MS之间的数值
+    """
+    if value is None or value == '':
+        return None
+    try:
+        timeout_ms = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('timeout_ms必须是数值')
+    if isinstance(value, bool) or not 1 <= timeout_ms <= MAX_TIMEOUT_MS:
+        raise ValueError(f'timeout_ms必须在1到{MAX_TIMEOUT_MS}之间')
+    return time.monotonic() + timeout_ms / 1000
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """距截止时间的剩余秒数（不小于0），没有截止时间时返回None"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired(deadline: Optional[float]) -> bool:
+    """是否已超过截止时间"""
+    return deadline is not None and time.monotonic() >= deadline
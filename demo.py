@@ -3,78 +3,8 @@
 演示如何使用TTS服务进行英文文本转语音
 """
 
-import requests
 import json
-import base64
-import os
-from datetime import datetime
-
-
-class TTSClient:
-    """TTS客户端类"""
-    
-    def __init__(self, base_url="http://localhost:5000"):
-        self.base_url = base_url
-    
-    def health_check(self):
-        """健康检查"""
-        try:
-            response = requests.get(f"{self.base_url}/api/health")
-            return response.json()
-        except Exception as e:
-            return {"error": str(e)}
-    
-    def get_voices(self):
-        """获取可用音色"""
-        try:
-            response = requests.get(f"{self.base_url}/api/voices")
-            return response.json()
-        except Exception as e:
-            return {"error": str(e)}
-    
-    def synthesize(self, text, voice="Jennifer", format="wav", save_file=False):
-        """语音合成"""
-        try:
-            data = {
-                "text": text,
-                "voice": voice,
-                "format": format,
-                "save_file": save_file
-            }
-            response = requests.post(f"{self.base_url}/api/synthesize", json=data)
-            return response.json()
-        except Exception as e:
-            return {"error": str(e)}
-    
-    def synthesize_and_download(self, text, voice="Jennifer", format="wav"):
-        """语音合成并下载文件"""
-        try:
-            data = {
-                "text": text,
-                "voice": voice,
-                "format": format
-            }
-            response = requests.post(f"{self.base_url}/api/synthesize/file", json=data)
-            
-            if response.headers.get('content-type', '').startswith('audio/'):
-                # 保存下载的文件
-                filename = f"downloaded_speech_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                return {"success": True, "filename": filename}
-            else:
-                return response.json()
-        except Exception as e:
-            return {"error": str(e)}
-    
-    def calculate_cost(self, text):
-        """计算成本"""
-        try:
-            data = {"text": text}
-            response = requests.post(f"{self.base_url}/api/cost", json=data)
-            return response.json()
-        except Exception as e:
-            return {"error": str(e)}
+from tts_client import TTSClient, TTSClientError
 
 
 def demo_basic_usage():
@@ -132,13 +62,20 @@ def demo_different_voices():
         voices = voices_response['voices']
         
         print("测试不同音色:")
-        for voice_key, voice_name in voices.items():
-            print(f"\n音色: {voice_name}")
-            result = client.synthesize(text, voice=voice_name)
-            if result.get('success'):
-                print(f"✓ 合成成功 - 成本: {result.get('cost')} 元")
-            else:
-                print(f"✗ 合成失败 - {result.get('error')}")
+        # 服务端并发合成所有音色，按完成顺序输出结果
+        try:
+            for result in client.synthesize_voices(text, list(voices)):
+                if result.get('summary'):
+                    print(f"\n成功 {result['succeeded']} 个，失败 {result['failed']} 个，"
+                          f"总耗时 {result['elapsed_ms']} ms")
+                    continue
+                print(f"\n音色: {voices.get(result['voice'], result['voice'])}")
+                if result.get('success'):
+                    print(f"✓ 合成成功 - 成本: {result.get('cost')} 元")
+                else:
+                    print(f"✗ 合成失败 - {result.get('message')}")
+        except TTSClientError as e:
+            print(f"✗ 多音色合成失败 - {e}")
     else:
         print("获取音色列表失败")
 
@@ -0,0 +1,155 @@
+"""
+WebSocket双工合成会话
+客户端在一个长连接上持续推送带id的文本片段，服务端按顺序合成，
+上游音频分片一到达即以带id标记的二进制帧返回
+
+消息协议:
+    客户端 -> 服务端 (文本帧, JSON):
+        {"type": "config", "voice": "...", "format": "wav", "sample_rate": 22050}
+        {"type": "synthesize", "id": "s1", "text": "..."}
+    服务端 -> 客户端:
+        二进制帧: 2字节大端id长度 + id(UTF-8) + 音频分片
+        文本帧:   {"type": "done", "id": "s1", ...} / {"type": "error", "id": "s1", "message": "..."}
+"""
+
+import json
+import queue
+import struct
+import logging
+import threading
+from typing import Dict, Any, Tuple, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+FRAME_ID_HEADER = struct.Struct('>H')
+
+# 每个连接允许排队等待合成的片段数，超过后阻塞读取以形成背压
+MAX_PENDING_FRAGMENTS = 32
+
+
+def encode_audio_frame(fragment_id: str, chunk: bytes) -> bytes:
+    """将音频分片编码为带id标记的二进制帧"""
+    id_bytes = fragment_id.encode('utf-8')
+    return FRAME_ID_HEADER.pack(len(id_bytes)) + id_bytes + chunk
+
+
+def decode_audio_frame(frame: bytes) -> Tuple[str, bytes]:
+    """解析二进制帧，返回 (id, 音频分片)"""
+    (id_length,) = FRAME_ID_HEADER.unpack_from(frame)
+    start = FRAME_ID_HEADER.size
+    return frame[start:start + id_length].decode('utf-8'), frame[start + id_length:]
+
+
+class DuplexSynthesisSession:
+    """单个WebSocket连接上的合成会话，连接内的片段按到达顺序依次合成"""
+
+    def __init__(self, ws, tts_service, max_pending: int = MAX_PENDING_FRAGMENTS,
+                 check_limit: Optional[Callable[[int], Tuple[bool, Dict[str, Any]]]] = None):
+        self.ws = ws
+        self.tts_service = tts_service
+        self.check_limit = check_limit
+        self.options: Dict[str, Any] = {}
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.closed = threading.Event()
+        self._send_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name='duplex-synthesis', daemon=True)
+
+    def serve(self):
+        """在请求线程中循环读取客户端消息，直到连接关闭"""
+        self._worker.start()
+        try:
+            while not self.closed.is_set():
+                message = self.ws.receive()
+                if message is None:
+                    break
+                self._handle_message(message)
+        except Exception as e:
+            logger.info(f"双工合成连接已关闭: {e}")
+        finally:
+            self.closed.set()
+            try:
+                self.pending.put_nowait(None)
+            except queue.Full:
+                # 队列已满时工作线程取到下一个片段即会发现连接已关闭
+                pass
+
+    def _handle_message(self, message):
+        """处理一条客户端消息"""
+        if isinstance(message, bytes):
+            self._send_json({'type': 'error', 'message': '仅支持JSON文本消息'})
+            return
+
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            self._send_json({'type': 'error', 'message': '消息格式错误'})
+            return
+
+        message_type = data.get('type', 'synthesize')
+        if message_type == 'config':
+            # 连接级默认参数，对之后推送的片段生效
+            for name in ('voice', 'format', 'sample_rate'):
+                if name in data:
+                    self.options[name] = data[name]
+            self._send_json({'type': 'config', 'options': self.options})
+        elif message_type == 'synthesize':
+            fragment_id = str(data.get('id', ''))
+            text = data.get('text')
+            if not fragment_id or not text:
+                self._send_json({'type': 'error', 'id': fragment_id, 'message': 'id和text参数不能为空'})
+                return
+            if self.check_limit:
+                allowed, info = self.check_limit(len(text))
+                if not allowed:
+                    self._send_json({
+                        'type': 'error', 'id': fragment_id,
+                        'message': '超出限流额度', 'retry_after': info['retry_after']
+                    })
+                    return
+            options = dict(self.options)
+            for name in ('voice', 'format', 'sample_rate'):
+                if name in data:
+                    options[name] = data[name]
+            self.pending.put((fragment_id, text, options))
+        else:
+            self._send_json({'type': 'error', 'message': f'未知消息类型: {message_type}'})
+
+    def _run(self):
+        """合成工作线程：按顺序处理片段，上游分片到达即转发"""
+        while True:
+            item = self.pending.get()
+            if item is None or self.closed.is_set():
+                break
+
+            fragment_id, text, options = item
+            try:
+                result = self.tts_service.stream_speech(
+                    text,
+                    on_audio=lambda chunk: self._send(encode_audio_frame(fragment_id, chunk)),
+                    **options
+                )
+            except Exception as e:
+                logger.info(f"双工合成发送失败: {e}")
+                self.closed.set()
+                break
+
+            if result['success']:
+                result['type'] = 'done'
+            else:
+                result = {'type': 'error', 'message': result['message']}
+            result['id'] = fragment_id
+            self._send_json(result)
+
+    def _send(self, data):
+        """发送一帧数据（接收线程与工作线程共用连接，需加锁）"""
+        with self._send_lock:
+            self.ws.send(data)
+
+    def _send_json(self, payload: Dict[str, Any]):
+        """发送JSON文本帧，连接已关闭时忽略"""
+        try:
+            self._send(json.dumps(payload, ensure_ascii=False))
+        except Exception:
+            self.closed.set()
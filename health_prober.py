@@ -0,0 +1,169 @@
+"""
+上游可用性探测
+后台线程定期对每个已配置模型发起一次极短文本的合成，记录滚动的延迟和错误统计，
+用于深度就绪检查和超时参数调优，探测本身不经过请求路径
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(sorted_values, percent: float) -> Optional[float]:
+    """计算已排序序列的百分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _ModelProbeStats:
+    """单个模型的滚动探测统计"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.last_error = ''
+        self.last_probe_at = None
+        self.last_success_at = None
+
+
+class UpstreamProber:
+    """上游探测器"""
+
+    def __init__(self, tts_service, interval: float = 60, window: int = 50,
+                 failure_threshold: int = 3, probe_text: str = 'Hi.', timeout: float = 10):
+        self.tts_service = tts_service
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.probe_text = probe_text
+        self.timeout = timeout
+        self.stats = {model_name: _ModelProbeStats(window) for model_name in tts_service.model_configs['models']}
+        # 每个模型最多一个进行中的探测调用，上游挂起时超时的调用在后台线程中继续等待，不再重复发起
+        self._executor = ThreadPoolExecutor(max_workers=len(self.stats), thread_name_prefix='probe')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, tts_service) -> 'UpstreamProber':
+        """根据环境变量创建探测器（TTS_PROBE_INTERVAL为0表示关闭探测）"""
+        return cls(
+            tts_service,
+            interval=float(os.getenv('TTS_PROBE_INTERVAL', 60)),
+            window=int(os.getenv('TTS_PROBE_WINDOW', 50)),
+            failure_threshold=int(os.getenv('TTS_PROBE_FAILURE_THRESHOLD', 3)),
+            timeout=float(os.getenv('TTS_PROBE_TIMEOUT', 10))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self):
+        """启动后台探测线程"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='upstream-prober', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for model_name in self.stats:
+                if self._stop.is_set():
+                    return
+                self.probe(model_name)
+            self._stop.wait(self.interval)
+
+    def probe(self, model_name: str) -> Dict[str, Any]:
+        """对指定模型执行一次探测并记录结果，超过timeout秒未完成视为失败"""
+        future = self._pending.get(model_name)
+        if future is None or future.done():
+            future = self._pending[model_name] = self._executor.submit(
+                self.tts_service.probe_upstream, model_name, self.probe_text
+            )
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            result = {"success": False, "latency": self.timeout, "message": f"探测超过{self.timeout}秒未完成"}
+        now = time.time()
+        with self._lock:
+            stats = self.stats[model_name]
+            stats.samples.append((result['latency'], result['success']))
+            stats.last_probe_at = now
+            if result['success']:
+                stats.consecutive_failures = 0
+                stats.last_success_at = now
+            else:
+                stats.consecutive_failures += 1
+                stats.last_error = result['message']
+        if not result['success']:
+            logger.warning(f"上游探测失败: 模型={model_name}, 错误={result['message']}")
+        return result
+
+    def is_model_ready(self, model_name: str) -> bool:
+        """
+        模型最近有成功探测且连续失败次数未超过阈值
+
+        最近一次成功须在两个探测间隔（另加一次探测超时）之内，探测调用挂起时也能及时变为未就绪
+        """
+        if not self.enabled:
+            return True
+        max_age = 2 * self.interval + self.timeout
+        with self._lock:
+            stats = self.stats.get(model_name)
+            return (stats is not None
+                    and stats.last_success_at is not None
+                    and time.time() - stats.last_success_at <= max_age
+                    and stats.consecutive_failures < self.failure_threshold)
+
+    def get_latency(self, model_name: str, percent: float = 95) -> Optional[float]:
+        """获取成功探测延迟的百分位数（秒），没有样本时返回None"""
+        with self._lock:
+            stats = self.stats.get(model_name)
+            if stats is None:
+                return None
+            latencies = sorted(latency for latency, success in stats.samples if success)
+        return _percentile(latencies, percent)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各模型的滚动探测统计"""
+        models = {}
+        with self._lock:
+            for model_name, stats in self.stats.items():
+                latencies = sorted(latency for latency, success in stats.samples if success)
+                errors = sum(1 for _, success in stats.samples if not success)
+                models[model_name] = {
+                    'samples': len(stats.samples),
+                    'error_rate': round(errors / len(stats.samples), 4) if stats.samples else None,
+                    'latency_ms': {
+                        name: round(value * 1000, 1) if value is not None else None
+                        for name, value in (
+                            ('p50', _percentile(latencies, 50)),
+                            ('p95', _percentile(latencies, 95)),
+                            ('p99', _percentile(latencies, 99)),
+                            ('max', latencies[-1] if latencies else None)
+                        )
+                    },
+                    'consecutive_failures': stats.consecutive_failures,
+                    'last_error': stats.last_error,
+                    'last_probe_at': stats.last_probe_at,
+                    'last_success_at': stats.last_success_at
+                }
+        return {
+            'enabled': self.enabled,
+            'interval': self.interval,
+            'failure_threshold': self.failure_threshold,
+            'timeout': self.timeout,
+            'models': models
+        }
@@ -0,0 +1,369 @@
+"""
+上游API Key池
+多个DashScope账号的Key组成一个池，每个Key有独立的并发上限和每秒请求数限制。
+请求分配给负载最低的健康Key，返回限流错误的Key会被暂时摘除（连续被限流时摘除时间加倍）。
+每个Key的在途请求数、摘除截止时间和每秒请求数令牌桶保存在同一个共享内存槽位中，
+同一主机的所有工作进程共同执行并发上限、摘除和每秒请求数限制
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Tuple
+
+from rate_limiter import shared_memory_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'max_concurrency': 4,
+    'requests_per_second': 10,
+    'request_burst': 10,
+    'eject_seconds': 30,
+    'max_eject_seconds': 300,
+    'acquire_timeout': 10,
+    'keys': []
+}
+
+# 上游返回的限流错误码前缀
+THROTTLING_CODES = ('Throttling',)
+
+MAGIC = b'TTSKP001'
+HEADER = struct.Struct('<8sI')
+# 槽位头: Key摘要(16字节) + 请求令牌 + 令牌更新时间 + 摘除截止时间 + 连续被限流次数
+SLOT_HEAD = struct.Struct('<16sdddi4x')
+EMPTY_DIGEST = b'\x00' * 16
+# 每个槽位记录各进程持有的在途请求数 (pid, 数量)，进程异常退出后可按pid回收
+MAX_HOLDERS = 64
+HOLDERS = struct.Struct(f'<{MAX_HOLDERS * 2}i')
+SLOT_SIZE = SLOT_HEAD.size + HOLDERS.size
+
+
+class NoAvailableKeyError(Exception):
+    """等待超时仍没有可用的API Key"""
+
+
+def mask_key(key: str) -> str:
+    """日志和统计中只显示Key的末尾几位"""
+    return f"{key[:3]}...{key[-4:]}" if len(key) > 10 else '***'
+
+
+def is_throttled(status_code: Optional[int], code: Optional[str]) -> bool:
+    """根据上游响应判断是否被限流"""
+    return status_code == 429 or bool(code and str(code).startswith(THROTTLING_CODES))
+
+
+def _pid_alive(pid: int) -> bool:
+    """进程是否仍然存在"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedKeyTable:
+    """
+    跨进程共享的Key状态表，保存在mmap共享内存文件中
+
+    所有读写都需在 locked() 内进行，保证同一主机上的工作进程看到一致的状态
+    """
+
+    def __init__(self, path: str, slots: int = 256):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = HEADER.size + SLOT_SIZE * self.slots
+        with self.locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            magic, slot_count = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or slot_count != self.slots:
+                self._map[:] = b'\x00' * size
+                HEADER.pack_into(self._map, 0, MAGIC, self.slots)
+
+    @contextmanager
+    def locked(self):
+        """同时持有线程锁和文件锁"""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def register(self, name: str, request_burst: float) -> int:
+        """查找或占用Key的槽位，返回偏移量（Key不会被移除，槽位在进程间保持稳定）"""
+        digest = hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+        start = int.from_bytes(digest[:4], 'little') % self.slots
+        with self.locked():
+            for probe in range(self.slots):
+                offset = HEADER.size + ((start + probe) % self.slots) * SLOT_SIZE
+                slot_digest = SLOT_HEAD.unpack_from(self._map, offset)[0]
+                if slot_digest == digest:
+                    return offset
+                if slot_digest == EMPTY_DIGEST:
+                    SLOT_HEAD.pack_into(self._map, offset, digest, float(request_burst), time.time(), 0.0, 0)
+                    return offset
+        raise RuntimeError(f'API Key共享状态表已满（{self.slots}个槽位）')
+
+    def read(self, offset: int) -> Tuple[float, float, float, int]:
+        """返回 (请求令牌, 令牌更新时间, 摘除截止时间, 连续被限流次数)"""
+        return SLOT_HEAD.unpack_from(self._map, offset)[1:]
+
+    def write(self, offset: int, request_tokens: float, updated_at: float, ejected_until: float, throttles: int):
+        digest = SLOT_HEAD.unpack_from(self._map, offset)[0]
+        SLOT_HEAD.pack_into(self._map, offset, digest, request_tokens, updated_at, ejected_until, throttles)
+
+    def in_flight(self, offset: int, reclaim: bool = False) -> int:
+        """
+        所有进程的在途请求总数
+
+        Args:
+            reclaim: 回收已退出进程遗留的占用（需要系统调用，只在Key满载时进行）
+        """
+        holders = list(HOLDERS.unpack_from(self._map, offset + SLOT_HEAD.size))
+        if reclaim:
+            own_pid = os.getpid()
+            for index in range(0, len(holders), 2):
+                pid = holders[index]
+                if pid and pid != own_pid and not _pid_alive(pid):
+                    logger.warning(f"回收已退出进程占用的API Key并发额度: pid={pid}, {holders[index + 1]}个")
+                    holders[index] = holders[index + 1] = 0
+            HOLDERS.pack_into(self._map, offset + SLOT_HEAD.size, *holders)
+        return sum(holders[1::2])
+
+    def add_holder(self, offset: int, delta: int) -> bool:
+        """调整当前进程在该Key上的在途请求数，没有空闲的进程记录位时返回False"""
+        holders = list(HOLDERS.unpack_from(self._map, offset + SLOT_HEAD.size))
+        pid = os.getpid()
+        index = next((i for i in range(0, len(holders), 2) if holders[i] == pid), None)
+        if index is None:
+            if delta < 0:
+                return True
+            index = next((i for i in range(0, len(holders), 2) if holders[i] == 0), None)
+            if index is None:
+                return False
+            holders[index] = pid
+        holders[index + 1] = max(0, holders[index + 1] + delta)
+        if not holders[index + 1]:
+            holders[index] = 0
+        HOLDERS.pack_into(self._map, offset + SLOT_HEAD.size, *holders)
+        return True
+
+
+class _KeyState:
+    """单个Key的限额、共享槽位和本进程的调用统计"""
+
+    def __init__(self, name: str, key: str, max_concurrency: int,
+                 requests_per_second: float, request_burst: float, offset: int):
+        self.name = name
+        self.key = key
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.request_burst = request_burst
+        self.offset = offset
+        self.requests_total = 0
+        self.success_total = 0
+        self.throttled_total = 0
+        self.error_total = 0
+        self.ejections_total = 0
+
+
+class KeyLease:
+    """一次Key租用，调用结束后必须通过 ApiKeyPool.release 归还"""
+
+    __slots__ = ('state', 'released')
+
+    def __init__(self, state: _KeyState):
+        self.state = state
+        self.released = False
+
+    @property
+    def key(self) -> str:
+        return self.state.key
+
+    @property
+    def name(self) -> str:
+        return self.state.name
+
+
+class ApiKeyPool:
+    """API Key池"""
+
+    def __init__(self, keys: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None,
+                 rate_file: Optional[str] = None):
+        """
+        Args:
+            keys: [{"name": "...", "key": "...", "max_concurrency": 可选, "requests_per_second": 可选}]
+            config: 默认限额和摘除策略
+            rate_file: Key共享状态的共享内存文件
+        """
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.table = SharedKeyTable(rate_file or shared_memory_path('aienglish_tts_keys'))
+        self.states = []
+        for item in keys:
+            if 'requests_per_second' in item:
+                rate = float(item['requests_per_second'])
+                burst = float(item.get('request_burst', rate))
+            else:
+                rate = float(self.config['requests_per_second'])
+                burst = float(self.config['request_burst'])
+            self.states.append(_KeyState(
+                item['name'], item['key'], int(item.get('max_concurrency', self.config['max_concurrency'])),
+                rate, burst, self.table.register(item['name'], burst)
+            ))
+        # 关闭后不再检查每秒请求数（基准测试使用）
+        self.rate_limit_enabled = True
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> 'ApiKeyPool':
+        """
+        根据model_config.json中的api_keys配置和环境变量创建Key池
+
+        Key本身只从环境变量读取：api_keys.keys中每项用env指定环境变量名，
+        DASHSCOPE_API_KEYS可提供逗号分隔的多个Key，都未配置时使用DASHSCOPE_API_KEY
+        """
+        config = config or {}
+        keys = []
+        for item in config.get('keys', []):
+            key = os.getenv(item.get('env', ''))
+            if key:
+                keys.append(dict(item, name=item.get('name') or mask_key(key), key=key))
+            else:
+                logger.warning(f"API Key环境变量未设置，已跳过: {item.get('env')}")
+        for key in os.getenv('DASHSCOPE_API_KEYS', '').split(','):
+            key = key.strip()
+            if key and all(existing['key'] != key for existing in keys):
+                keys.append({'name': mask_key(key), 'key': key})
+        if not keys and os.getenv('DASHSCOPE_API_KEY'):
+            keys.append({'name': 'default', 'key': os.getenv('DASHSCOPE_API_KEY')})
+        return cls(keys, config, rate_file=os.getenv('TTS_KEY_POOL_FILE'))
+
+    def __len__(self):
+        return len(self.states)
+
+    def _try_acquire(self, now: float, exclude: Optional[str] = None) -> Optional[_KeyState]:
+        """
+        在共享状态上选出负载最低的可用Key并占用一个并发额度和一个请求令牌
+
+        需在 table.locked() 内调用
+        """
+        candidates = []
+        for state in self.states:
+            if state.name == exclude or self.table.read(state.offset)[2] > now:
+                continue
+            in_flight = self.table.in_flight(state.offset)
+            if in_flight >= state.max_concurrency:
+                in_flight = self.table.in_flight(state.offset, reclaim=True)
+            if in_flight < state.max_concurrency:
+                candidates.append((in_flight / state.max_concurrency, state))
+        for _, state in sorted(candidates, key=lambda item: item[0]):
+            request_tokens, updated_at, ejected_until, throttles = self.table.read(state.offset)
+            request_tokens = min(state.request_burst,
+                                 request_tokens + max(0.0, now - updated_at) * state.requests_per_second)
+            if self.rate_limit_enabled and request_tokens < 1:
+                self.table.write(state.offset, request_tokens, now, ejected_until, throttles)
+                continue
+            if not self.table.add_holder(state.offset, 1):
+                continue
+            if self.rate_limit_enabled:
+                request_tokens -= 1
+            self.table.write(state.offset, request_tokens, now, ejected_until, throttles)
+            return state
+        return None
+
+    def acquire(self, timeout: Optional[float] = None, exclude: Optional[str] = None) -> KeyLease:
+        """
+        租用负载最低的可用Key，所有Key都已满载、被摘除或达到每秒请求数上限时等待
+
+        Args:
+            timeout: 最长等待秒数（默认使用acquire_timeout配置）
+            exclude: 排除的Key名称（限流重试时换用其他Key）
+
+        Raises:
+            NoAvailableKeyError: 等待超时
+        """
+        deadline = time.monotonic() + (self.config['acquire_timeout'] if timeout is None else timeout)
+        with self._condition:
+            while True:
+                with self.table.locked():
+                    state = self._try_acquire(time.time(), exclude)
+                if state is not None:
+                    state.requests_total += 1
+                    return KeyLease(state)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoAvailableKeyError('没有可用的API Key（均已满载、被限流摘除或达到每秒请求数上限）')
+                # 令牌桶补充、摘除到期和其他进程归还Key不会触发通知，因此定时重新检查
+                self._condition.wait(min(remaining, 0.05))
+
+    def release(self, lease: KeyLease, outcome: str):
+        """
+        归还Key并记录结果
+
+        Args:
+            outcome: success / throttled / error
+        """
+        if lease.released:
+            return
+        with self._condition:
+            lease.released = True
+            state = lease.state
+            eject_seconds = 0
+            with self.table.locked():
+                self.table.add_holder(state.offset, -1)
+                request_tokens, updated_at, ejected_until, throttles = self.table.read(state.offset)
+                if outcome == 'success':
+                    throttles = 0
+                elif outcome == 'throttled':
+                    throttles += 1
+                    eject_seconds = min(self.config['max_eject_seconds'],
+                                        self.config['eject_seconds'] * 2 ** (throttles - 1))
+                    ejected_until = time.time() + eject_seconds
+                self.table.write(state.offset, request_tokens, updated_at, ejected_until, throttles)
+            if outcome == 'success':
+                state.success_total += 1
+            elif outcome == 'throttled':
+                state.throttled_total += 1
+                state.ejections_total += 1
+                logger.warning(f"API Key被上游限流，暂时摘除{eject_seconds}秒: {state.name}")
+            else:
+                state.error_total += 1
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各Key的负载（同一主机所有工作进程合计）和本进程的调用统计"""
+        now = time.time()
+        with self._condition, self.table.locked():
+            keys = [
+                {
+                    'name': state.name,
+                    'healthy': self.table.read(state.offset)[2] <= now,
+                    'ejected_for': round(max(0.0, self.table.read(state.offset)[2] - now), 1),
+                    'in_flight': self.table.in_flight(state.offset),
+                    'max_concurrency': state.max_concurrency,
+                    'requests_total': state.requests_total,
+                    'success_total': state.success_total,
+                    'throttled_total': state.throttled_total,
+                    'error_total': state.error_total,
+                    'ejections_total': state.ejections_total
+                }
+                for state in self.states
+            ]
+        return {
+            'keys': keys,
+            'healthy': sum(1 for key in keys if key['healthy']),
+            'total_concurrency': sum(state.max_concurrency for state in self.states)
+        }
@@ -0,0 +1,153 @@
+"""
+上游延迟和音频大小预测
+按模型和音色维护上游延迟对文本长度的在线线性回归，按模型、音色、格式和采样率维护音频字节数的回归，
+由实际上游调用持续更新（指数加权，旧样本逐渐失效）。音色样本不足时使用同模型所有音色的汇总回归，
+用于向客户端给出预计耗时、在排队时为上游调用预留时间，以及按实际音频大小估算内存占用
+"""
+
+import math
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    # 样本权重的半衰期（按样本数）
+    'half_life': 500,
+    # 回归结果可用于决策所需的最少样本数
+    'min_samples': 20,
+    # 样本不足时向客户端展示的先验延迟
+    'prior_latency_ms': 300,
+    'prior_ms_per_char': 5
+}
+
+# 单侧95%分位对应的标准差倍数
+P95_Z = 1.645
+
+
+class OnlineRegression:
+    """指数加权的一元线性回归 y = intercept + slope * x，同时估计残差标准差"""
+
+    __slots__ = ('decay', 'count', 'weight', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'sum_yy')
+
+    def __init__(self, half_life: float):
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.count = 0
+        self.weight = self.sum_x = self.sum_y = self.sum_xx = self.sum_xy = self.sum_yy = 0.0
+
+    def update(self, x: float, y: float):
+        decay = self.decay
+        self.count += 1
+        self.weight = self.weight * decay + 1.0
+        self.sum_x = self.sum_x * decay + x
+        self.sum_y = self.sum_y * decay + y
+        self.sum_xx = self.sum_xx * decay + x * x
+        self.sum_xy = self.sum_xy * decay + x * y
+        self.sum_yy = self.sum_yy * decay + y * y
+
+    def coefficients(self) -> Tuple[float, float, float]:
+        """返回 (截距, 斜率, 残差标准差)；文本越长结果不会越小，斜率为负时按常数拟合"""
+        weight = self.weight
+        mean_x = self.sum_x / weight
+        mean_y = self.sum_y / weight
+        var_x = self.sum_xx / weight - mean_x * mean_x
+        var_y = max(0.0, self.sum_yy / weight - mean_y * mean_y)
+        cov_xy = self.sum_xy / weight - mean_x * mean_y
+        slope = cov_xy / var_x if var_x > 1e-9 else 0.0
+        if slope <= 0:
+            return mean_y, 0.0, math.sqrt(var_y)
+        return mean_y - slope * mean_x, slope, math.sqrt(max(0.0, var_y - slope * cov_xy))
+
+    def predict(self, x: float) -> Tuple[float, float]:
+        """返回 (预测值, 残差标准差)"""
+        intercept, slope, residual = self.coefficients()
+        return max(0.0, intercept + slope * x), residual
+
+
+class LatencyModel:
+    """各模型/音色的延迟和大小预测"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.enabled = self.config['enabled']
+        # (模型, 音色) -> 延迟回归（秒），音色为None的是模型汇总
+        self._latency: Dict[Tuple, OnlineRegression] = {}
+        # (模型, 音色, 格式, 采样率) -> 字节数回归
+        self._size: Dict[Tuple, OnlineRegression] = {}
+        self._lock = threading.Lock()
+
+    def _update(self, table: Dict[Tuple, OnlineRegression], key: Tuple, x: float, y: float):
+        regression = table.get(key)
+        if regression is None:
+            regression = table[key] = OnlineRegression(self.config['half_life'])
+        regression.update(x, y)
+
+    def observe(self, model_name: str, voice: str, format: str, sample_rate: int,
+                text_length: int, latency: float, audio_bytes: int):
+        """记录一次成功的上游调用"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for voice_key in (voice, None):
+                self._update(self._latency, (model_name, voice_key), text_length, latency)
+                self._update(self._size, (model_name, voice_key, format, int(sample_rate)), text_length, audio_bytes)
+
+    def _lookup(self, table: Dict[Tuple, OnlineRegression], key: Tuple) -> Tuple[Optional[OnlineRegression], str]:
+        """优先使用音色自己的回归，样本不足时使用模型汇总"""
+        for source, lookup_key in (('voice', key), ('model', (key[0], None) + key[2:])):
+            regression = table.get(lookup_key)
+            if regression is not None and regression.count >= self.config['min_samples']:
+                return regression, source
+        return None, 'prior'
+
+    def expected_latency(self, model_name: str, voice: str, text_length: int) -> Optional[float]:
+        """预计上游延迟（秒），样本不足时返回None"""
+        with self._lock:
+            regression, _ = self._lookup(self._latency, (model_name, voice))
+            return regression.predict(text_length)[0] if regression else None
+
+    def predict_bytes(self, model_name: str, voice: str, format: str, sample_rate: int,
+                      text_length: int) -> Optional[int]:
+        """预计音频字节数，样本不足时返回None"""
+        with self._lock:
+            regression, _ = self._lookup(self._size, (model_name, voice, format, int(sample_rate)))
+            return int(regression.predict(text_length)[0]) if regression else None
+
+    def predict(self, model_name: str, voice: str, format: str, sample_rate: int,
+                text_length: int) -> Dict[str, Any]:
+        """
+        预测上游延迟和音频大小
+
+        Returns:
+            latency_ms/latency_p95_ms（样本不足时为先验值）、audio_bytes（样本不足时为None）、
+            samples（所用回归的样本数）和source（voice/model/prior）
+        """
+        with self._lock:
+            regression, source = self._lookup(self._latency, (model_name, voice))
+            size, _ = self._lookup(self._size, (model_name, voice, format, int(sample_rate)))
+            if regression:
+                latency, residual = regression.predict(text_length)
+                latency_ms, p95_ms, samples = latency * 1000, (latency + P95_Z * residual) * 1000, regression.count
+            else:
+                latency_ms = self.config['prior_latency_ms'] + self.config['prior_ms_per_char'] * text_length
+                p95_ms, samples = latency_ms * 2, 0
+            return {
+                'latency_ms': round(latency_ms, 1),
+                'latency_p95_ms': round(p95_ms, 1),
+                'audio_bytes': int(size.predict(text_length)[0]) if size else None,
+                'samples': samples,
+                'source': source
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各模型/音色的回归系数"""
+        stats: Dict[str, Any] = {}
+        with self._lock:
+            for (model_name, voice), regression in self._latency.items():
+                intercept, slope, residual = regression.coefficients()
+                stats.setdefault(model_name, {})[voice or '*'] = {
+                    'samples': regression.count,
+                    'base_ms': round(intercept * 1000, 2),
+                    'ms_per_char': round(slope * 1000, 4),
+                    'residual_ms': round(residual * 1000, 2)
+                }
+        return {'enabled': self.enabled, 'min_samples': self.config['min_samples'], 'models': stats}
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+多进程启动器
+预先启动N个工作进程（默认等于CPU核数），每个工作进程以SO_REUSEPORT独立监听同一端口，由内核分配连接。
+主进程不加载服务代码，只负责监督：
+    - 工作进程异常退出时自动重启（启动后很快又退出的按指数退避，避免崩溃循环）
+    - SIGHUP：滚动重载。逐个启动新工作进程（重新读取代码和model_config.json），新进程就绪后
+      旧进程停止接受连接、处理完在途请求（包括流式响应）后退出；新进程无法就绪时中止重载，保留旧进程
+    - SIGTERM/SIGINT：所有工作进程排空在途请求后退出，超过graceful_timeout的强制结束
+
+用法:
+    python launcher.py --workers 4 --port 5000
+    kill -HUP <主进程PID>     # 滚动重载
+    kill -TERM <主进程PID>    # 优雅停止
+
+注意: 调度并发和内存预算按工作进程计算，限流和Key池的并发、摘除及每秒请求数由同一主机的工作进程共享
+"""
+
+import os
+import sys
+import time
+import select
+import signal
+import socket
+import logging
+import argparse
+import threading
+import subprocess
+from typing import Optional, List
+
+logger = logging.getLogger('launcher')
+
+# 启动后不到该秒数就退出视为崩溃循环，重启间隔加倍
+MIN_UPTIME = 10
+MAX_RESTART_BACKOFF = 30
+# 主进程检查工作进程状态的间隔
+POLL_INTERVAL = 0.5
+LISTEN_BACKLOG = 1024
+
+
+def listen_reuseport(host: str, port: int) -> socket.socket:
+    """创建设置了SO_REUSEPORT的监听套接字，多个进程可同时监听同一端口"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(LISTEN_BACKLOG)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+class InflightCounter:
+    """统计在途请求的WSGI中间件，流式响应在响应体发送完毕后才算结束；排空期间的响应关闭长连接"""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self.draining = False
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        def start(status, headers, exc_info=None):
+            if self.draining:
+                headers = [(name, value) for name, value in headers if name.lower() != 'connection']
+                headers.append(('Connection', 'close'))
+            return start_response(status, headers, exc_info)
+
+        with self._cond:
+            self.count += 1
+        try:
+            return ClosingIterator(self.app(environ, start), self._done)
+        except BaseException:
+            self._done()
+            raise
+
+    def _done(self):
+        with self._cond:
+            self.count -= 1
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout: float) -> bool:
+        """等待在途请求全部结束，超时返回False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.count == 0, timeout)
+
+
+def run_worker(host: str, port: int, ready_fd: int, graceful_timeout: float):
+    """工作进程：加载服务、监听端口、通知主进程就绪，收到SIGTERM后排空退出"""
+    from werkzeug.serving import make_server
+    import app as application
+
+    counter = InflightCounter(application.app)
+    sock = listen_reuseport(host, port)
+    server = make_server(host, port, counter, threaded=True, fd=sock.fileno())
+    sock.close()
+
+    parent = os.getppid()
+    draining = threading.Event()
+
+    def drain(*_):
+        draining.set()
+        counter.draining = True
+
+    def watch_parent():
+        # 主进程意外退出时自行排空退出，不留下孤儿进程
+        while not draining.wait(1):
+            if os.getppid() != parent:
+                drain()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    threading.Thread(target=watch_parent, name='parent-watch', daemon=True).start()
+
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+    logger.info(f"工作进程{os.getpid()}已就绪: {host}:{port}")
+    # 每次最多等待POLL_INTERVAL秒接受一个连接（每个连接由独立线程处理），以便及时响应排空信号
+    server.timeout = POLL_INTERVAL
+    while not draining.is_set():
+        server.handle_request()
+
+    # 关闭监听套接字前，先处理已进入本进程监听队列的连接
+    server.timeout = 0
+    while select.select([server.socket], [], [], 0)[0]:
+        server.handle_request()
+    server.server_close()
+    if not counter.wait_idle(graceful_timeout):
+        logger.warning(f"工作进程{os.getpid()}排空超时，仍有{counter.count}个在途请求")
+    logger.info(f"工作进程{os.getpid()}已退出")
+    sys.exit(0)
+
+
+class _Worker:
+    def __init__(self, process: subprocess.Popen, ready_fd: int):
+        self.process = process
+        self.ready_fd = ready_fd
+        self.started_at = time.monotonic()
+        self.stop_deadline: Optional[float] = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+
+class Launcher:
+    """主进程：启动、监督和滚动替换工作进程"""
+
+    def __init__(self, host: str, port: int, workers: int, graceful_timeout: float, ready_timeout: float):
+        self.host = host
+        self.port = port
+        self.size = workers
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.workers: List[Optional[_Worker]] = [None] * workers
+        self.retiring: List[_Worker] = []
+        self._restart_at = [0.0] * workers
+        self._backoff = [1.0] * workers
+        self._reload = False
+        self._stop = False
+
+    def _spawn(self) -> _Worker:
+        read_fd, write_fd = os.pipe()
+        try:
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--worker',
+                 '--host', self.host, '--port', str(self.port), '--ready-fd', str(write_fd),
+                 '--graceful-timeout', str(self.graceful_timeout)],
+                pass_fds=(write_fd,)
+            )
+        except Exception:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        return _Worker(process, read_fd)
+
+    def _wait_ready(self, worker: _Worker) -> bool:
+        """等待工作进程通知就绪，进程提前退出或超时返回False"""
+        try:
+            readable, _, _ = select.select([worker.ready_fd], [], [], self.ready_timeout)
+            return bool(readable) and os.read(worker.ready_fd, 1) == b'1'
+        except InterruptedError:
+            return False
+        finally:
+            os.close(worker.ready_fd)
+
+    def _retire(self, worker: _Worker, kill: bool = False):
+        """通知工作进程排空退出"""
+        try:
+            worker.process.send_signal(signal.SIGKILL if kill else signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        worker.stop_deadline = time.monotonic() + self.graceful_timeout + 5
+        self.retiring.append(worker)
+
+    def _start_slot(self, index: int, worker: Optional[_Worker] = None) -> bool:
+        worker = worker or self._spawn()
+        if not self._wait_ready(worker):
+            logger.error(f"工作进程{worker.pid}未能就绪")
+            self._retire(worker, kill=True)
+            return False
+        self.workers[index] = worker
+        return True
+
+    def _supervise(self):
+        """重启异常退出的工作进程，回收已排空的旧进程"""
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if worker is not None and worker.process.poll() is not None:
+                uptime = now - worker.started_at
+                logger.warning(f"工作进程{worker.pid}异常退出: 退出码={worker.process.returncode}, 运行{uptime:.1f}秒")
+                self.workers[index] = None
+                self._backoff[index] = (min(self._backoff[index] * 2, MAX_RESTART_BACKOFF)
+                                        if uptime < MIN_UPTIME else 1.0)
+                self._restart_at[index] = now + self._backoff[index]
+            if self.workers[index] is None and now >= self._restart_at[index] and not self._stop:
+                if not self._start_slot(index):
+                    self._backoff[index] = min(self._backoff[index] * 2, MAX_RESTART_BACKOFF)
+                    self._restart_at[index] = time.monotonic() + self._backoff[index]
+
+        for worker in list(self.retiring):
+            if worker.process.poll() is not None:
+                self.retiring.remove(worker)
+            elif time.monotonic() > worker.stop_deadline:
+                logger.warning(f"工作进程{worker.pid}排空超时，强制结束")
+                worker.process.kill()
+
+    def reload(self):
+        """滚动替换所有工作进程，新进程无法就绪时中止并保留其余旧进程"""
+        logger.info("开始滚动重载工作进程")
+        for index, old in enumerate(list(self.workers)):
+            if self._stop:
+                return
+            worker = self._spawn()
+            if not self._wait_ready(worker):
+                logger.error(f"新工作进程{worker.pid}未能就绪，中止重载，保留现有工作进程")
+                self._retire(worker, kill=True)
+                return
+            self.workers[index] = worker
+            if old is not None:
+                self._retire(old)
+        logger.info("滚动重载完成")
+
+    def stop(self):
+        """所有工作进程排空后退出，超时强制结束"""
+        logger.info("正在停止所有工作进程")
+        for worker in self.workers:
+            if worker is not None:
+                self._retire(worker)
+        self.workers = [None] * self.size
+        while self.retiring:
+            self._supervise()
+            time.sleep(0.1)
+        logger.info("所有工作进程已退出")
+
+    def _on_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stop = True
+
+    def run(self) -> int:
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._on_signal)
+
+        # 同时启动所有工作进程，再逐个等待就绪
+        spawned = [self._spawn() for _ in range(self.size)]
+        started = sum(self._start_slot(index, worker) for index, worker in enumerate(spawned))
+        if not started:
+            logger.error("没有工作进程能够启动")
+            self.stop()
+            return 1
+        logger.info(f"主进程{os.getpid()}已启动{started}个工作进程: {self.host}:{self.port}")
+
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                self.reload()
+            self._supervise()
+            time.sleep(POLL_INTERVAL)
+        self.stop()
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TTS服务多进程启动器')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)), help='监听端口')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('TTS_WORKERS', 0)),
+                        help='工作进程数（默认等于CPU核数）')
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.getenv('TTS_GRACEFUL_TIMEOUT', 30)),
+                        help='排空在途请求的最长时间（秒）')
+    parser.add_argument('--ready-timeout', type=float, default=60, help='等待工作进程就绪的最长时间（秒）')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.host, args.port, args.ready_fd, args.graceful_timeout)
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        logger.error("当前平台不支持SO_REUSEPORT，请直接运行 python app.py")
+        sys.exit(1)
+    # 在主进程中先试绑定一次，端口被不支持SO_REUSEPORT的程序占用时尽早报错
+    try:
+        listen_reuseport(args.host, args.port).close()
+    except OSError as e:
+        logger.error(f"无法监听 {args.host}:{args.port}: {e.strerror or e}")
+        sys.exit(1)
+
+    workers = args.workers or os.cpu_count() or 1
+    sys.exit(Launcher(args.host, args.port, workers, args.graceful_timeout, args.ready_timeout).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+课文音轨合成
+把一组按顺序排列的文本片段和停顿合成为一个WAV流：片段在有界的预读窗口内并发合成（或从缓存读取），
+按顺序输出，停顿的静音按需生成。内存占用只与预读窗口大小有关，与课文长度无关
+"""
+
+import os
+import io
+import wave
+import struct
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterator, Generator, Tuple
+
+from audio_writer import fsync_directory
+
+logger = logging.getLogger(__name__)
+
+MAX_SEGMENTS = 1000
+MAX_PAUSE_MS = 60000
+# 每次输出的静音块大小
+SILENCE_CHUNK_SIZE = 64 * 1024
+# 流式输出时RIFF和data块大小未知，按惯例写入最大值
+STREAMING_SIZE = 0xFFFFFFFF
+
+
+class ComposeError(Exception):
+    """课文音轨合成失败"""
+
+
+def wav_header(channels: int, sample_width: int, sample_rate: int, data_size: Optional[int] = None) -> bytes:
+    """生成44字节的PCM WAV头，data_size为None时写入流式占位大小"""
+    if data_size is None:
+        riff_size = data_size = STREAMING_SIZE
+    else:
+        riff_size = 36 + data_size
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b'data', data_size
+    )
+
+
+def parse_wav(audio: bytes) -> Tuple[Tuple[int, int, int], bytes]:
+    """解析WAV音频，返回 ((声道数, 采样位宽, 采样率), PCM数据)"""
+    try:
+        with wave.open(io.BytesIO(audio), 'rb') as wav:
+            fmt = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+            return fmt, wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise ComposeError(f"无法解析WAV音频: {e}")
+
+
+class LessonComposer:
+    """按播放列表合成课文音轨"""
+
+    def __init__(self, tts_service, segments: List[Dict[str, Any]], voice: Optional[str] = None,
+                 sample_rate: Optional[int] = None, priority: Optional[str] = None, lookahead: int = 4):
+        """
+        Args:
+            tts_service: TTS服务实例
+            segments: 片段列表，每项为 {"text": "...", "voice": "可选"} 或 {"pause_ms": 500}，
+                      文本片段也可带 pause_ms 表示该句之后的停顿
+            voice: 默认音色
+            sample_rate: 整条音轨的采样率
+            priority: 上游调用的优先级类别
+            lookahead: 预读窗口（同时合成的片段数上限）
+        """
+        self.tts_service = tts_service
+        self.lookahead = max(1, lookahead)
+        self.cost = 0.0
+        self.cache_hits = 0
+        self.plan = self._build_plan(segments, voice, sample_rate, priority)
+        self.text_length = sum(len(item[1]['text']) for item in self.plan if item[0] == 'text')
+
+    def _build_plan(self, segments, voice, sample_rate, priority) -> List[Tuple[str, Any]]:
+        """校验全部片段并展开为 ('text', 合成参数) / ('pause', 毫秒) 序列，参数错误时抛出ValueError"""
+        if not isinstance(segments, list) or not segments:
+            raise ValueError('segments不能为空')
+        if len(segments) > MAX_SEGMENTS:
+            raise ValueError(f'片段数量不能超过{MAX_SEGMENTS}')
+
+        plan = []
+        for index, segment in enumerate(segments):
+            if not isinstance(segment, dict):
+                raise ValueError(f'第{index + 1}个片段格式错误')
+            if 'text' in segment:
+                params = self.tts_service._resolve_params(
+                    segment['text'], segment.get('voice', voice), 'wav', sample_rate
+                )
+                if not params['success']:
+                    raise ValueError(f"第{index + 1}个片段: {params['message']}")
+                params['priority'] = priority
+                plan.append(('text', params))
+            if 'pause_ms' in segment:
+                pause_ms = segment['pause_ms']
+                if not isinstance(pause_ms, (int, float)) or not 0 <= pause_ms <= MAX_PAUSE_MS:
+                    raise ValueError(f'第{index + 1}个片段: pause_ms必须在0到{MAX_PAUSE_MS}之间')
+                plan.append(('pause', pause_ms))
+            elif 'text' not in segment:
+                raise ValueError(f'第{index + 1}个片段缺少text或pause_ms')
+
+        if not any(kind == 'text' for kind, _ in plan):
+            raise ValueError('至少需要一个文本片段')
+        return plan
+
+    def estimate_cost(self) -> float:
+        """按全部文本片段估算成本（未计缓存命中）"""
+        return round(sum(
+            self.tts_service.calculate_cost(params['text'], params['model'])
+            for kind, params in self.plan if kind == 'text'
+        ), 6)
+
+    def _synthesize(self, position: int, params: Dict[str, Any]) -> Tuple[Tuple[int, int, int], bytes, float, bool]:
+        """在执行器线程中合成一个片段，返回 (格式, PCM数据, 成本, 是否命中缓存)，由stream()汇总"""
+        result = self.tts_service._synthesize_audio(params)
+        if not result['success']:
+            raise ComposeError(f"第{position + 1}段合成失败: {result['message']}")
+        fmt, pcm = parse_wav(result['audio'])
+        return fmt, pcm, result['cost'], result['cache_hit']
+
+    def _collect(self, future) -> Tuple[Tuple[int, int, int], bytes]:
+        """取出片段结果，成本和缓存命中只在消费方线程中累加"""
+        fmt, pcm, cost, cache_hit = future.result()
+        self.cost += cost
+        if cache_hit:
+            self.cache_hits += 1
+        return fmt, pcm
+
+    def stream(self) -> Generator[bytes, None, None]:
+        """
+        按顺序输出WAV数据：先输出流式WAV头，再依次输出各片段的PCM和静音
+
+        WAV头在第一个文本片段合成完成后才输出，因此第一次next()失败时调用方仍可返回错误状态码
+        """
+        text_positions = [position for position, (kind, _) in enumerate(self.plan) if kind == 'text']
+        executor = ThreadPoolExecutor(max_workers=self.lookahead, thread_name_prefix='compose')
+        futures = {}
+        submitted = 0
+
+        def fill():
+            nonlocal submitted
+            while submitted < len(text_positions) and len(futures) < self.lookahead:
+                position = text_positions[submitted]
+                futures[position] = executor.submit(self._synthesize, position, self.plan[position][1])
+                submitted += 1
+
+        try:
+            fill()
+            fmt, first_pcm = self._collect(futures.pop(text_positions[0]))
+            channels, sample_width, sample_rate = fmt
+            yield wav_header(channels, sample_width, sample_rate)
+
+            for position, (kind, value) in enumerate(self.plan):
+                if kind == 'pause':
+                    yield from self._silence(value, channels * sample_width, sample_rate)
+                    continue
+                if position == text_positions[0]:
+                    pcm = first_pcm
+                    first_pcm = None
+                else:
+                    segment_fmt, pcm = self._collect(futures.pop(position))
+                    if segment_fmt != fmt:
+                        raise ComposeError(f"第{position + 1}段音频格式{segment_fmt}与音轨格式{fmt}不一致")
+                fill()
+                yield pcm
+        finally:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _silence(pause_ms: float, block_align: int, sample_rate: int) -> Iterator[bytes]:
+        """按块生成指定时长的静音"""
+        remaining = int(round(pause_ms * sample_rate / 1000)) * block_align
+        chunk = bytes(min(remaining, SILENCE_CHUNK_SIZE))
+        while remaining > 0:
+            if remaining < len(chunk):
+                chunk = chunk[:remaining]
+            yield chunk
+            remaining -= len(chunk)
+
+
+def tee_to_file(chunks: Generator[bytes, None, None], path: str) -> Iterator[bytes]:
+    """
+    透传WAV流的同时写入文件，流结束后回填RIFF和data块的实际大小并原子重命名
+
+    流中途失败或被客户端中断时删除临时文件，不留下不完整的音轨
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.compose-')
+    completed = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+            size = f.tell()
+            f.seek(4)
+            f.write(struct.pack('<I', size - 8))
+            f.seek(40)
+            f.write(struct.pack('<I', size - 44))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_directory(os.path.dirname(path))
+        completed = True
+        logger.info(f"课文音轨已保存: {path}")
+    finally:
+        chunks.close()
+        if not completed and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
@@ -0,0 +1,158 @@
+"""
+内存预算准入控制
+根据文本长度和采样率估算每个请求在处理过程中同时持有的音频字节数（原始音频、base64副本、JSON序列化副本），
+按每个工作进程的内存预算决定立即放行、排队等待或拒绝，使进程内存有可预期的上限
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    'budget_mb': 256,
+    'max_queue': 64,
+    'max_wait': 5,
+    'chars_per_second': 14,
+    'padding_seconds': 1.0
+}
+
+# 压缩格式按128kbps估算
+COMPRESSED_BYTES_PER_SECOND = 16000
+# base64编码后的膨胀比例
+BASE64_RATIO = 4 / 3
+
+
+class MemoryBudgetExceeded(Exception):
+    """内存预算不足且排队超时（或队列已满）"""
+
+
+class _Reservation:
+    """一次预留，重复释放无副作用"""
+
+    __slots__ = ('size', 'released', 'granted', 'event')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.released = False
+        self.granted = False
+        self.event = threading.Event()
+
+
+class MemoryBudget:
+    """按估算的在途音频字节数进行准入控制，排队按先来先服务，避免大请求被小请求持续插队"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.enabled = self.config['enabled']
+        self.budget = int(self.config['budget_mb'] * 1024 * 1024)
+        self.in_use = 0
+        self.peak = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.stats = {
+            'admitted_total': 0,
+            'queued_total': 0,
+            'rejected_total': 0,
+            'oversized_total': 0
+        }
+
+    def estimate(self, text_length: int, sample_rate: int, format: str = 'wav',
+                 binary: bool = False, slim: bool = False, audio_bytes: Optional[int] = None) -> int:
+        """
+        估算请求处理期间同时持有的字节数
+
+        JSON响应同时持有原始音频、base64字符串和序列化后的JSON；二进制响应只有原始音频和响应体；
+        音频瘦身还需要浮点样本数组。audio_bytes为预测的音频大小，未给出时按语速估算
+        """
+        if audio_bytes is not None:
+            raw = audio_bytes
+        else:
+            seconds = text_length / self.config['chars_per_second'] + self.config['padding_seconds']
+            if format in ('wav', 'pcm'):
+                raw = seconds * int(sample_rate) * 2
+            else:
+                raw = seconds * COMPRESSED_BYTES_PER_SECOND
+        copies = 2.0 if binary else 1 + 2 * BASE64_RATIO
+        if slim:
+            copies += 4.0
+        return int(raw * copies)
+
+    def _fits(self, size: int) -> bool:
+        # 单个请求超过整个预算时，只在没有其他在途请求时放行
+        return self.in_use + size <= self.budget or self.in_use == 0
+
+    def _grant(self, reservation: _Reservation):
+        self.in_use += reservation.size
+        self.peak = max(self.peak, self.in_use)
+        self.stats['admitted_total'] += 1
+        if reservation.size > self.budget:
+            self.stats['oversized_total'] += 1
+        reservation.granted = True
+        reservation.event.set()
+
+    def _dispatch(self):
+        """在持有锁的情况下按顺序放行队首能放下的请求"""
+        while self._waiters and self._fits(self._waiters[0].size):
+            self._grant(self._waiters.popleft())
+
+    def acquire(self, size: int, timeout: Optional[float] = None) -> _Reservation:
+        """
+        预留内存，预算不足时排队等待
+
+        Raises:
+            MemoryBudgetExceeded: 队列已满或等待超时
+        """
+        reservation = _Reservation(size)
+        if not self.enabled:
+            reservation.granted = True
+            return reservation
+
+        with self._lock:
+            if not self._waiters and self._fits(size):
+                self._grant(reservation)
+                return reservation
+            if len(self._waiters) >= self.config['max_queue']:
+                self.stats['rejected_total'] += 1
+                raise MemoryBudgetExceeded('内存预算排队已满')
+            self._waiters.append(reservation)
+            self.stats['queued_total'] += 1
+
+        if reservation.event.wait(self.config['max_wait'] if timeout is None else timeout):
+            return reservation
+        with self._lock:
+            if reservation.granted:
+                return reservation
+            self._waiters.remove(reservation)
+            self.stats['rejected_total'] += 1
+            # 队首超时离开后，后面较小的请求可能已经能放下
+            self._dispatch()
+        raise MemoryBudgetExceeded('等待内存预算超时')
+
+    def release(self, reservation: _Reservation):
+        """释放预留（可重复调用）"""
+        if not self.enabled or not reservation.granted:
+            return
+        with self._lock:
+            if reservation.released:
+                return
+            reservation.released = True
+            self.in_use -= reservation.size
+            self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取当前用量和准入统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'enabled': self.enabled,
+                'budget_bytes': self.budget,
+                'in_use_bytes': self.in_use,
+                'peak_bytes': self.peak,
+                'utilization': round(self.in_use / self.budget, 4) if self.budget else 0.0,
+                'queued': len(self._waiters)
+            })
+        return stats
@@ -0,0 +1,312 @@
+"""
+已保存音频的内容索引
+把合成参数的缓存键映射到输出目录中保存过的音频文件，同一句子再次请求时直接复用文件，不再调用上游。
+索引保存在内存中：每次保存文件时追加一行到日志文件；日志超过compact_mb或正常退出时写出快照并轮换日志
+（快照包含轮换前日志中的全部记录，日志换为新的空文件），日志大小因此有上限。
+启动时由后台线程分批加载快照，再从快照记录的位置继续读取日志，加载期间正常接收请求（只是暂时未命中）。
+加载完成后持续读取日志中其他工作进程追加的记录，发现日志已被其他进程轮换时重新加载快照
+"""
+
+import os
+import json
+import time
+import fcntl
+import atexit
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    # 每批加载的条目数，批之间让出CPU
+    'load_batch': 1000,
+    # 读取其他进程追加记录的间隔（秒）
+    'tail_interval': 5,
+    # 日志超过该大小（MB）时写出快照并轮换日志
+    'compact_mb': 8
+}
+
+# 以点开头的文件不会被下载接口和分层存储处理
+SNAPSHOT_NAME = '.index-snapshot.jsonl'
+JOURNAL_NAME = '.index-journal.jsonl'
+# 追加日志时加共享锁，轮换日志时加独占锁
+LOCK_NAME = '.index.lock'
+
+
+class OutputIndex:
+    """缓存键 -> 输出目录文件名的内存索引"""
+
+    def __init__(self, directory: str, config: Optional[Dict[str, Any]] = None,
+                 resolve: Optional[Callable[[str], Optional[str]]] = None,
+                 is_pending: Optional[Callable[[str], bool]] = None):
+        """
+        Args:
+            directory: 输出目录（audio_outputs）
+            config: 加载批大小和日志读取间隔
+            resolve: 文件名 -> 可读取的路径（如分层存储的resolve，会从冷层提升），文件不存在时返回None
+            is_pending: 判断文件是否仍在后台写入队列中，写入完成前不会因为找不到文件而删除条目
+        """
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.enabled = self.config['enabled']
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self.journal_path = os.path.join(directory, JOURNAL_NAME)
+        self.lock_path = os.path.join(directory, LOCK_NAME)
+        self.resolve = resolve or self._resolve_hot
+        self.is_pending = is_pending or (lambda path: False)
+
+        self._entries: Dict[str, str] = {}
+        # 已读到的日志文件（inode）及位置，inode变化说明日志已被轮换
+        self._journal_inode: Optional[int] = None
+        self._journal_offset = 0
+        self._journal = None
+        # 加载完成后是否有新条目（没有变化时退出不重写快照）
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._tail_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.loaded = threading.Event()
+        self.stats = {
+            'recorded_total': 0,
+            'hits_total': 0,
+            'stale_total': 0,
+            'compactions_total': 0,
+            'loaded_entries': 0,
+            'load_ms': None
+        }
+
+    def _resolve_hot(self, filename: str) -> Optional[str]:
+        path = os.path.join(self.directory, filename)
+        return path if os.path.exists(path) else None
+
+    def start(self):
+        """启动后台加载线程，正常退出时写出快照"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='output-index', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        start = time.monotonic()
+        try:
+            self._load_snapshot()
+            self._tail_journal()
+        except Exception as e:
+            logger.error(f"加载音频文件索引失败: {e}")
+        self.stats['load_ms'] = round((time.monotonic() - start) * 1000, 1)
+        self.loaded.set()
+        logger.info(f"音频文件索引加载完成: {len(self._entries)}条, 耗时{self.stats['load_ms']}ms")
+
+        compact_bytes = self.config['compact_mb'] * 1024 * 1024
+        while not self._stop.wait(self.config['tail_interval']):
+            try:
+                self._tail_journal()
+                if self._journal_offset >= compact_bytes:
+                    self.compact(compact_bytes)
+            except Exception as e:
+                logger.error(f"读取或轮换音频文件索引日志失败: {e}")
+
+    def _merge(self, batch: Dict[str, str]):
+        with self._lock:
+            # 加载期间新保存的文件优先
+            for key, filename in batch.items():
+                self._entries.setdefault(key, filename)
+            self.stats['loaded_entries'] += len(batch)
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        """跨进程的日志锁；每次单独打开锁文件，同一进程的不同线程之间同样互斥"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def _load_snapshot(self):
+        """
+        分批加载快照，第一行为头部 {"journal_inode": 日志inode, "journal_offset": N}，其余每行为 [缓存键, 文件名]
+        """
+        try:
+            f = open(self.snapshot_path, encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            header = json.loads(f.readline() or '{}')
+            batch = {}
+            for line in f:
+                # 只中止启动时的加载；退出时轮换日志需要完整地重新加载快照
+                if self._stop.is_set() and not self.loaded.is_set():
+                    return
+                try:
+                    key, filename = json.loads(line)
+                except ValueError:
+                    continue
+                batch[key] = filename
+                if len(batch) >= self.config['load_batch']:
+                    self._merge(batch)
+                    batch = {}
+                    time.sleep(0)
+            self._merge(batch)
+        with self._lock:
+            self._journal_inode = header.get('journal_inode')
+            self._journal_offset = int(header.get('journal_offset', 0))
+
+    def _tail_journal(self):
+        """读取日志中上次位置之后的完整行（包括其他工作进程追加的记录）"""
+        with self._tail_lock:
+            try:
+                f = open(self.journal_path, 'rb')
+            except FileNotFoundError:
+                return
+            with f:
+                stat = os.fstat(f.fileno())
+                if self._journal_inode is not None and stat.st_ino != self._journal_inode:
+                    # 日志已被其他进程轮换，轮换前的记录都在新快照中
+                    self._load_snapshot()
+                    if stat.st_ino != self._journal_inode:
+                        self._journal_offset = 0
+                self._journal_inode = stat.st_ino
+                if stat.st_size < self._journal_offset:
+                    # 日志被截断，从头读取
+                    self._journal_offset = 0
+                f.seek(self._journal_offset)
+                data = f.read()
+            data = data[:data.rfind(b'\n') + 1]
+            batch = {}
+            for line in data.splitlines():
+                try:
+                    record = json.loads(line)
+                    batch[record['key']] = record['file']
+                except (ValueError, KeyError, TypeError):
+                    continue
+            with self._lock:
+                self._entries.update(batch)
+                self._journal_offset += len(data)
+                self._dirty = self._dirty or bool(data)
+
+    def record(self, key: str, filename: str):
+        """登记一个已提交保存的文件"""
+        if not self.enabled:
+            return
+        line = json.dumps({'key': key, 'file': filename}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._entries[key] = filename
+            self._dirty = True
+            self.stats['recorded_total'] += 1
+        try:
+            with self._file_lock(fcntl.LOCK_SH), self._lock:
+                journal = self._open_journal()
+                journal.write(line)
+                journal.flush()
+        except OSError as e:
+            logger.error(f"写入音频文件索引日志失败: {e}")
+
+    def _open_journal(self):
+        """返回追加用的日志文件，日志已被轮换时重新打开"""
+        try:
+            inode = os.stat(self.journal_path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._journal is not None and os.fstat(self._journal.fileno()).st_ino != inode:
+            self._journal.close()
+            self._journal = None
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return self._journal
+
+    def fetch(self, key: str) -> Optional[bytes]:
+        """读取缓存键对应的已保存音频，没有登记或文件已不存在时返回None"""
+        if not self.enabled:
+            return None
+        filename = self._entries.get(key)
+        if filename is None:
+            return None
+        path = self.resolve(filename)
+        if path is None:
+            if not self.is_pending(os.path.join(self.directory, filename)):
+                with self._lock:
+                    if self._entries.get(key) == filename:
+                        del self._entries[key]
+                    self.stats['stale_total'] += 1
+            return None
+        try:
+            with open(path, 'rb') as f:
+                audio_data = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self.stats['hits_total'] += 1
+        return audio_data
+
+    def compact(self, min_bytes: int = 0):
+        """
+        写出快照并轮换日志
+
+        持有独占锁期间没有进程能追加记录：先读完日志，再原子写出快照（头部记录新日志的inode），
+        最后用空文件替换日志。读完后日志不足min_bytes（已被其他进程轮换过）时不做处理
+        """
+        with self._file_lock(fcntl.LOCK_EX):
+            self._tail_journal()
+            if self._journal_offset < min_bytes:
+                return
+            with self._tail_lock:
+                with self._lock:
+                    entries = list(self._entries.items())
+                fd, journal_tmp = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+                inode = os.fstat(fd).st_ino
+                os.close(fd)
+                try:
+                    self._write_snapshot(entries, inode)
+                    os.replace(journal_tmp, self.journal_path)
+                except Exception:
+                    os.unlink(journal_tmp)
+                    raise
+                with self._lock:
+                    self._journal_inode = inode
+                    self._journal_offset = 0
+                    self._dirty = False
+                    self.stats['compactions_total'] += 1
+        logger.info(f"已写出音频文件索引快照并轮换日志: {len(entries)}条")
+
+    def _write_snapshot(self, entries, journal_inode: int):
+        """原子写出快照"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                header = {'journal_inode': journal_inode, 'journal_offset': 0, 'entries': len(entries)}
+                f.write(json.dumps(header) + '\n')
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def close(self):
+        """停止后台线程，写出快照并轮换日志；加载尚未完成或索引没有变化时不覆盖已有快照"""
+        self._stop.set()
+        if self._thread is not None and self.loaded.is_set() and self._dirty:
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"写出音频文件索引快照失败: {e}")
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引条目数、加载状态和命中统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        stats.update({'enabled': self.enabled, 'loaded': self.loaded.is_set()})
+        return stats
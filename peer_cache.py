@@ -0,0 +1,227 @@
+"""
+多节点分布式合成缓存
+各节点按一致性哈希（合成缓存键）划分归属：本地缓存未命中时先通过HTTP向归属节点读取，
+都未命中才调用上游；合成结果在后台复制到归属节点。节点成员来自静态配置，
+对等节点超时或不可用时直接回退到本地合成，并在failure_backoff秒内跳过该节点
+"""
+
+import os
+import re
+import time
+import queue
+import bisect
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+
+import requests
+
+from deadline import remaining
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': False,
+    'peers': [],
+    'self': None,
+    'replication': 2,
+    'timeout': 0.3,
+    'failure_backoff': 5,
+    'virtual_nodes': 64,
+    'replicate_queue': 256,
+    'max_entry_mb': 16
+}
+
+# 合成缓存键为sha256十六进制串
+CACHE_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """带虚拟节点的一致性哈希环"""
+
+    def __init__(self, nodes: List[str], virtual_nodes: int = 64):
+        self.nodes = list(dict.fromkeys(nodes))
+        points = sorted(
+            (_hash(f"{node}#{index}"), node)
+            for node in self.nodes for index in range(virtual_nodes)
+        )
+        self._positions = [position for position, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owners(self, key: str, count: int) -> List[str]:
+        """从键的位置顺时针取count个不同的节点，第一个为主归属节点"""
+        if not self._positions:
+            return []
+        count = min(count, len(self.nodes))
+        result = []
+        index = bisect.bisect(self._positions, _hash(key))
+        for offset in range(len(self._positions)):
+            node = self._owners[(index + offset) % len(self._positions)]
+            if node not in result:
+                result.append(node)
+                if len(result) == count:
+                    break
+        return result
+
+
+class PeerCache:
+    """对等节点缓存层，本地存储使用 SharedAudioCache"""
+
+    def __init__(self, local_cache, peers: List[str], self_url: Optional[str] = None,
+                 config: Optional[Dict[str, Any]] = None, token: Optional[str] = None):
+        """
+        Args:
+            local_cache: 本节点的共享缓存
+            peers: 所有节点的基础URL（包括本节点），如 http://10.0.0.1:5000
+            self_url: 本节点的基础URL，不在peers中时本节点只读取不承担归属
+            config: 复制因子、超时等配置
+            token: 节点间请求携带的X-Peer-Token
+        """
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.local_cache = local_cache
+        self.self_url = self_url.rstrip('/') if self_url else None
+        self.ring = HashRing([peer.rstrip('/') for peer in peers], self.config['virtual_nodes'])
+        self.replication = max(1, int(self.config['replication']))
+        self.timeout = float(self.config['timeout'])
+        self.failure_backoff = float(self.config['failure_backoff'])
+        self.max_entry_bytes = int(self.config['max_entry_mb'] * 1024 * 1024)
+        self.token = token
+        self.session = requests.Session()
+        if token:
+            self.session.headers['X-Peer-Token'] = token
+        self.stats = {
+            'peer_hits': 0,
+            'peer_misses': 0,
+            'peer_errors': 0,
+            'peer_skipped': 0,
+            'replicated_total': 0,
+            'replicate_errors': 0,
+            'replicate_dropped': 0
+        }
+        self._lock = threading.Lock()
+        # 节点 -> 读取失败后的跳过截止时间（time.monotonic）
+        self._failed_until = {}
+        self._queue = queue.Queue(maxsize=self.config['replicate_queue'])
+        self._thread = threading.Thread(target=self._run, name='peer-replicator', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, local_cache, config: Optional[Dict[str, Any]] = None) -> Optional['PeerCache']:
+        """
+        根据model_config.json中的peer_cache配置创建，未启用时返回None
+
+        节点列表和本节点地址可用环境变量TTS_PEERS（逗号分隔）和TTS_PEER_SELF覆盖，
+        便于在同一份配置下启动多个本地进程
+        """
+        config = dict(DEFAULT_CONFIG, **(config or {}))
+        peers = [peer.strip() for peer in os.getenv('TTS_PEERS', '').split(',') if peer.strip()]
+        peers = peers or config['peers']
+        if not peers or not (config['enabled'] or os.getenv('TTS_PEERS')):
+            return None
+        if local_cache is None:
+            logger.warning("分布式缓存需要启用本地合成缓存，已跳过")
+            return None
+        if not os.getenv('TTS_PEER_TOKEN'):
+            # 没有令牌时任何客户端都能向缓存写入任意内容，并被所有节点当作合成结果返回
+            logger.warning("分布式缓存需要设置TTS_PEER_TOKEN，已跳过")
+            return None
+        return cls(local_cache, peers, os.getenv('TTS_PEER_SELF') or config['self'], config,
+                   token=os.getenv('TTS_PEER_TOKEN'))
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def owners(self, key: str) -> List[str]:
+        """键的归属节点（不含本节点）"""
+        return [node for node in self.ring.owners(key, self.replication) if node != self.self_url]
+
+    def is_owner(self, key: str) -> bool:
+        return self.self_url in self.ring.owners(key, self.replication)
+
+    def _mark_failed(self, node: str):
+        """读取失败的节点在failure_backoff秒内不再查询"""
+        with self._lock:
+            self.stats['peer_errors'] += 1
+            self._failed_until[node] = time.monotonic() + self.failure_backoff
+
+    def _is_backed_off(self, node: str) -> bool:
+        with self._lock:
+            return self._failed_until.get(node, 0.0) > time.monotonic()
+
+    def fetch(self, key: str, deadline: Optional[float] = None) -> Optional[bytes]:
+        """
+        依次向归属节点读取，命中时写入本地缓存；全部未命中、超时或出错时返回None
+
+        Args:
+            deadline: 请求截止时间，每个节点的超时不超过剩余时间，到期后不再查询
+        """
+        for node in self.owners(key):
+            if self._is_backed_off(node):
+                self._count('peer_skipped')
+                continue
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, remaining(deadline))
+                if timeout <= 0:
+                    break
+            try:
+                response = self.session.get(f"{node}/api/cache/{key}", timeout=timeout)
+            except requests.RequestException as e:
+                self._mark_failed(node)
+                logger.warning(f"读取对等节点缓存失败: {node}, {e}")
+                continue
+            if response.status_code == 200:
+                self._count('peer_hits')
+                self.local_cache.put(key, response.content)
+                return response.content
+            if response.status_code != 404:
+                self._mark_failed(node)
+                logger.warning(f"读取对等节点缓存失败: {node}, HTTP {response.status_code}")
+        self._count('peer_misses')
+        return None
+
+    def replicate(self, key: str, audio_data: bytes):
+        """后台把合成结果复制到归属节点，队列满时放弃（不影响请求）"""
+        for node in self.owners(key):
+            try:
+                self._queue.put_nowait((node, key, audio_data))
+            except queue.Full:
+                self._count('replicate_dropped')
+
+    def _run(self):
+        while True:
+            node, key, audio_data = self._queue.get()
+            try:
+                response = self.session.put(
+                    f"{node}/api/cache/{key}", data=audio_data, timeout=self.timeout * 10,
+                    headers={'Content-Type': 'application/octet-stream'}
+                )
+                if response.status_code in (200, 201):
+                    self._count('replicated_total')
+                else:
+                    self._count('replicate_errors')
+                    logger.warning(f"复制缓存到对等节点失败: {node}, HTTP {response.status_code}")
+            except requests.RequestException as e:
+                self._count('replicate_errors')
+                logger.warning(f"复制缓存到对等节点失败: {node}, {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对等节点读取和复制统计"""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self.stats)
+            backed_off = sorted(node for node, until in self._failed_until.items() if until > now)
+        stats.update({
+            'self': self.self_url,
+            'peers': self.ring.nodes,
+            'replication': self.replication,
+            'backed_off': backed_off,
+            'replicate_queued': self._queue.qsize()
+        })
+        return stats
@@ -0,0 +1,310 @@
+"""
+课文句子预取
+学生听完第N句后几乎总会接着请求第N+1句。根据请求中的 next_texts 提示或已登记的课文顺序，
+在上游空闲时以最低优先级提前合成后续句子，结果在内存中保留一段时间，
+预算受限：队列有界、按字符数限额、只使用空闲槽位，从不与真实请求排队竞争
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+
+from audio_cache import make_cache_key
+from deadline import remaining, expired
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    'lookahead': 2,
+    'workers': 1,
+    'max_queue': 32,
+    'chars_per_minute': 3000,
+    'headroom': 1,
+    'max_wait': 10,
+    'ttl': 120,
+    'warm_max_mb': 64,
+    'inflight_wait': 30,
+    # 每篇课文最多登记的句子数（每句不超过当前模型的max_text_length）
+    'max_lesson_sentences': 1000
+}
+
+
+class WarmStore:
+    """预取结果的短期内存存储，按TTL过期，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            audio, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return audio
+
+    def contains(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def put(self, key: str, audio: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (audio, time.monotonic() + self.ttl)
+            self.total_bytes += len(audio)
+            while self.total_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        audio, _ = self._entries.pop(key)
+        self.total_bytes -= len(audio)
+
+    def purge_expired(self) -> int:
+        """清理过期条目，返回清理数量"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at < now]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LessonStore:
+    """课文句子顺序登记表，保存在SQLite中供所有工作进程共享"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS lessons ("
+            "lesson_id TEXT PRIMARY KEY, sentences TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def register(self, lesson_id: str, sentences: List[str]):
+        """登记（或覆盖）一篇课文的句子顺序"""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO lessons (lesson_id, sentences, updated_at) VALUES (?, ?, ?)",
+            (lesson_id, json.dumps(sentences, ensure_ascii=False), time.time())
+        )
+
+    def get(self, lesson_id: str) -> Optional[List[str]]:
+        row = self._conn().execute("SELECT sentences FROM lessons WHERE lesson_id = ?", (lesson_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, lesson_id: str) -> bool:
+        return self._conn().execute("DELETE FROM lessons WHERE lesson_id = ?", (lesson_id,)).rowcount > 0
+
+
+class Prefetcher:
+    """后台预取器"""
+
+    def __init__(self, tts_service, config: Optional[Dict[str, Any]] = None, lesson_db: Optional[str] = None):
+        self.tts_service = tts_service
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.enabled = self.config['enabled']
+        self.warm = WarmStore(self.config['ttl'], int(self.config['warm_max_mb'] * 1024 * 1024))
+        self.lessons = LessonStore(lesson_db) if lesson_db else None
+
+        self._queue = queue.Queue(maxsize=self.config['max_queue'])
+        self._queued = set()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        # 字符预算令牌桶（每个工作进程独立计算）
+        self._budget = float(self.config['chars_per_minute'])
+        self._budget_updated = time.monotonic()
+
+        self.stats = {
+            'enqueued_total': 0,
+            'completed_total': 0,
+            'failed_total': 0,
+            'skipped_cached_total': 0,
+            'dropped_queue_full_total': 0,
+            'dropped_budget_total': 0,
+            'dropped_stale_total': 0,
+            'chars_total': 0,
+            'hits_total': 0,
+            'inflight_hits_total': 0
+        }
+
+        if self.enabled:
+            for index in range(self.config['workers']):
+                threading.Thread(target=self._run, name=f'prefetch-{index}', daemon=True).start()
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.stats[name] += value
+
+    def next_texts_for(self, context: Dict[str, Any]) -> List[str]:
+        """根据课文上下文 {"lesson_id": ..., "index": N} 取出后续句子"""
+        if not self.lessons or not isinstance(context, dict):
+            return []
+        sentences = self.lessons.get(str(context.get('lesson_id', '')))
+        index = context.get('index')
+        if sentences is None or not isinstance(index, int) or index < 0:
+            return []
+        return sentences[index + 1:index + 1 + self.config['lookahead']]
+
+    def schedule(self, texts: List[str], voice: Optional[str] = None, format: Optional[str] = None,
+                 sample_rate: Optional[int] = None) -> int:
+        """提交预取任务（不阻塞），返回实际入队的句子数"""
+        if not self.enabled:
+            return 0
+        accepted = 0
+        for text in texts[:self.config['lookahead']]:
+            if not isinstance(text, str):
+                continue
+            params = self.tts_service._resolve_params(text, voice, format, sample_rate)
+            if not params['success']:
+                continue
+            key = make_cache_key(params['model'], params['voice'], params['format'], params['sample_rate'], text)
+            if self.warm.contains(key) or (self.tts_service.cache and self.tts_service.cache.contains(key)):
+                self._count('skipped_cached_total')
+                continue
+            with self._lock:
+                if key in self._queued or key in self._inflight:
+                    continue
+                self._queued.add(key)
+            try:
+                self._queue.put_nowait((key, params, time.monotonic()))
+            except queue.Full:
+                with self._lock:
+                    self._queued.discard(key)
+                    self.stats['dropped_queue_full_total'] += 1
+                continue
+            self._count('enqueued_total')
+            accepted += 1
+        return accepted
+
+    def lookup(self, key: str, deadline: Optional[float] = None) -> Optional[bytes]:
+        """
+        请求路径查询预取结果
+
+        该句正在预取时等待其完成（最多inflight_wait秒，且不超过截止时间），避免重复调用上游
+
+        Raises:
+            TimeoutError: 等待预取期间超过截止时间
+        """
+        audio = self.warm.get(key)
+        if audio is not None:
+            self._count('hits_total')
+            return audio
+        with self._lock:
+            done = self._inflight.get(key)
+        if done is None:
+            return None
+        timeout = self.config['inflight_wait']
+        if deadline is not None:
+            timeout = min(timeout, remaining(deadline))
+        if not done.wait(timeout):
+            if expired(deadline):
+                raise TimeoutError('等待预取结果超过截止时间')
+            return None
+        audio = self.warm.get(key)
+        if audio is not None:
+            self._count('inflight_hits_total')
+        return audio
+
+    def _take_budget(self, chars: int) -> bool:
+        """从字符预算中扣除，预算不足时返回False"""
+        rate = self.config['chars_per_minute'] / 60.0
+        with self._lock:
+            now = time.monotonic()
+            self._budget = min(float(self.config['chars_per_minute']),
+                               self._budget + (now - self._budget_updated) * rate)
+            self._budget_updated = now
+            if self._budget < chars:
+                return False
+            self._budget -= chars
+            return True
+
+    def _run(self):
+        while True:
+            key, params, enqueued_at = self._queue.get()
+            try:
+                self._prefetch(key, params, enqueued_at)
+            except Exception as e:
+                logger.error(f"预取任务异常: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
+
+    def _prefetch(self, key: str, params: Dict[str, Any], enqueued_at: float):
+        """
+        等待空闲槽位后合成一句，排队过久或超出预算则放弃
+
+        拿到槽位后才登记为进行中，请求路径只会等待真正在调用上游的预取
+        """
+        scheduler = self.tts_service.schedulers[params['model']]
+        while True:
+            if time.monotonic() - enqueued_at > self.config['max_wait']:
+                self._count('dropped_stale_total')
+                return
+            ticket = scheduler.try_acquire('prefetch', self.config['headroom'])
+            if ticket is not None:
+                break
+            time.sleep(0.05)
+
+        if not self._take_budget(len(params['text'])):
+            scheduler.release(ticket)
+            self._count('dropped_budget_total')
+            return
+
+        done = threading.Event()
+        with self._lock:
+            self._inflight[key] = done
+        result = {'success': False}
+        try:
+            result = self.tts_service._synthesize_audio(dict(params, priority='prefetch'), prefetch=True)
+        finally:
+            scheduler.release(ticket)
+            if result['success']:
+                self.warm.put(key, result['audio'])
+            with self._lock:
+                self._inflight.pop(key, None)
+                if result['success']:
+                    self.stats['completed_total'] += 1
+                    self.stats['chars_total'] += len(params['text'])
+                else:
+                    self.stats['failed_total'] += 1
+            done.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预取统计"""
+        self.warm.purge_expired()
+        with self._lock:
+            stats = dict(self.stats)
+            stats['inflight'] = len(self._inflight)
+        stats.update({
+            'enabled': self.enabled,
+            'queued': self._queue.qsize(),
+            'warm_entries': len(self.warm),
+            'warm_bytes': self.warm.total_bytes,
+            'budget_chars_per_minute': self.config['chars_per_minute']
+        })
+        return stats
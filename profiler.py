@@ -0,0 +1,191 @@
+"""
+运行时诊断
+按需运行的采样式调用栈分析（输出可直接用于flamegraph.pl的折叠栈格式）、
+tracemalloc内存分配统计，以及在途请求按处理阶段的分布。
+未运行分析时只有请求阶段登记的开销（每个阶段一次字典写入）
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, Optional, List
+
+
+class RequestTracker:
+    """记录每个请求线程当前所处的处理阶段"""
+
+    def __init__(self):
+        # 线程ID -> [接口名, 阶段, 请求开始时间, 阶段开始时间, {已结束阶段: 累计秒数}]
+        self._active: Dict[int, list] = {}
+
+    def begin(self, endpoint: Optional[str]):
+        now = time.monotonic()
+        self._active[threading.get_ident()] = [endpoint or 'unknown', 'received', now, now, {}]
+
+    def set_stage(self, stage: str):
+        """更新当前线程所处阶段，非请求线程（如预取线程）调用时忽略"""
+        entry = self._active.get(threading.get_ident())
+        if entry is not None:
+            now = time.monotonic()
+            durations = entry[4]
+            durations[entry[1]] = durations.get(entry[1], 0.0) + now - entry[3]
+            entry[1] = stage
+            entry[3] = now
+
+    def timings(self) -> Optional[Dict[str, Any]]:
+        """当前线程的请求已用时间和各阶段耗时（毫秒），非请求线程返回None"""
+        entry = self._active.get(threading.get_ident())
+        if entry is None:
+            return None
+        now = time.monotonic()
+        durations = dict(entry[4])
+        durations[entry[1]] = durations.get(entry[1], 0.0) + now - entry[3]
+        return {
+            'elapsed_ms': round((now - entry[2]) * 1000, 2),
+            'stages': {stage: round(seconds * 1000, 2) for stage, seconds in durations.items()}
+        }
+
+    def end(self):
+        self._active.pop(threading.get_ident(), None)
+
+    def stage_of(self, thread_id: int) -> Optional[str]:
+        entry = self._active.get(thread_id)
+        return entry[1] if entry else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """在途请求按接口和阶段的分布，以及停留最久的请求"""
+        now = time.monotonic()
+        entries = list(self._active.values())
+        by_stage = Counter(entry[1] for entry in entries)
+        by_endpoint = Counter(entry[0] for entry in entries)
+        oldest = sorted(entries, key=lambda entry: entry[2])[:10]
+        return {
+            'total': len(entries),
+            'by_stage': dict(by_stage),
+            'by_endpoint': dict(by_endpoint),
+            'oldest': [
+                {
+                    'endpoint': endpoint,
+                    'stage': stage,
+                    'elapsed_ms': round((now - started) * 1000, 1),
+                    'stage_elapsed_ms': round((now - stage_started) * 1000, 1)
+                }
+                for endpoint, stage, started, stage_started, _ in oldest
+            ]
+        }
+
+
+# 全局请求阶段登记表
+request_tracker = RequestTracker()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """基于sys._current_frames的采样分析器，同一时间只允许一个分析任务"""
+
+    def __init__(self, tracker: Optional[RequestTracker] = None):
+        self.tracker = tracker
+        self._running = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005, top: int = 20,
+                trace_memory: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        在调用线程中采样指定时长
+
+        Args:
+            seconds: 采样时长（秒）
+            interval: 采样间隔（秒）
+            top: 返回的内存分配排行条数
+            trace_memory: 是否在采样期间开启tracemalloc
+
+        Returns:
+            分析结果，已有分析任务在运行时返回None
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            return self._profile(seconds, interval, top, trace_memory)
+        finally:
+            self._running.release()
+
+    def _profile(self, seconds, interval, top, trace_memory) -> Dict[str, Any]:
+        started_tracing = False
+        before = None
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(16)
+                started_tracing = True
+            before = tracemalloc.take_snapshot()
+
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        stage_samples = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        started = time.monotonic()
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                root = names.get(thread_id, str(thread_id))
+                stage = self.tracker.stage_of(thread_id) if self.tracker else None
+                if stage:
+                    root = f"{root} [{stage}]"
+                    stage_samples[stage] += 1
+                labels.append(root)
+                stacks[';'.join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+        elapsed = time.monotonic() - started
+
+        memory = None
+        if trace_memory:
+            # 排除分析器自身的分配
+            own_filters = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+            before = before.filter_traces(own_filters)
+            after = tracemalloc.take_snapshot().filter_traces(own_filters)
+            current, peak = tracemalloc.get_traced_memory()
+            memory = {
+                'traced_current_bytes': current,
+                'traced_peak_bytes': peak,
+                'top_allocators': self._format_stats(after.statistics('lineno')[:top]),
+                'top_growth': self._format_stats(
+                    [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0][:top]
+                ),
+                # 本次才开启的追踪只能看到采样期间的新分配
+                'tracing_window_only': started_tracing
+            }
+            if started_tracing:
+                tracemalloc.stop()
+
+        return {
+            'seconds': round(elapsed, 3),
+            'samples': samples,
+            'collapsed': '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()),
+            # 采样期间请求线程在各阶段被观察到的次数
+            'stage_samples': dict(stage_samples),
+            'tracemalloc': memory
+        }
+
+    @staticmethod
+    def _format_stats(stats) -> List[Dict[str, Any]]:
+        result = []
+        for stat in stats:
+            frame = stat.traceback[0]
+            item = {'location': f"{frame.filename}:{frame.lineno}", 'size_bytes': stat.size, 'count': stat.count}
+            if hasattr(stat, 'size_diff'):
+                item['size_diff_bytes'] = stat.size_diff
+            result.append(item)
+        return result
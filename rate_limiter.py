@@ -0,0 +1,155 @@
+"""
+按租户的令牌桶限流
+每个租户（客户端API Key或IP）同时受请求数/秒和字符数/秒两个令牌桶约束，
+桶状态保存在mmap共享内存文件中，同一主机上的所有工作进程共同执行同一额度
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TTSRL001'
+HEADER = struct.Struct('<8sI')
+# 槽位: 租户摘要(16字节) + 请求令牌 + 字符令牌 + 上次更新时间
+SLOT = struct.Struct('<16sddd')
+EMPTY_DIGEST = b'\x00' * 16
+# 线性探测的最大步数，超过后复用其中最久未使用的槽位
+MAX_PROBES = 32
+
+DEFAULT_LIMITS = {
+    'requests_per_second': 10,
+    'request_burst': 20,
+    'chars_per_second': 5000,
+    'char_burst': 20000
+}
+
+
+def shared_memory_path(name: str = 'aienglish_tts_ratelimit') -> str:
+    """共享状态文件路径：默认放在/dev/shm（内存文件系统），不存在时使用临时目录"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, name)
+
+
+class SharedRateLimiter:
+    """跨进程共享的令牌桶限流器"""
+
+    def __init__(self, config: Dict[str, Any], path: Optional[str] = None, slots: int = 4096):
+        self.enabled = config.get('enabled', True)
+        self.default_limits = dict(DEFAULT_LIMITS, **config.get('default', {}))
+        self.tenant_limits = {
+            tenant: dict(self.default_limits, **limits)
+            for tenant, limits in config.get('tenants', {}).items()
+        }
+        self.path = path or shared_memory_path()
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._fd = None
+        self._map = None
+        if self.enabled:
+            self._open()
+
+    def _open(self):
+        """打开（必要时初始化）共享内存文件"""
+        size = HEADER.size + SLOT.size * self.slots
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            magic, slots = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or slots != self.slots:
+                self._map[:] = b'\x00' * size
+                HEADER.pack_into(self._map, 0, MAGIC, self.slots)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def get_limits(self, tenant: str) -> Dict[str, float]:
+        """获取租户的限流配置"""
+        return self.tenant_limits.get(tenant, self.default_limits)
+
+    def is_known_tenant(self, tenant: str) -> bool:
+        """租户是否在配置中单独登记"""
+        return tenant in self.tenant_limits
+
+    def _find_slot(self, digest: bytes) -> Tuple[int, bool]:
+        """查找租户槽位，返回 (偏移量, 是否为新槽位)"""
+        start = int.from_bytes(digest[:4], 'little') % self.slots
+        oldest_offset, oldest_time = None, None
+        for probe in range(min(MAX_PROBES, self.slots)):
+            offset = HEADER.size + ((start + probe) % self.slots) * SLOT.size
+            slot_digest, _, _, updated_at = SLOT.unpack_from(self._map, offset)
+            if slot_digest == digest:
+                return offset, False
+            if slot_digest == EMPTY_DIGEST:
+                return offset, True
+            if oldest_time is None or updated_at < oldest_time:
+                oldest_offset, oldest_time = offset, updated_at
+        return oldest_offset, True
+
+    def check(self, tenant: str, chars: int) -> Tuple[bool, Dict[str, Any]]:
+        """
+        检查并扣减令牌
+
+        Returns:
+            (是否放行, 限流信息)，两个令牌桶都充足时才会同时扣减。
+            字符数超过char_burst的请求在字符桶满时放行并按实际字符数扣减，
+            桶余额变为负数，之后的请求需等到欠额按chars_per_second补回
+        """
+        if not self.enabled:
+            return True, {}
+
+        limits = self.get_limits(tenant)
+        request_rate = limits['requests_per_second']
+        request_burst = limits['request_burst']
+        char_rate = limits['chars_per_second']
+        char_burst = limits['char_burst']
+        digest = hashlib.blake2b(tenant.encode('utf-8'), digest_size=16).digest()
+
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                offset, is_new = self._find_slot(digest)
+                if is_new:
+                    request_tokens, char_tokens = float(request_burst), float(char_burst)
+                else:
+                    _, request_tokens, char_tokens, updated_at = SLOT.unpack_from(self._map, offset)
+                    elapsed = max(0.0, now - updated_at)
+                    request_tokens = min(request_burst, request_tokens + elapsed * request_rate)
+                    char_tokens = min(char_burst, char_tokens + elapsed * char_rate)
+
+                # 大请求只需一个满桶即可放行，否则永远无法通过
+                allowed = request_tokens >= 1 and char_tokens >= min(chars, char_burst)
+                if allowed:
+                    request_tokens -= 1
+                    char_tokens -= chars
+                SLOT.pack_into(self._map, offset, digest, request_tokens, char_tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        # 距离令牌补足所需的秒数
+        retry_after = 0.0
+        if not allowed:
+            retry_after = max(
+                (1 - request_tokens) / request_rate if request_tokens < 1 else 0.0,
+                (min(chars, char_burst) - char_tokens) / char_rate if char_tokens < min(chars, char_burst) else 0.0
+            )
+        return allowed, {
+            'limit': request_burst,
+            'remaining': int(request_tokens),
+            'reset': round((request_burst - request_tokens) / request_rate, 3),
+            'limit_chars': char_burst,
+            'remaining_chars': max(0, int(char_tokens)),
+            'reset_chars': round((char_burst - char_tokens) / char_rate, 3),
+            'retry_after': round(retry_after, 3)
+        }
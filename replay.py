@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+流量回放与性能对比工具
+把 TTS_CAPTURE_FILE 采集到的请求按原始节奏（或加速）重新发送给服务，
+记录延迟和吞吐分布，并比较两次回放结果以发现性能回退
+
+用法:
+    # 回放到已启动的服务（服务端应以 TTS_UPSTREAM=stub 启动）
+    python replay.py run capture.jsonl --url http://127.0.0.1:5000 --speed 10 -o new.json
+
+    # 在指定代码目录中自动启动一个使用替身上游的服务实例并回放
+    python replay.py run capture.jsonl --spawn ../AIEnglish-main --speed max -o base.json
+
+    # 比较两次回放结果，出现回退时退出码为1
+    python replay.py compare base.json new.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import requests
+
+ENDPOINTS = {
+    'synthesize': '/api/synthesize',
+    'file': '/api/synthesize/file'
+}
+
+# 回放文本使用的词表，只要求长度和重复关系与原始流量一致
+WORDS = ('the quick brown fox jumps over a lazy dog while students practice '
+         'reading english sentences aloud every morning before class starts').split()
+
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """读取采集文件，按到达时间排序，并把时间换算为相对第一条请求的偏移"""
+    records = []
+    fields = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                fields = item['fields']
+                continue
+            if fields is None:
+                raise ValueError(f"采集文件缺少表头: {path}")
+            records.append(dict(zip(fields, item)))
+
+    records.sort(key=lambda record: record['timestamp'])
+    if limit:
+        records = records[:limit]
+    if records:
+        start = records[0]['timestamp']
+        for record in records:
+            record['offset'] = record['timestamp'] - start
+    return records
+
+
+def make_text(text_hash: str, length: int) -> str:
+    """根据文本摘要确定性地生成指定长度的文本，相同摘要生成相同文本"""
+    rng = random.Random(text_hash)
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    text = ' '.join(words)[:length].rstrip()
+    return text + 'a' * (length - len(text))
+
+
+def _percentile(sorted_values, percent: float) -> Optional[float]:
+    """计算已排序序列的百分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Optional[float]]:
+    """延迟分布摘要（毫秒）"""
+    values = sorted(values)
+    summary = {f'p{p}': _percentile(values, p) for p in (50, 90, 95, 99)}
+    summary['max'] = values[-1] if values else None
+    summary['mean'] = sum(values) / len(values) if values else None
+    return {name: round(value * 1000, 1) if value is not None else None for name, value in summary.items()}
+
+
+class Replayer:
+    """按采集节奏发送请求并记录每个请求的结果"""
+
+    def __init__(self, base_url: str, speed: Optional[float] = 1.0, concurrency: int = 32, timeout: float = 60):
+        """
+        Args:
+            base_url: 服务地址
+            speed: 回放倍速，None表示不等待，以最大速度发送（仍受并发数限制）
+            concurrency: 最大并发请求数
+            timeout: 单个请求超时（秒）
+        """
+        self.base_url = base_url.rstrip('/')
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, record: Dict[str, Any], scheduled_at: float) -> List:
+        payload = {
+            'text': make_text(record['text_hash'], record['text_length']),
+            'voice': record['voice'],
+            'format': record['format'],
+            'sample_rate': record['sample_rate']
+        }
+        headers = {'X-Priority': record['priority']} if record.get('priority') else None
+        url = self.base_url + ENDPOINTS.get(record['endpoint'], ENDPOINTS['synthesize'])
+        started = time.perf_counter()
+        try:
+            response = self._session().post(url, json=payload, headers=headers, timeout=self.timeout)
+            status = response.status_code
+            size = len(response.content)
+        except requests.RequestException:
+            status = 0
+            size = 0
+        finished = time.perf_counter()
+        # [计划发送时间, 实际发送延后, 延迟, 状态码, 响应字节数]
+        return [round(scheduled_at, 4), round(started - scheduled_at, 4), round(finished - started, 4), status, size]
+
+    def run(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """回放全部请求，返回结果摘要和逐请求样本"""
+        futures = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for record in records:
+                if self.speed:
+                    delay = start + record['offset'] / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                futures.append(executor.submit(self._send, record, time.perf_counter() - start))
+            samples = [future.result() for future in futures]
+        wall_time = time.perf_counter() - start
+
+        ok = [sample for sample in samples if 200 <= sample[3] < 300]
+        return {
+            'speed': self.speed or 'max',
+            'concurrency': self.concurrency,
+            'requests': len(samples),
+            'errors': len(samples) - len(ok),
+            'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+            'wall_time': round(wall_time, 3),
+            'throughput': round(len(ok) / wall_time, 2) if wall_time else 0.0,
+            'latency_ms': summarize_latencies([sample[2] for sample in ok]),
+            'send_lag_ms': summarize_latencies([sample[1] for sample in samples]),
+            'samples': samples
+        }
+
+
+def spawn_service(app_dir: str, port: int, cache_dir: str, startup_timeout: float = 30) -> subprocess.Popen:
+    """在指定代码目录启动使用替身上游的服务实例（使用cache_dir作为独立缓存目录，关闭限流和探测）"""
+    env = dict(os.environ)
+    env.update({
+        'HOST': '127.0.0.1',
+        'PORT': str(port),
+        'DEBUG': 'False',
+        'TTS_UPSTREAM': 'stub',
+        'TTS_CACHE_DIR': cache_dir,
+        'TTS_RATE_LIMIT_ENABLED': 'false',
+        'TTS_PROBE_INTERVAL': '0',
+        'TTS_CAPTURE_FILE': ''
+    })
+    env.setdefault('DASHSCOPE_API_KEY', 'stub')
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=app_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程启动失败，退出码: {process.returncode}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/api/health', timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    process.wait(10)
+    raise RuntimeError(f"服务在{startup_timeout}秒内未就绪")
+
+
+def ks_statistic(a: List[float], b: List[float]) -> Optional[float]:
+    """两组样本经验分布的最大差距（Kolmogorov-Smirnov统计量）"""
+    if not a or not b:
+        return None
+    a, b = sorted(a), sorted(b)
+    i = j = 0
+    distance = 0.0
+    while i < len(a) and j < len(b):
+        value = min(a[i], b[j])
+        while i < len(a) and a[i] <= value:
+            i += 1
+        while j < len(b) and b[j] <= value:
+            j += 1
+        distance = max(distance, abs(i / len(a) - j / len(b)))
+    return round(distance, 4)
+
+
+def compare_results(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float = 0.1) -> Dict[str, Any]:
+    """
+    比较两次回放结果
+
+    延迟百分位上升或吞吐下降超过threshold（相对比例），或错误率上升超过1个百分点，
+    即视为回退
+    """
+    rows = []
+    regressions = []
+    for name in ('p50', 'p90', 'p95', 'p99', 'max', 'mean'):
+        base = baseline['latency_ms'].get(name)
+        new = candidate['latency_ms'].get(name)
+        change = (new - base) / base if base and new is not None else None
+        rows.append({'metric': f'latency {name} (ms)', 'baseline': base, 'candidate': new, 'change': change})
+        # max对单个慢请求过于敏感，只展示不判定
+        if change is not None and change > threshold and name != 'max':
+            regressions.append(f'latency {name}')
+
+    base, new = baseline['throughput'], candidate['throughput']
+    change = (new - base) / base if base else None
+    rows.append({'metric': 'throughput (req/s)', 'baseline': base, 'candidate': new, 'change': change})
+    if change is not None and change < -threshold:
+        regressions.append('throughput')
+
+    base, new = baseline['error_rate'], candidate['error_rate']
+    rows.append({'metric': 'error rate', 'baseline': base, 'candidate': new, 'change': new - base})
+    if new - base > 0.01:
+        regressions.append('error rate')
+
+    return {
+        'rows': rows,
+        'ks_latency': ks_statistic(
+            [sample[2] for sample in baseline['samples'] if 200 <= sample[3] < 300],
+            [sample[2] for sample in candidate['samples'] if 200 <= sample[3] < 300]
+        ),
+        'regressions': regressions
+    }
+
+
+def _parse_speed(value: str) -> Optional[float]:
+    if value == 'max':
+        return None
+    speed = float(value.rstrip('x'))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError('倍速必须大于0')
+    return speed
+
+
+def cmd_run(args) -> int:
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        print("采集文件中没有请求记录")
+        return 1
+
+    # 启动的服务实例使用临时缓存目录，停止后删除
+    cache_dir = tempfile.mkdtemp(prefix='replay-cache-') if args.spawn else None
+    process = None
+    base_url = f'http://127.0.0.1:{args.port}' if args.spawn else args.url
+    try:
+        if args.spawn:
+            process = spawn_service(args.spawn, args.port, cache_dir)
+        print(f"回放 {len(records)} 个请求 -> {base_url}，倍速={args.speed or 'max'}，并发={args.concurrency}")
+        result = Replayer(base_url, args.speed, args.concurrency, args.timeout).run(records)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(10)
+        if cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    result['capture'] = os.path.abspath(args.capture)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+    print(f"完成: 成功 {result['requests'] - result['errors']}/{result['requests']}，"
+          f"吞吐 {result['throughput']} req/s，延迟 {result['latency_ms']}")
+    print(f"结果已保存: {args.output}")
+    return 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+    if baseline.get('capture') != candidate.get('capture') or baseline.get('speed') != candidate.get('speed'):
+        print("警告: 两次回放使用的采集文件或倍速不同，结果不可直接比较")
+
+    report = compare_results(baseline, candidate, args.threshold)
+    print(f"{'指标':<24}{'基线':>12}{'候选':>12}{'变化':>10}")
+    for row in report['rows']:
+        change = '' if row['change'] is None else f"{row['change']:+.1%}"
+        print(f"{row['metric']:<24}{str(row['baseline']):>12}{str(row['candidate']):>12}{change:>10}")
+    print(f"延迟分布KS统计量: {report['ks_latency']}")
+
+    if report['regressions']:
+        print(f"性能回退: {', '.join(report['regressions'])}")
+        return 1
+    print("未发现性能回退")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TTS服务流量回放与性能对比')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='回放采集文件')
+    run.add_argument('capture', help='TTS_CAPTURE_FILE采集的文件')
+    run.add_argument('--url', default='http://127.0.0.1:5000', help='服务地址')
+    run.add_argument('--spawn', metavar='APP_DIR', help='在该代码目录启动使用替身上游的服务实例')
+    run.add_argument('--port', type=int, default=5055, help='--spawn启动实例的端口')
+    run.add_argument('--speed', type=_parse_speed, default=1.0, help='回放倍速，如1、10或max')
+    run.add_argument('--concurrency', type=int, default=32, help='最大并发请求数')
+    run.add_argument('--timeout', type=float, default=60, help='单个请求超时（秒）')
+    run.add_argument('--limit', type=int, help='只回放前N个请求')
+    run.add_argument('-o', '--output', default='replay_result.json', help='结果文件')
+    run.set_defaults(func=cmd_run)
+
+    compare = subparsers.add_parser('compare', help='比较两次回放结果')
+    compare.add_argument('baseline', help='基线版本的回放结果')
+    compare.add_argument('candidate', help='候选版本的回放结果')
+    compare.add_argument('--threshold', type=float, default=0.1, help='判定回退的相对变化阈值')
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
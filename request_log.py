@@ -0,0 +1,177 @@
+"""
+异步结构化日志
+应用日志和请求日志都先放入有界队列，由后台QueueListener线程格式化并写出，请求线程不再争用输出流的锁；
+队列满时丢弃而不是阻塞。每个请求输出一条JSONL记录（耗时、各阶段耗时、模型、音色、文本长度、字节数、缓存结果），
+两类日志都支持按级别采样
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+DEFAULT_CONFIG = {
+    'level': 'INFO',
+    'queue_size': 10000,
+    # 各级别保留比例（1.0为全部保留），未列出的级别全部保留
+    'sampling': {},
+    'request_log': True,
+    'request_sampling': {}
+}
+
+REQUEST_LOGGER_NAME = 'tts.requests'
+
+
+def _level_rates(sampling: Dict[str, float]) -> Dict[int, float]:
+    return {logging.getLevelName(level.upper()): float(rate) for level, rate in sampling.items()}
+
+
+class _LevelSampler(logging.Filter):
+    """按级别随机采样"""
+
+    def __init__(self, sampling: Dict[str, float]):
+        super().__init__()
+        self.rates = _level_rates(sampling)
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志的QueueHandler，消息格式化推迟到后台线程"""
+
+    def __init__(self, log_queue: queue.Queue, sampling: Dict[str, float]):
+        super().__init__(log_queue)
+        self.sampler = _LevelSampler(sampling)
+        self.addFilter(self.sampler)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一进程内的队列不需要序列化，由监听线程的处理器负责格式化
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'queued': self.queue.qsize(),
+            'enqueued_total': self.enqueued,
+            'dropped_total': self.dropped,
+            'sampled_out_total': self.sampler.sampled_out
+        }
+
+
+class JsonLineFormatter(logging.Formatter):
+    """请求记录（字典消息）格式化为单行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname
+        }
+        if isinstance(record.msg, dict):
+            entry.update(record.msg)
+        else:
+            entry['message'] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """应用日志和请求日志的异步输出管道"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, request_log_path: Optional[str] = None):
+        """
+        Args:
+            config: 日志级别、队列大小和采样配置
+            request_log_path: 请求日志文件路径，未指定时输出到标准输出
+        """
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.request_log_path = request_log_path
+        self.request_logger = logging.getLogger(REQUEST_LOGGER_NAME)
+        self._handlers: Dict[str, _DroppingQueueHandler] = {}
+        self._listeners = []
+        self._installed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> 'LogPipeline':
+        """根据model_config.json中的logging配置创建，TTS_LOG_LEVEL和TTS_REQUEST_LOG环境变量优先"""
+        config = dict(config or {})
+        if os.getenv('TTS_LOG_LEVEL'):
+            config['level'] = os.getenv('TTS_LOG_LEVEL')
+        return cls(config, request_log_path=os.getenv('TTS_REQUEST_LOG'))
+
+    def _start(self, name: str, sampling: Dict[str, float], *handlers: logging.Handler) -> _DroppingQueueHandler:
+        log_queue = queue.Queue(maxsize=self.config['queue_size'])
+        queue_handler = _DroppingQueueHandler(log_queue, sampling)
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        self._handlers[name] = queue_handler
+        self._listeners.append(listener)
+        return queue_handler
+
+    def install(self):
+        """把根日志器现有的处理器移到后台线程，并创建请求日志输出"""
+        with self._lock:
+            if self._installed:
+                return
+            self._installed = True
+
+        root = logging.getLogger()
+        root.setLevel(self.config['level'].upper())
+        # 只接管输出到流和文件的处理器，其他处理器（如测试框架的日志捕获）保持原样
+        handlers = [handler for handler in root.handlers
+                    if type(handler) in (logging.StreamHandler, logging.FileHandler)]
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(self._start('app', self.config['sampling'], *(handlers or [logging.StreamHandler()])))
+
+        self.request_logger.propagate = False
+        self.request_logger.setLevel(logging.INFO)
+        if self.config['request_log']:
+            if self.request_log_path:
+                sink = logging.FileHandler(self.request_log_path, encoding='utf-8')
+            else:
+                sink = logging.StreamHandler(sys.stdout)
+            sink.setFormatter(JsonLineFormatter())
+            self.request_logger.addHandler(self._start('requests', self.config['request_sampling'], sink))
+        else:
+            self.request_logger.disabled = True
+        atexit.register(self.close)
+
+    def log_request(self, fields: Dict[str, Any], status: int):
+        """输出一条请求记录：5xx为ERROR、4xx为WARNING、其余为INFO（用于按级别采样）"""
+        level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+        self.request_logger.log(level, fields)
+
+    def close(self):
+        """停止后台线程（会先写出队列中剩余的日志）"""
+        listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            try:
+                listener.stop()
+            except queue.Full:
+                # 队列已满，无法放入结束标记，后台线程随进程退出
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各日志队列的积压、丢弃和采样统计"""
+        return {name: handler.get_stats() for name, handler in self._handlers.items()}
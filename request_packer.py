@@ -0,0 +1,295 @@
+"""
+短文本请求打包
+词汇练习会发出大量只有一到三个词的请求，每个都要完整地往返一次上游。开启后，同一模型、音色、
+格式和采样率的短文本在几毫秒的收集窗口内合并为一个SSML请求（各项之间插入固定时长的停顿），
+返回的音频按静音检测切分回每一项，分别写入缓存并交给各自的等待者。
+切分结果与项数不符或上游失败时，各请求回退为单独调用
+"""
+
+import io
+import os
+import wave
+import logging
+import threading
+from functools import partial
+from xml.sax.saxutils import escape
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+import numpy as np
+
+from deadline import remaining
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': False,
+    # 支持SSML的模型，None表示全部
+    'models': None,
+    'window_ms': 5,
+    'max_items': 16,
+    'max_chars': 24,
+    'break_ms': 800,
+    'min_gap_ms': 400,
+    'padding_ms': 150,
+    'silence_db': -45,
+    'wait_timeout': 30
+}
+
+# 静音检测的帧长
+FRAME_MS = 10
+
+
+def build_ssml(texts: List[str], break_ms: int) -> str:
+    """把多段文本拼接为以停顿分隔的SSML"""
+    separator = f'<break time="{int(break_ms)}ms"/>'
+    return '<speak>' + separator.join(escape(text) for text in texts) + '</speak>'
+
+
+def split_audio(audio: bytes, count: int, min_gap_ms: float, padding_ms: float,
+                silence_db: float) -> Optional[List[bytes]]:
+    """
+    按最长的count-1段内部静音把16位PCM WAV切分为count段，每段首尾保留padding_ms静音
+
+    Returns:
+        各段WAV，不是可处理的WAV或找不到足够的停顿时返回None
+    """
+    try:
+        with wave.open(io.BytesIO(audio), 'rb') as wav:
+            channels, sample_width, sample_rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if sample_width != 2:
+        return None
+
+    samples = np.frombuffer(frames, dtype='<i2')
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    frame_len = max(1, sample_rate * FRAME_MS // 1000)
+    frame_count = len(samples) // frame_len
+    if frame_count == 0:
+        return None
+
+    # 每帧平均能量（dBFS）低于阈值视为静音，找出所有静音段
+    energy = np.square(samples[:frame_count * frame_len].astype(np.float32) / 32768.0)
+    energy = energy.reshape(frame_count, -1).mean(axis=1)
+    silent = energy < 10 ** (silence_db / 10)
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+
+    # 只考虑足够长的内部静音（不含首尾），取最长的count-1段作为分隔
+    candidates = np.flatnonzero((starts > 0) & (ends < frame_count) & (lengths >= min_gap_ms / FRAME_MS))
+    if len(candidates) < count - 1:
+        return None
+    gaps = np.sort(candidates[np.argsort(lengths[candidates], kind='stable')[::-1][:count - 1]])
+
+    padding = np.minimum(int(padding_ms / FRAME_MS), lengths[gaps] // 2)
+    cut_starts = np.concatenate(([0], ends[gaps] - padding)) * frame_len
+    cut_ends = np.concatenate(((starts[gaps] + padding) * frame_len, [len(samples)]))
+
+    clips = []
+    for start, end in zip(cut_starts, cut_ends):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(sample_width)
+            wav.setframerate(sample_rate)
+            wav.writeframes(samples[start:end].tobytes())
+        clips.append(buffer.getvalue())
+    return clips
+
+
+class _Item:
+    def __init__(self, text: str):
+        self.text = text
+        self.audio: Optional[bytes] = None
+        self.done = threading.Event()
+
+
+class _Batch:
+    def __init__(self):
+        # 缓存键 -> 待合成项（同一批内的重复文本共用一项）
+        self.items: Dict[str, _Item] = {}
+        self.full = threading.Event()
+
+
+class RequestPacker:
+    """短文本打包器：每个收集窗口中第一个到达的请求负责发出合并后的上游调用"""
+
+    def __init__(self, tts_service, config: Optional[Dict[str, Any]] = None):
+        self.tts_service = tts_service
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.enabled = self.config['enabled']
+        self._open: Dict[Tuple, _Batch] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'batches_total': 0,
+            'packed_items_total': 0,
+            'unpacked_total': 0,
+            'upstream_calls_saved_total': 0,
+            'upstream_failures_total': 0,
+            'split_failures_total': 0,
+            'wait_timeouts_total': 0,
+            'deadline_fallbacks_total': 0
+        }
+
+    @classmethod
+    def from_config(cls, tts_service, config: Optional[Dict[str, Any]] = None) -> 'RequestPacker':
+        """根据model_config.json中的packing配置创建，TTS_PACKING_ENABLED环境变量优先"""
+        config = dict(config or {})
+        if os.getenv('TTS_PACKING_ENABLED'):
+            config['enabled'] = os.getenv('TTS_PACKING_ENABLED').lower() == 'true'
+        return cls(tts_service, config)
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.stats[name] += value
+
+    def accepts(self, params: Dict[str, Any]) -> bool:
+        """是否可以打包：已启用、模型支持SSML、WAV格式（切分需要PCM）且文本足够短"""
+        models = self.config['models']
+        return (self.enabled
+                and (models is None or params['model'] in models)
+                and params['format'] == 'wav'
+                and len(params['text']) <= self.config['max_chars'])
+
+    def submit(self, params: Dict[str, Any], cache_key: str, priority: Optional[str] = None,
+               deadline: Optional[float] = None) -> Optional[bytes]:
+        """
+        加入当前收集窗口并等待合并合成的结果
+
+        Returns:
+            本项的音频，窗口内只有这一项或合并合成失败时返回None（由调用方单独合成）
+
+        Raises:
+            TimeoutError: 超过截止时间仍未得到结果
+        """
+        key = (params['model'], params['voice'], params['format'], params['sample_rate'])
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            item = batch.items.get(cache_key)
+            if item is None:
+                item = batch.items[cache_key] = _Item(params['text'])
+            if len(batch.items) >= self.config['max_items']:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.config['window_ms'] / 1000)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._run(key, batch, priority, deadline)
+
+        timeout = remaining(deadline)
+        if not item.done.wait(self.config['wait_timeout'] if timeout is None else timeout):
+            self._count('wait_timeouts_total')
+            raise TimeoutError('等待打包合成结果超时')
+        return item.audio
+
+    def _run(self, key: Tuple, batch: _Batch, priority: Optional[str], deadline: Optional[float]):
+        """
+        为合并后的上游调用排队占用调度槽位，再发出调用
+
+        与单独合成一样，排队最多等到领头请求截止时间前预计上游耗时的位置，等不到时各请求回退为单独合成；
+        领头请求有截止时间时上游调用在执行器中进行，领头请求只等到截止时间，调用完成后结果仍交给其他等待者
+        """
+        items = list(batch.items.items())
+        if len(items) < 2:
+            self._count('unpacked_total')
+            self._finish(items)
+            return
+
+        model_name, voice = key[0], key[1]
+        scheduler = self.tts_service.schedulers[model_name]
+        timeout = remaining(deadline)
+        expected = self.tts_service.latency_model.expected_latency(
+            model_name, voice, sum(len(item.text) for _, item in items)
+        )
+        if timeout is not None and expected is not None:
+            timeout -= expected
+        try:
+            if timeout is not None and timeout <= 0:
+                raise TimeoutError
+            ticket = scheduler.acquire(priority, timeout=timeout)
+        except TimeoutError:
+            self._count('deadline_fallbacks_total')
+            self._finish(items)
+            return
+
+        release = partial(scheduler.release, ticket)
+        if deadline is None:
+            self._complete(key, items, release)
+            return
+        try:
+            self.tts_service.upstream_executor.submit(self._complete, key, items, release)
+        except RuntimeError:
+            release()
+            self._finish(items)
+
+    @staticmethod
+    def _finish(items: List[Tuple[str, _Item]]):
+        for _, item in items:
+            item.done.set()
+
+    def _complete(self, key: Tuple, items: List[Tuple[str, _Item]], release: Callable[[], None]):
+        """发出合并后的上游调用，把切分结果写入缓存并唤醒各等待者"""
+        try:
+            clips = self._synthesize_packed(key, [item.text for _, item in items], release)
+            if clips is None:
+                return
+            for (cache_key, item), clip in zip(items, clips):
+                item.audio = clip
+                if self.tts_service.cache:
+                    self.tts_service.cache.put(cache_key, clip)
+                if self.tts_service.peer_cache:
+                    self.tts_service.peer_cache.replicate(cache_key, clip)
+            with self._lock:
+                self.stats['batches_total'] += 1
+                self.stats['packed_items_total'] += len(items)
+                self.stats['upstream_calls_saved_total'] += len(items) - 1
+            logger.debug("打包合成完成: 音色=%s, 项数=%d", key[1], len(items))
+        except Exception as e:
+            self._count('upstream_failures_total')
+            logger.error(f"打包合成异常，回退为单独合成: {e}")
+        finally:
+            self._finish(items)
+
+    def _synthesize_packed(self, key: Tuple, texts: List[str], release: Callable[[], None]) -> Optional[List[bytes]]:
+        model_name, voice, format, sample_rate = key
+        try:
+            api_params = self.tts_service._build_api_params(
+                model_name, build_ssml(texts, self.config['break_ms']), voice, format, sample_rate
+            )
+            # SSML的长度和停顿与普通文本不可比，不计入延迟模型
+            response = self.tts_service._call_upstream(api_params, observe=False)
+        finally:
+            release()
+        if response.get_response().status_code != 200:
+            self._count('upstream_failures_total')
+            logger.warning(f"打包合成失败，回退为单独合成: {response.get_response().message}")
+            return None
+
+        clips = split_audio(response.get_audio_data(), len(texts), self.config['min_gap_ms'],
+                            self.config['padding_ms'], self.config['silence_db'])
+        if clips is None:
+            self._count('split_failures_total')
+            logger.warning(f"打包音频切分失败，回退为单独合成: 项数={len(texts)}")
+        return clips
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取打包统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['open_batches'] = len(self._open)
+        stats.update({
+            'enabled': self.enabled,
+            'window_ms': self.config['window_ms'],
+            'max_items': self.config['max_items'],
+            'max_chars': self.config['max_chars']
+        })
+        return stats
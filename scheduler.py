@@ -0,0 +1,214 @@
+"""
+优先级请求调度器
+在上游并发容量之上按优先级类别进行加权公平调度，为交互流量预留容量，
+批量任务只能使用空闲的共享容量
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLASSES = {
+    'interactive': {'weight': 4, 'reserved': 1},
+    'bulk': {'weight': 1, 'reserved': 0},
+    'prefetch': {'weight': 1, 'reserved': 0}
+}
+
+
+class _Ticket:
+    """一次排队请求"""
+
+    __slots__ = ('priority', 'event', 'granted', 'shared', 'dropped', 'enqueued_at', 'deadline')
+
+    def __init__(self, priority: str, timeout: Optional[float] = None):
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+        self.shared = False
+        self.dropped = False
+        self.enqueued_at = time.monotonic()
+        self.deadline = None if timeout is None else self.enqueued_at + timeout
+
+
+class _ClassState:
+    """单个优先级类别的队列和统计"""
+
+    def __init__(self, weight: float, reserved: int):
+        self.weight = weight
+        self.reserved = reserved
+        self.queue = deque()
+        self.running = 0
+        self.running_reserved = 0
+        self.virtual_time = 0.0
+        self.granted_total = 0
+        self.timeout_total = 0
+        self.wait_time_total = 0.0
+        self.max_wait_time = 0.0
+
+
+class PriorityScheduler:
+    """加权公平调度器 - 每个优先级类别按权重分享共享容量，预留容量仅供本类别使用"""
+
+    def __init__(self, capacity: int, classes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 default_class: str = 'interactive'):
+        classes = classes or DEFAULT_CLASSES
+        self.capacity = capacity
+        self.classes = {
+            name: _ClassState(float(spec.get('weight', 1)), int(spec.get('reserved', 0)))
+            for name, spec in classes.items()
+        }
+        self.default_class = default_class if default_class in self.classes else next(iter(self.classes))
+        self.shared_capacity = max(0, capacity - sum(state.reserved for state in self.classes.values()))
+        self.shared_in_use = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, priority: Optional[str]) -> str:
+        """未知或未指定的类别按默认类别处理"""
+        return priority if priority in self.classes else self.default_class
+
+    def _has_capacity(self, state: _ClassState) -> bool:
+        return state.running_reserved < state.reserved or self.shared_in_use < self.shared_capacity
+
+    def _drop_expired(self, state: _ClassState):
+        """丢弃队首已超过等待期限的请求，避免把槽位分配给已放弃的调用方"""
+        now = time.monotonic()
+        while state.queue and state.queue[0].deadline is not None and state.queue[0].deadline <= now:
+            ticket = state.queue.popleft()
+            ticket.dropped = True
+            state.timeout_total += 1
+            ticket.event.set()
+
+    def _dispatch(self):
+        """在持有锁的情况下，把空闲容量分配给虚拟时间最小的等待类别"""
+        for state in self.classes.values():
+            self._drop_expired(state)
+        while True:
+            candidates = [
+                (state.virtual_time, name, state)
+                for name, state in self.classes.items()
+                if state.queue and self._has_capacity(state)
+            ]
+            if not candidates:
+                return
+
+            _, name, state = min(candidates, key=lambda item: item[0])
+            ticket = state.queue.popleft()
+            self._grant(ticket, state)
+            self._drop_expired(state)
+
+    def _grant(self, ticket: _Ticket, state: _ClassState):
+        """分配一个执行槽位（优先使用本类别的预留容量）"""
+        if state.running_reserved < state.reserved:
+            state.running_reserved += 1
+            ticket.shared = False
+        else:
+            self.shared_in_use += 1
+            ticket.shared = True
+        state.running += 1
+        state.virtual_time += 1.0 / state.weight
+        state.granted_total += 1
+
+        wait_time = time.monotonic() - ticket.enqueued_at
+        state.wait_time_total += wait_time
+        state.max_wait_time = max(state.max_wait_time, wait_time)
+
+        ticket.granted = True
+        ticket.event.set()
+
+    def acquire(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> _Ticket:
+        """申请执行槽位，超时抛出TimeoutError（超时的请求会从队列中移除，不会再被分配槽位）"""
+        ticket = _Ticket(self._normalize(priority), timeout)
+        with self._lock:
+            state = self.classes[ticket.priority]
+            if not state.queue and not state.running:
+                # 类别从空闲变为活跃时对齐虚拟时间，避免积攒的额度长期压制其他类别
+                active = [s.virtual_time for s in self.classes.values() if s.queue or s.running]
+                if active:
+                    state.virtual_time = max(state.virtual_time, min(active))
+            state.queue.append(ticket)
+            self._dispatch()
+
+        if ticket.event.wait(timeout) and ticket.granted:
+            return ticket
+
+        with self._lock:
+            if ticket.granted:
+                return ticket
+            if not ticket.dropped:
+                state.queue.remove(ticket)
+                state.timeout_total += 1
+        raise TimeoutError(f"等待上游并发槽位超时: 优先级={ticket.priority}")
+
+    def try_acquire(self, priority: Optional[str] = None, headroom: int = 0) -> Optional[_Ticket]:
+        """
+        不排队地申请执行槽位，用于可有可无的后台任务
+
+        只有在没有任何请求排队、且分配后仍保留至少headroom个空闲共享槽位时才成功，否则返回None
+        """
+        ticket = _Ticket(self._normalize(priority))
+        with self._lock:
+            state = self.classes[ticket.priority]
+            if any(s.queue for s in self.classes.values()):
+                return None
+            if state.running_reserved >= state.reserved and self.shared_in_use + headroom >= self.shared_capacity:
+                return None
+            self._grant(ticket, state)
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        """释放执行槽位并唤醒等待者"""
+        with self._lock:
+            state = self.classes[ticket.priority]
+            state.running -= 1
+            if ticket.shared:
+                self.shared_in_use -= 1
+            else:
+                state.running_reserved -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[str]:
+        """以上下文管理器方式占用一个执行槽位"""
+        ticket = self.acquire(priority, timeout)
+        try:
+            yield ticket.priority
+        finally:
+            self.release(ticket)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各类别的队列统计"""
+        with self._lock:
+            classes = {}
+            for name, state in self.classes.items():
+                classes[name] = {
+                    'weight': state.weight,
+                    'reserved': state.reserved,
+                    'queued': len(state.queue),
+                    'running': state.running,
+                    'granted_total': state.granted_total,
+                    'timeout_total': state.timeout_total,
+                    'avg_wait_ms': round(state.wait_time_total / state.granted_total * 1000, 2)
+                    if state.granted_total else 0.0,
+                    'max_wait_ms': round(state.max_wait_time * 1000, 2)
+                }
+            return {
+                'capacity': self.capacity,
+                'shared_capacity': self.shared_capacity,
+                'shared_in_use': self.shared_in_use,
+                'classes': classes
+            }
+
+
+def resolve_priority(scheduler_config: Dict[str, Any], priority: Optional[str] = None,
+                     api_key: Optional[str] = None) -> Optional[str]:
+    """确定优先级类别：已登记的客户端API Key优先，其次是请求头中的优先级"""
+    if api_key:
+        key_class = scheduler_config.get('api_key_classes', {}).get(api_key)
+        if key_class:
+            return key_class
+    return priority
@@ -6,6 +6,7 @@
 
 import os
 import sys
+import argparse
 import subprocess
 import time
 
@@ -61,20 +62,32 @@ def check_api_key():
     print("✓ API密钥已配置")
     return True
 
-def start_service():
-    """启动服务"""
+def start_service(workers=None):
+    """启动服务，指定工作进程数时通过多进程启动器运行"""
     print("\n启动TTS服务...")
     print("服务地址: http://localhost:5000")
+    if workers is not None:
+        print(f"工作进程数: {workers or os.cpu_count()}")
+        print("滚动重载: kill -HUP <启动器PID>，优雅停止: kill -TERM <启动器PID>")
     print("按Ctrl+C停止服务")
     print("-" * 50)
     
+    if workers is None:
+        command = [sys.executable, "app.py"]
+    else:
+        command = [sys.executable, "launcher.py", "--workers", str(workers)]
     try:
-        subprocess.run([sys.executable, "app.py"])
+        subprocess.run(command)
     except KeyboardInterrupt:
         print("\n服务已停止")
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='阿里云通义千问TTS服务启动器')
+    parser.add_argument('--workers', type=int, nargs='?', const=0, default=None,
+                        help='以多进程方式启动，可指定工作进程数（默认等于CPU核数）')
+    args = parser.parse_args()
+
     print("=== 阿里云通义千问TTS服务启动器 ===\n")
     
     # 检查Python版本
@@ -94,7 +107,7 @@ def main():
         sys.exit(1)
     
     # 启动服务
-    start_service()
+    start_service(args.workers)
 
 if __name__ == "__main__":
     main()
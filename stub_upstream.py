@@ -0,0 +1,120 @@
+"""
+本地替身上游
+与 dashscope.SpeechSynthesizer.call 接口兼容，按文本长度模拟上游延迟并生成WAV音频，
+用于流量回放、性能基准和多进程测试，不访问网络也不产生费用
+
+通过环境变量 TTS_UPSTREAM=stub 启用，延迟参数:
+    TTS_STUB_FIRST_PACKET_MS  首包延迟（默认150毫秒）
+    TTS_STUB_MS_PER_CHAR      每个字符增加的延迟（默认2毫秒）
+    TTS_STUB_ERROR_RATE       随机失败比例（默认0）
+"""
+
+import io
+import os
+import re
+import math
+import time
+import html
+import wave
+import random
+import struct
+from functools import lru_cache
+from typing import Optional
+
+# 每个词生成一段音调，词之间是静音间隔
+WORD_SECONDS = 0.25
+GAP_SECONDS = 0.08
+EDGE_SILENCE_SECONDS = 0.3
+# 流式回调时每个音频分片的时长
+FRAME_SECONDS = 0.2
+
+_SPEAK = re.compile(r'</?speak[^>]*>')
+_BREAK = re.compile(r'<break\s+time="(\d+)ms"\s*/>')
+
+
+@lru_cache(maxsize=16)
+def _segments(sample_rate: int):
+    """预先生成一个词的音调和一段间隔静音的PCM数据"""
+    word_samples = int(WORD_SECONDS * sample_rate)
+    tone = struct.pack(
+        f'<{word_samples}h',
+        *(int(8000 * math.sin(2 * math.pi * 220 * i / sample_rate)
+              * min(1.0, i / 200, (word_samples - i) / 200))
+          for i in range(word_samples))
+    )
+    gap = b'\x00\x00' * int(GAP_SECONDS * sample_rate)
+    edge = b'\x00\x00' * int(EDGE_SILENCE_SECONDS * sample_rate)
+    return tone, gap, edge
+
+
+def generate_wav(text: str, sample_rate: int = 22050) -> bytes:
+    """生成与文本词数对应的单声道16位WAV，SSML中的<break time="Nms"/>生成对应时长的静音"""
+    tone, gap, edge = _segments(sample_rate)
+    pieces = _BREAK.split(_SPEAK.sub('', text))
+    pcm = [edge]
+    for index, piece in enumerate(pieces):
+        if index % 2:
+            pcm.append(b'\x00\x00' * int(int(piece) / 1000 * sample_rate))
+        else:
+            pcm.append(gap.join([tone] * max(1, len(html.unescape(piece).split()))))
+    pcm.append(edge)
+    pcm = b''.join(pcm)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class _StubStatus:
+    def __init__(self, status_code: int = 200, message: str = '', code: str = ''):
+        self.status_code = status_code
+        self.message = message
+        self.code = code
+
+
+class _StubResult:
+    def __init__(self, audio_data: Optional[bytes], status: _StubStatus, frame: Optional[bytes] = None):
+        self._audio_data = audio_data
+        self._status = status
+        self._frame = frame
+
+    def get_response(self):
+        return self._status
+
+    def get_audio_data(self):
+        return self._audio_data
+
+    def get_audio_frame(self):
+        return self._frame
+
+
+class StubSpeechSynthesizer:
+    """替身合成器"""
+
+    @classmethod
+    def call(cls, model: str, text: str, callback=None, **kwargs):
+        first_packet = float(os.getenv('TTS_STUB_FIRST_PACKET_MS', 150)) / 1000
+        per_char = float(os.getenv('TTS_STUB_MS_PER_CHAR', 2)) / 1000
+        error_rate = float(os.getenv('TTS_STUB_ERROR_RATE', 0))
+
+        time.sleep(first_packet)
+        if error_rate and random.random() < error_rate:
+            return _StubResult(None, _StubStatus(500, 'stub upstream error', 'InternalError'))
+
+        audio_data = generate_wav(text, int(kwargs.get('sample_rate') or 22050))
+        remaining = per_char * len(text)
+        if callback is None:
+            time.sleep(remaining)
+        else:
+            sample_rate = int(kwargs.get('sample_rate') or 22050)
+            frame_size = int(FRAME_SECONDS * sample_rate) * 2
+            frames = [audio_data[i:i + frame_size] for i in range(0, len(audio_data), frame_size)]
+            for index, frame in enumerate(frames):
+                if index:
+                    time.sleep(remaining / len(frames))
+                callback.on_event(_StubResult(None, _StubStatus(), frame))
+        return _StubResult(audio_data, _StubStatus())
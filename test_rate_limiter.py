@@ -0,0 +1,41 @@
+"""
+限流器测试 - 验证令牌桶扣减和超大请求的处理
+"""
+
+import os
+import tempfile
+
+from rate_limiter import SharedRateLimiter
+
+LIMITS = {'requests_per_second': 10, 'request_burst': 20, 'chars_per_second': 1000, 'char_burst': 2000}
+
+
+def make_limiter(directory):
+    return SharedRateLimiter({'enabled': True, 'default': LIMITS}, path=os.path.join(directory, 'ratelimit'), slots=64)
+
+
+def test_char_bucket():
+    """字符桶不足时拒绝，并给出补足所需的时间"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = make_limiter(directory)
+        allowed, info = limiter.check('tenant', 1500)
+        assert allowed and info['remaining_chars'] == 500
+        allowed, info = limiter.check('tenant', 1000)
+        assert not allowed
+        assert 0.4 < info['retry_after'] <= 0.5
+
+
+def test_oversized_request():
+    """超过char_burst的请求在桶满时放行并按实际字符数扣减，欠额补回前拒绝后续请求"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = make_limiter(directory)
+        allowed, info = limiter.check('tenant', 5000)
+        assert allowed
+        assert info['remaining_chars'] == 0
+        # 欠3000字符，需补回3000再积累到下一次请求的10字符
+        allowed, info = limiter.check('tenant', 10)
+        assert not allowed
+        assert 3.0 < info['retry_after'] <= 3.01
+
+        # 其他租户不受影响，桶满时同样可以放行
+        assert limiter.check('other', 5000)[0]
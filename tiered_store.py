@@ -0,0 +1,225 @@
+"""
+音频文件分层存储
+最近访问的文件以原始文件保存在输出目录（可直接sendfile），长时间未访问的文件由后台任务
+无损压缩后移入cold子目录，下次访问时透明解压并提升回热层。
+访问时刷新文件的修改时间作为最近访问标记（不依赖可能被noatime关闭的atime）
+"""
+
+import os
+import bz2
+import lzma
+import gzip
+import time
+import logging
+import tempfile
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    'codec': 'lzma',
+    'cold_after_hours': 24,
+    'scan_interval': 600
+}
+
+# 编码名称 -> (冷层文件扩展名, 压缩, 解压)
+CODECS = {
+    'lzma': ('.xz', lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    'bz2': ('.bz2', lambda data: bz2.compress(data, 9), bz2.decompress),
+    'gzip': ('.gz', lambda data: gzip.compress(data, 6), gzip.decompress)
+}
+_DECOMPRESSORS = {extension: decompress for extension, _, decompress in CODECS.values()}
+
+COLD_DIR = 'cold'
+# 统计提升延迟的样本数
+LATENCY_SAMPLES = 256
+
+
+def _write_atomic(path: str, data: bytes):
+    """写入同目录的唯一临时文件后重命名，多个进程同时写同一路径也不会互相截断"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tier-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class TieredAudioStore:
+    """输出目录的热/冷两层存储"""
+
+    def __init__(self, directory: str, config: Optional[Dict[str, Any]] = None,
+                 is_pending: Optional[Callable[[str], bool]] = None):
+        """
+        Args:
+            directory: 热层目录（audio_outputs）
+            config: 编解码器、转冷时间和扫描间隔
+            is_pending: 判断文件是否仍在后台写入队列中，写入完成前不会转冷
+        """
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        if self.config['codec'] not in CODECS:
+            raise ValueError(f"不支持的压缩编码: {self.config['codec']}")
+        self.enabled = self.config['enabled']
+        self.directory = directory
+        self.cold_directory = os.path.join(directory, COLD_DIR)
+        self.cold_after = self.config['cold_after_hours'] * 3600
+        self.is_pending = is_pending or (lambda path: False)
+        os.makedirs(self.cold_directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {
+            'demoted_total': 0,
+            'demoted_original_bytes': 0,
+            'demoted_compressed_bytes': 0,
+            'promoted_total': 0,
+            'demote_errors': 0
+        }
+
+    def start(self):
+        """启动后台转冷任务"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='tiered-store', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.config['scan_interval']):
+            try:
+                self.demote_cold()
+            except Exception as e:
+                logger.error(f"音频冷存储扫描失败: {e}")
+
+    def _cold_path(self, filename: str) -> Optional[str]:
+        """查找文件在冷层中的路径（任一编码）"""
+        for extension in _DECOMPRESSORS:
+            path = os.path.join(self.cold_directory, filename + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def demote_cold(self, now: Optional[float] = None) -> int:
+        """把超过转冷时间未访问的热层文件压缩移入冷层，返回转冷的文件数"""
+        now = time.time() if now is None else now
+        extension, compress, _ = CODECS[self.config['codec']]
+        demoted = 0
+        with os.scandir(self.directory) as entries:
+            candidates = [
+                entry for entry in entries
+                if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.')
+            ]
+        for entry in candidates:
+            try:
+                if now - entry.stat().st_mtime < self.cold_after or self.is_pending(entry.path):
+                    continue
+                with open(entry.path, 'rb') as f:
+                    data = f.read()
+                compressed = compress(data)
+                cold_path = os.path.join(self.cold_directory, entry.name + extension)
+                _write_atomic(cold_path, compressed)
+                # 压缩期间被访问过（修改时间被刷新）则保留热层文件，丢弃冷层副本
+                if os.stat(entry.path).st_mtime != entry.stat().st_mtime:
+                    os.unlink(cold_path)
+                    continue
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                with self._lock:
+                    self.stats['demote_errors'] += 1
+                logger.error(f"音频文件转冷失败: {entry.name}, {e}")
+                continue
+            demoted += 1
+            with self._lock:
+                self.stats['demoted_total'] += 1
+                self.stats['demoted_original_bytes'] += len(data)
+                self.stats['demoted_compressed_bytes'] += len(compressed)
+        if demoted:
+            logger.info(f"已将{demoted}个音频文件移入冷存储")
+        return demoted
+
+    def _promote(self, filename: str, hot_path: str) -> bool:
+        """解压冷层文件写回热层并删除冷层副本，冷层中不存在时返回False"""
+        cold_path = self._cold_path(filename)
+        if cold_path is None:
+            return False
+        start = time.monotonic()
+        decompress = _DECOMPRESSORS[os.path.splitext(cold_path)[1]]
+        try:
+            with open(cold_path, 'rb') as f:
+                data = decompress(f.read())
+        except FileNotFoundError:
+            # 其他进程刚刚完成提升
+            return os.path.exists(hot_path)
+        _write_atomic(hot_path, data)
+        try:
+            os.unlink(cold_path)
+        except FileNotFoundError:
+            pass
+        latency = time.monotonic() - start
+        with self._lock:
+            self.stats['promoted_total'] += 1
+            self._latencies.append(latency)
+        logger.info(f"音频文件已从冷存储提升: {filename}, 耗时{latency * 1000:.1f}ms")
+        return True
+
+    def resolve(self, filename: str) -> Optional[str]:
+        """
+        获取文件在热层中的路径，位于冷层时先解压提升，并刷新最近访问时间
+
+        Returns:
+            热层文件路径，文件不存在时返回None
+        """
+        hot_path = os.path.join(self.directory, filename)
+        for _ in range(2):
+            try:
+                os.utime(hot_path)
+                return hot_path
+            except FileNotFoundError:
+                pass
+            if not self._promote(filename, hot_path):
+                return None
+        return hot_path if os.path.exists(hot_path) else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各层文件数、占用空间、压缩率和提升延迟"""
+        tiers = {}
+        for tier, directory in (('hot', self.directory), ('cold', self.cold_directory)):
+            files = size = 0
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                        files += 1
+                        size += entry.stat().st_size
+            tiers[tier] = {'files': files, 'bytes': size}
+
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+        original = stats['demoted_original_bytes']
+        stats.update({
+            'enabled': self.enabled,
+            'codec': self.config['codec'],
+            'tiers': tiers,
+            'compression_ratio': round(original / stats['demoted_compressed_bytes'], 3)
+            if stats['demoted_compressed_bytes'] else None,
+            'promotion_latency_ms': {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 2),
+                'p95': round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2)
+            } if latencies else None
+        })
+        return stats
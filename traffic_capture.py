@@ -0,0 +1,88 @@
+"""
+流量采集
+按需记录脱敏后的请求形态（到达时间、文本长度、音色、模型、格式），不保存文本内容，
+供 replay.py 回放。采集文件为JSON Lines：表头行之后每行一个定长数组，
+多个工作进程追加到同一文件时各自写一行表头，到达时间使用绝对时间戳，
+通过环境变量 TTS_CAPTURE_FILE 开启
+"""
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+# 每条记录的字段顺序
+CAPTURE_FIELDS = ['timestamp', 'endpoint', 'text_length', 'text_hash', 'model', 'voice', 'format', 'sample_rate', 'priority']
+
+
+class TrafficRecorder:
+    """请求形态采集器，多个工作进程可以同时追加写入同一个文件"""
+
+    def __init__(self, path: Optional[str] = None, flush_every: int = 64):
+        self.path = path
+        self.flush_every = flush_every
+        self.recorded_total = 0
+        self._lock = threading.Lock()
+        self._buffer = []
+        # 文本摘要加盐：同一次采集内能识别重复文本（影响缓存命中率），又无法反推原文
+        self._salt = os.urandom(16)
+        if self.enabled:
+            self._write_header()
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls) -> 'TrafficRecorder':
+        """根据环境变量创建采集器（未设置TTS_CAPTURE_FILE时不采集）"""
+        return cls(os.getenv('TTS_CAPTURE_FILE') or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _write_header(self):
+        header = {'version': CAPTURE_VERSION, 'fields': CAPTURE_FIELDS}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(header) + '\n')
+        logger.info(f"流量采集已开启: {self.path}")
+
+    def record(self, endpoint: str, text: str, model: str, voice: str, format: str,
+               sample_rate: int, priority: Optional[str] = None):
+        """记录一次请求，只在内存中追加，满flush_every条后批量写入文件"""
+        if not self.enabled:
+            return
+        text_hash = hashlib.blake2b(text.encode('utf-8'), digest_size=6, key=self._salt).hexdigest()
+        row = [round(time.time(), 4), endpoint, len(text), text_hash,
+               model, voice, format, sample_rate, priority]
+        with self._lock:
+            self._buffer.append(row)
+            self.recorded_total += 1
+            if len(self._buffer) < self.flush_every:
+                return
+            rows, self._buffer = self._buffer, []
+        self._write_rows(rows)
+
+    def flush(self):
+        """把缓冲中的记录写入文件"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if rows:
+            self._write_rows(rows)
+
+    def _write_rows(self, rows):
+        # 一次write追加整批记录，多进程以追加模式写入时行不会交错
+        data = ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data.encode('utf-8'))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.error(f"写入流量采集文件失败: {e}")
@@ -0,0 +1,339 @@
+"""
+TTS服务Python客户端
+基于连接池会话，支持失败重试与退避、二进制音频响应、批量并发合成、本地磁盘缓存，
+并提供有并发上限的asyncio版本
+"""
+
+import os
+import json
+import base64
+import asyncio
+import hashlib
+import tempfile
+import functools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterator, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# 服务端在开始合成前返回的状态码（租户限流、内存准入排队超时），POST请求遇到时可安全重发
+POST_RETRY_STATUSES = (429, 503)
+
+
+class TTSClientError(Exception):
+    """语音合成请求失败"""
+
+
+class _Retry(Retry):
+    """POST请求只在连接失败和POST_RETRY_STATUSES时重试，其他请求按status_forcelist重试"""
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() == 'POST':
+            return bool(self.total) and status_code in POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class DiskCache:
+    """客户端本地磁盘缓存，按合成参数的摘要存放音频文件"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """根据请求参数生成缓存键"""
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, audio: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+class TTSClient:
+    """TTS客户端类 - 复用连接池，线程安全"""
+
+    def __init__(self,
+                 base_url: str = "http://localhost:5000",
+                 api_key: Optional[str] = None,
+                 pool_size: int = 16,
+                 max_retries: int = 3,
+                 backoff_factor: float = 0.3,
+                 timeout: float = 30,
+                 cache_dir: Optional[str] = None):
+        """
+        初始化客户端
+
+        Args:
+            base_url: 服务地址
+            api_key: 客户端API Key（通过X-API-Key头发送，用于限流和优先级）
+            pool_size: 连接池大小，应不小于并发数
+            max_retries: 最大重试次数：连接失败时重试所有请求，429/502/503/504时重试GET等幂等请求；
+                POST请求只在429/503（服务端尚未开始合成）时重试，其他错误可能已被处理并计费，不自动重发
+            backoff_factor: 重试退避系数（指数退避，并遵循Retry-After）
+            timeout: 单次请求超时（秒）
+            cache_dir: 本地磁盘缓存目录（可选，不设置则不缓存）
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cache = DiskCache(cache_dir) if cache_dir else None
+
+        retry = _Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 502, 503, 504],
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['X-API-Key'] = api_key
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_json(self, path: str) -> Dict[str, Any]:
+        try:
+            response = self.session.get(f"{self.base_url}{path}", timeout=self.timeout)
+            return response.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+    def _post_json(self, path: str, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=data, headers=headers, timeout=self.timeout)
+            return response.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+    def health_check(self) -> Dict[str, Any]:
+        """健康检查"""
+        return self._get_json('/api/health')
+
+    def get_voices(self) -> Dict[str, Any]:
+        """获取可用音色"""
+        return self._get_json('/api/voices')
+
+    def get_models(self) -> Dict[str, Any]:
+        """获取可用模型"""
+        return self._get_json('/api/models')
+
+    def calculate_cost(self, text: str) -> Dict[str, Any]:
+        """计算成本"""
+        return self._post_json('/api/cost', {"text": text})
+
+    def synthesize(self, text: str, voice: Optional[str] = None, format: str = "wav",
+                   save_file: bool = False, priority: Optional[str] = None, **options) -> Dict[str, Any]:
+        """语音合成，返回服务端的JSON结果（音频为base64编码）"""
+        data = {"text": text, "format": format, "save_file": save_file}
+        if voice:
+            data['voice'] = voice
+        data.update(options)
+        headers = {'X-Priority': priority} if priority else None
+        return self._post_json('/api/synthesize', data, headers)
+
+    def synthesize_audio(self, text: str, voice: Optional[str] = None, format: str = "wav",
+                         sample_rate: Optional[int] = None, priority: Optional[str] = None,
+                         use_cache: bool = True) -> bytes:
+        """
+        语音合成并返回音频字节
+
+        优先请求二进制响应，服务端不支持时自动回退为解码JSON中的base64数据；
+        启用本地缓存时相同参数只请求一次。失败时抛出TTSClientError
+        """
+        data = {"text": text, "format": format}
+        if voice:
+            data['voice'] = voice
+        if sample_rate:
+            data['sample_rate'] = sample_rate
+
+        cache_key = None
+        if self.cache and use_cache:
+            cache_key = DiskCache.make_key(data)
+            audio = self.cache.get(cache_key)
+            if audio is not None:
+                return audio
+
+        headers = {'Accept': f'audio/{format}, application/octet-stream;q=0.9, application/json;q=0.1'}
+        if priority:
+            headers['X-Priority'] = priority
+        try:
+            response = self.session.post(f"{self.base_url}/api/synthesize", json=data,
+                                         headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise TTSClientError(str(e)) from e
+
+        content_type = response.headers.get('content-type', '')
+        if response.ok and not content_type.startswith('application/json'):
+            audio = response.content
+        else:
+            try:
+                result = response.json()
+            except ValueError:
+                raise TTSClientError(f"HTTP {response.status_code}")
+            if not response.ok or not result.get('success'):
+                raise TTSClientError(result.get('message') or result.get('error') or f"HTTP {response.status_code}")
+            audio = base64.b64decode(result['audio_data'])
+
+        if cache_key:
+            self.cache.put(cache_key, audio)
+        return audio
+
+    def synthesize_to_file(self, text: str, filename: str, **kwargs) -> str:
+        """语音合成并保存到本地文件"""
+        audio = self.synthesize_audio(text, **kwargs)
+        with open(filename, 'wb') as f:
+            f.write(audio)
+        return filename
+
+    def synthesize_batch(self, texts: List[str], max_workers: int = 8, **kwargs) -> List[Dict[str, Any]]:
+        """
+        并发合成多段文本，按输入顺序返回结果
+
+        每项结果为 {"success": True, "audio": bytes} 或 {"success": False, "error": "..."}
+        """
+        def run(text):
+            try:
+                return {"success": True, "text": text, "audio": self.synthesize_audio(text, **kwargs)}
+            except TTSClientError as e:
+                return {"success": False, "text": text, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, texts))
+
+    def synthesize_voices(self, text: str, voices: Union[str, List[str]] = "all",
+                          priority: Optional[str] = None, **options) -> Iterator[Dict[str, Any]]:
+        """
+        同一段文本按多个音色合成，按服务端完成顺序逐个产出结果
+
+        每项结果带voice字段（音频为base64编码），失败的音色success为False；
+        最后一项为汇总 {"summary": True, "succeeded": ..., "failed": ...}
+        """
+        data = {"text": text, "voices": voices}
+        data.update(options)
+        headers = {'X-Priority': priority} if priority else None
+        try:
+            response = self.session.post(f"{self.base_url}/api/synthesize/voices", json=data,
+                                         headers=headers, timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise TTSClientError(str(e)) from e
+        with response:
+            if response.status_code != 200:
+                try:
+                    result = response.json()
+                except ValueError:
+                    result = None
+                message = (result.get('message') or result.get('error')) if isinstance(result, dict) else None
+                raise TTSClientError(message or f"HTTP {response.status_code}")
+            try:
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+            except (requests.RequestException, ValueError) as e:
+                raise TTSClientError(f"读取合成结果失败: {e}") from e
+
+    def synthesize_and_download(self, text: str, voice: Optional[str] = None, format: str = "wav",
+                                filename: Optional[str] = None) -> Dict[str, Any]:
+        """语音合成并下载文件"""
+        try:
+            data = {"text": text, "format": format}
+            if voice:
+                data['voice'] = voice
+            response = self.session.post(f"{self.base_url}/api/synthesize/file", json=data, timeout=self.timeout)
+            if response.headers.get('content-type', '').startswith('audio/'):
+                filename = filename or f"downloaded_speech_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+                with open(filename, 'wb') as f:
+                    f.write(response.content)
+                return {"success": True, "filename": filename}
+            return response.json()
+        except Exception as e:
+            return {"error": str(e)}
+
+
+class AsyncTTSClient:
+    """asyncio版本的TTS客户端，在线程中复用同步客户端的连接池，并限制最大并发数"""
+
+    def __init__(self, base_url: str = "http://localhost:5000", max_concurrency: int = 8, **kwargs):
+        kwargs.setdefault('pool_size', max_concurrency)
+        self._client = TTSClient(base_url, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+        self._client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        # 信号量在事件循环中首次使用时创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get_voices(self) -> Dict[str, Any]:
+        """获取可用音色"""
+        return await self._run(self._client.get_voices)
+
+    async def calculate_cost(self, text: str) -> Dict[str, Any]:
+        """计算成本"""
+        return await self._run(self._client.calculate_cost, text)
+
+    async def synthesize(self, text: str, **kwargs) -> Dict[str, Any]:
+        """语音合成（JSON结果）"""
+        return await self._run(self._client.synthesize, text, **kwargs)
+
+    async def synthesize_audio(self, text: str, **kwargs) -> bytes:
+        """语音合成并返回音频字节"""
+        return await self._run(self._client.synthesize_audio, text, **kwargs)
+
+    async def synthesize_batch(self, texts: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """并发合成多段文本（并发数受max_concurrency限制），按输入顺序返回结果"""
+        async def run(text):
+            try:
+                return {"success": True, "text": text, "audio": await self.synthesize_audio(text, **kwargs)}
+            except TTSClientError as e:
+                return {"success": False, "text": text, "error": str(e)}
+
+        return await asyncio.gather(*(run(text) for text in texts))
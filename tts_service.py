@@ -5,13 +5,29 @@
 
 import os
 import json
+import math
+import time
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Union
 from dotenv import load_dotenv
 from dashscope import SpeechSynthesizer
+from dashscope.audio.tts import ResultCallback
 import dashscope
 import base64
 import io
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from audio_cache import SharedAudioCache, make_cache_key
+from scheduler import PriorityScheduler
+from audio_writer import AudioWriter, write_file_atomic
+from prefetcher import Prefetcher
+from profiler import request_tracker
+from audio_slimmer import slim_audio
+from key_pool import ApiKeyPool, NoAvailableKeyError, is_throttled
+from peer_cache import PeerCache
+from deadline import remaining, expired
+from request_packer import RequestPacker
+from latency_model import LatencyModel
 
 # 加载环境变量
 load_dotenv('config.env')
@@ -19,28 +35,95 @@ load_dotenv('config.env')
 # 设置API密钥
 dashscope.api_key = os.getenv('DASHSCOPE_API_KEY')
 
+# 使用本地替身上游（流量回放和压测用，不访问DashScope）
+if os.getenv('TTS_UPSTREAM', 'dashscope').lower() == 'stub':
+    from stub_upstream import StubSpeechSynthesizer as SpeechSynthesizer
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class _AudioFrameCallback(ResultCallback):
+    """将上游流式返回的音频分片转交给调用方"""
+    
+    def __init__(self, on_audio: Callable[[bytes], None]):
+        self.on_audio = on_audio
+    
+    def on_event(self, result):
+        frame = result.get_audio_frame()
+        if frame:
+            self.on_audio(frame)
+
+
 class TTSService:
     """TTS服务类 - 支持多种模型"""
     
     def __init__(self, config_file: str = 'model_config.json'):
         """初始化TTS服务"""
-        self.api_key = os.getenv('DASHSCOPE_API_KEY')
-        if not self.api_key:
-            raise ValueError("请设置DASHSCOPE_API_KEY环境变量")
-        
         # 加载模型配置
         self.config_file = config_file
         self.model_configs = self._load_model_config()
+        
+        # 上游API Key池，请求分配给负载最低的健康Key
+        self.key_pool = ApiKeyPool.from_config(self.model_configs.get('api_keys'))
+        if not len(self.key_pool):
+            raise ValueError("请设置DASHSCOPE_API_KEY或DASHSCOPE_API_KEYS环境变量")
         self.current_model = self.model_configs.get('current_model', 'qwen3-tts-flash')
         
         # 获取当前模型配置
         self.current_config = self.model_configs['models'][self.current_model]
         
+        # 跨进程共享的合成缓存
+        self.cache = SharedAudioCache.from_env()
+        
+        # 多节点分布式缓存（按一致性哈希向归属节点读取和复制）
+        self.peer_cache = PeerCache.from_config(self.cache, self.model_configs.get('peer_cache'))
+        
+        # 输出目录中已保存音频的内容索引（由app.py在创建分层存储后挂载）
+        self.output_index = None
+        
+        # 后台音频写入器，保存文件不占用请求线程
+        self.audio_writer = AudioWriter.from_env()
+        
+        # 每个模型一个优先级调度器，容量为该模型每个Key的上游并发上限乘以Key数量
+        self.scheduler_config = self.model_configs.get('scheduler', {})
+        self.schedulers = {
+            model_name: PriorityScheduler(
+                config.get('max_concurrency', 4) * len(self.key_pool),
+                self.scheduler_config.get('classes'),
+                self.scheduler_config.get('default_class', 'interactive')
+            )
+            for model_name, config in self.model_configs['models'].items()
+        }
+        
+        # 有截止时间的请求在执行器中调用上游，调用方超时放弃等待后结果仍写入缓存
+        self.upstream_executor = ThreadPoolExecutor(
+            max_workers=sum(scheduler.capacity for scheduler in self.schedulers.values()),
+            thread_name_prefix='upstream'
+        )
+        self.deadline_stats = {
+            'predicted_miss': 0,
+            'expired_in_queue': 0,
+            'expired_in_prefetch': 0,
+            'abandoned_upstream': 0,
+            'late_completions': 0,
+            'skipped_encoding': 0
+        }
+        self._deadline_lock = threading.Lock()
+        
+        # 按实际上游调用学习的延迟和音频大小预测
+        self.latency_model = LatencyModel(self.model_configs.get('latency_model'))
+        
+        # 短文本打包：收集窗口内的短文本合并为一次上游调用
+        self.packer = RequestPacker.from_config(self, self.model_configs.get('packing'))
+        
+        # 课文后续句子的低优先级预取
+        self.prefetcher = Prefetcher(
+            self, self.model_configs.get('prefetch'),
+            lesson_db=os.path.join(os.getenv('TTS_CACHE_DIR', 'tts_cache'), 'lessons.db')
+        )
+        
         logger.info(f"TTS服务初始化完成，当前模型: {self.current_model}")
     
     def _load_model_config(self) -> Dict[str, Any]:
@@ -111,13 +194,43 @@ class TTSService:
         
         return True
     
-    def calculate_cost(self, text: str) -> float:
-        """计算文本转语音成本（按字符数计费）"""
+    def calculate_cost(self, text: str, model_name: Optional[str] = None) -> float:
+        """计算文本转语音成本（按字符数计费，默认使用当前模型价格）"""
+        config = self.model_configs['models'][model_name] if model_name else self.current_config
         char_count = len(text)
-        price_per_10k = self.current_config['price_per_10k_chars']
+        price_per_10k = config['price_per_10k_chars']
         cost = (char_count / 10000) * price_per_10k
         return round(cost, 4)
     
+    def predict(self, text: str, voice: Optional[str] = None, format: Optional[str] = None,
+                sample_rate: Optional[int] = None, model_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        预测合成耗时和音频大小（默认使用当前模型及其默认参数）
+        
+        Returns:
+            latency_model.predict的结果，另加按当前排队情况估算的queue_wait_ms、
+            预计总耗时eta_ms和建议的超时时间suggested_timeout_ms
+        """
+        model_name = model_name or self.current_model
+        config = self.model_configs['models'][model_name]
+        prediction = self.latency_model.predict(
+            model_name, voice or config['default_voice'], format or config['default_format'],
+            sample_rate or config['default_sample_rate'], len(text)
+        )
+        # 空闲槽位不足时，排在前面的请求按本次预计延迟估算，每轮占满全部槽位
+        stats = self.schedulers[model_name].get_stats()
+        queued = sum(state['queued'] for state in stats['classes'].values())
+        running = sum(state['running'] for state in stats['classes'].values())
+        free = max(0, stats['capacity'] - running)
+        rounds = 0 if queued < free else math.ceil((queued - free + 1) / stats['capacity'])
+        queue_wait_ms = round(rounds * prediction['latency_ms'], 1)
+        prediction.update({
+            'queue_wait_ms': queue_wait_ms,
+            'eta_ms': round(queue_wait_ms + prediction['latency_ms'], 1),
+            'suggested_timeout_ms': math.ceil(queue_wait_ms + prediction['latency_p95_ms'])
+        })
+        return prediction
+    
     def synthesize_speech(self,
                           text: str,
                           voice: str = None,
@@ -125,7 +238,11 @@ class TTSService:
                           sample_rate: int = None,
                           speed: float = 1.0,
                           volume: float = 1.0,
-                          pitch: float = 1.0) -> Dict[str, Any]:
+                          pitch: float = 1.0,
+                          priority: Optional[str] = None,
+                          return_bytes: bool = False,
+                          slim: Optional[Dict[str, Any]] = None,
+                          deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         将文本转换为语音
         
@@ -137,10 +254,74 @@ class TTSService:
             speed: 语速（1.0为正常速度）
             volume: 音量（1.0为正常音量）
             pitch: 音调（1.0为正常音调）
+            priority: 优先级类别（可选，如interactive/bulk，默认使用调度配置中的默认类别）
+            return_bytes: 为True时以audio字段返回原始音频字节，不做base64编码
+            slim: 音频瘦身选项（可选，见audio_slimmer.parse_slim_options），结果中附带节省的字节数
+            deadline: 截止时间（time.monotonic，可选），超过后放弃排队和等待上游，不再编码结果
         
         Returns:
             包含合成结果的字典
         """
+        params = self._resolve_params(text, voice, format, sample_rate)
+        if not params['success']:
+            return params
+        params['priority'] = priority
+        params['deadline'] = deadline
+        
+        result = self._synthesize_audio(params)
+        if not result['success']:
+            return result
+        if expired(deadline):
+            # 调用方已经放弃，不再做瘦身和base64编码（结果已在缓存中）
+            self._count_deadline('skipped_encoding')
+            return self._deadline_result()
+        
+        audio_data = result['audio']
+        slim_info = None
+        if slim:
+            request_tracker.set_stage('slimming')
+            audio_data, slim_info = slim_audio(audio_data, slim)
+        
+        response = self._build_result(audio_data, result['cost'], params,
+                                      cache_hit=result['cache_hit'], return_bytes=return_bytes)
+        if slim_info:
+            response.update({
+                'original_bytes': slim_info['original_bytes'],
+                'audio_bytes': slim_info['bytes'],
+                'bytes_saved': slim_info['bytes_saved'],
+                'trimmed_ms': slim_info['trimmed_ms']
+            })
+            if slim_info['sample_rate']:
+                response['sample_rate'] = slim_info['sample_rate']
+        return response
+    
+    def stream_speech(self,
+                      text: str,
+                      on_audio: Callable[[bytes], None],
+                      voice: str = None,
+                      format: str = None,
+                      sample_rate: int = None) -> Dict[str, Any]:
+        """
+        流式合成语音，上游返回的音频分片到达后立即通过on_audio回调输出
+        
+        Returns:
+            不含音频数据的合成结果字典
+        """
+        params = self._resolve_params(text, voice, format, sample_rate)
+        if not params['success']:
+            return params
+        
+        result = self._synthesize_audio(params, on_audio=on_audio)
+        if not result['success']:
+            return result
+        
+        response = self._build_result(result['audio'], result['cost'], params,
+                                      cache_hit=result['cache_hit'], return_bytes=True)
+        response['audio_bytes'] = len(response.pop('audio'))
+        return response
+    
+    def _resolve_params(self, text: str, voice: str, format: str, sample_rate: int) -> Dict[str, Any]:
+        """校验文本并补全默认参数"""
         if not self.validate_text(text):
             return {"success": False, "message": "文本内容无效或过长"}
         
@@ -156,41 +337,125 @@ class TTSService:
         if voice not in self.current_config['voices']:
             return {"success": False, "message": f"不支持的音色: {voice}"}
         
+        return {
+            "success": True,
+            "model": self.current_model,
+            "text": text,
+            "voice": voice,
+            "format": format,
+            "sample_rate": sample_rate
+        }
+    
+    def _synthesize_audio(self, params: Dict[str, Any],
+                          on_audio: Optional[Callable[[bytes], None]] = None,
+                          prefetch: bool = False) -> Dict[str, Any]:
+        """
+        合成音频原始数据：先查预取结果和共享缓存，未命中时调用上游接口
+        
+        prefetch为True表示由预取器调用，预取器已占用调度槽位，这里不再排队
+        """
+        model_name = params['model']
+        text = params['text']
+        voice = params['voice']
+        
         try:
             # 计算成本
-            cost = self.calculate_cost(text)
+            cost = self.calculate_cost(text, model_name)
+            
+            # 优先从共享缓存读取，任一工作进程合成过的句子都可直接复用
+            cache_key = make_cache_key(model_name, voice, params['format'], params['sample_rate'], text)
+            request_tracker.set_stage('cache_lookup')
+            if not prefetch:
+                try:
+                    audio_data = self.prefetcher.lookup(cache_key, params.get('deadline'))
+                except TimeoutError:
+                    self._count_deadline('expired_in_prefetch')
+                    return self._deadline_result()
+                if audio_data is not None:
+                    logger.debug("命中预取结果: 模型=%s, 文本长度=%d, 音色=%s", model_name, len(text), voice)
+                    if on_audio:
+                        on_audio(audio_data)
+                    return {"success": True, "audio": audio_data, "cost": 0.0, "cache_hit": True}
+            if self.cache:
+                audio_data = self.cache.get(cache_key)
+                if audio_data is not None:
+                    logger.debug("命中合成缓存: 模型=%s, 文本长度=%d, 音色=%s", model_name, len(text), voice)
+                    if on_audio:
+                        on_audio(audio_data)
+                    return {"success": True, "audio": audio_data, "cost": 0.0, "cache_hit": True}
+            if self.peer_cache:
+                request_tracker.set_stage('peer_lookup')
+                audio_data = self.peer_cache.fetch(cache_key, params.get('deadline'))
+                if audio_data is not None:
+                    logger.debug("命中对等节点缓存: 模型=%s, 文本长度=%d, 音色=%s", model_name, len(text), voice)
+                    if on_audio:
+                        on_audio(audio_data)
+                    return {"success": True, "audio": audio_data, "cost": 0.0, "cache_hit": True}
+            if self.output_index:
+                request_tracker.set_stage('output_lookup')
+                audio_data = self.output_index.fetch(cache_key)
+                if audio_data is not None:
+                    logger.debug("命中已保存的音频文件: 模型=%s, 文本长度=%d, 音色=%s", model_name, len(text), voice)
+                    if self.cache:
+                        self.cache.put(cache_key, audio_data)
+                    if on_audio:
+                        on_audio(audio_data)
+                    return {"success": True, "audio": audio_data, "cost": 0.0, "cache_hit": True}
+            
+            if not prefetch and not on_audio and self.packer.accepts(params):
+                request_tracker.set_stage('packing')
+                try:
+                    audio_data = self.packer.submit(params, cache_key, params.get('priority'), params.get('deadline'))
+                except TimeoutError:
+                    if expired(params.get('deadline')):
+                        return self._deadline_result()
+                    audio_data = None
+                if audio_data is not None:
+                    return {"success": True, "audio": audio_data, "cost": cost, "cache_hit": False}
             
-            logger.info(f"开始合成语音: 模型={self.current_model}, 文本长度={len(text)}, 音色={voice}, 预估成本={cost}元")
+            logger.debug("开始合成语音: 模型=%s, 文本长度=%d, 音色=%s, 预估成本=%s元", model_name, len(text), voice, cost)
             
             # 构建API参数
-            api_params = self.current_config['api_parameters'].copy()
-            api_params.update({
-                'text': text,
-                'voice': voice,
-                'format': format,
-                'sample_rate': sample_rate
-            })
+            api_params = self._build_api_params(model_name, text, voice, params['format'], params['sample_rate'])
+            if on_audio:
+                api_params['callback'] = _AudioFrameCallback(on_audio)
             
-            # 调用TTS API
-            response = SpeechSynthesizer.call(**api_params)
+            # 调用TTS API（按优先级排队占用上游并发槽位）
+            if prefetch:
+                response = self._fetch_upstream(api_params, cache_key)
+            else:
+                deadline = params.get('deadline')
+                scheduler = self.schedulers[model_name]
+                # 排队最多等到截止时间前预计上游耗时的位置，来不及完成的请求不再占用槽位
+                timeout = remaining(deadline)
+                expected = self.latency_model.expected_latency(model_name, voice, len(text))
+                if timeout is not None and expected is not None:
+                    timeout -= expected
+                    if timeout <= 0:
+                        self._count_deadline('predicted_miss')
+                        return self._deadline_result()
+                request_tracker.set_stage('scheduler_wait')
+                try:
+                    ticket = scheduler.acquire(params.get('priority'), timeout=timeout)
+                except TimeoutError:
+                    self._count_deadline('expired_in_queue')
+                    return self._deadline_result()
+                request_tracker.set_stage('upstream')
+                if deadline is None:
+                    response = self._fetch_upstream(api_params, cache_key, lambda: scheduler.release(ticket))
+                else:
+                    response = self._fetch_upstream_until(
+                        api_params, cache_key, lambda: scheduler.release(ticket), deadline
+                    )
+                    if response is None:
+                        return self._deadline_result()
             
             if response.get_response().status_code == 200:
-                # 获取音频数据
+                # 获取音频数据（已由_fetch_upstream写入缓存）
                 audio_data = response.get_audio_data()
-                audio_base64 = base64.b64encode(audio_data).decode('utf-8')
                 
-                logger.info("语音合成成功")
-                return {
-                    "success": True,
-                    "message": "语音合成成功",
-                    "audio_data": audio_base64,
-                    "cost": cost,
-                    "text_length": len(text),
-                    "voice": voice,
-                    "format": format,
-                    "sample_rate": sample_rate,
-                    "model": self.current_model
-                }
+                logger.debug("语音合成成功")
+                return {"success": True, "audio": audio_data, "cost": cost, "cache_hit": False}
             else:
                 error_message = response.get_response().message
                 logger.error(f"语音合成失败: {error_message}")
@@ -200,17 +465,196 @@ class TTSService:
             logger.exception(f"语音合成过程中发生异常: {e}")
             return {"success": False, "message": f"语音合成过程中发生错误: {e}"}
     
+    def _fetch_upstream(self, api_params: Dict[str, Any], cache_key: str,
+                        release: Optional[Callable[[], None]] = None):
+        """调用上游，成功时写入缓存并复制到对等节点，最后归还调度槽位"""
+        try:
+            response = self._call_upstream(api_params)
+            if response.get_response().status_code == 200:
+                audio_data = response.get_audio_data()
+                if self.cache:
+                    self.cache.put(cache_key, audio_data)
+                if self.peer_cache:
+                    self.peer_cache.replicate(cache_key, audio_data)
+            return response
+        finally:
+            if release:
+                release()
+    
+    def _fetch_upstream_until(self, api_params: Dict[str, Any], cache_key: str,
+                              release: Callable[[], None], deadline: float):
+        """
+        在执行器中调用上游，最多等待到截止时间
+        
+        超时返回None；上游调用继续在后台完成，占用的调度槽位在完成后才归还，结果仍写入缓存
+        """
+        try:
+            future = self.upstream_executor.submit(self._fetch_upstream, api_params, cache_key, release)
+        except RuntimeError:
+            release()
+            raise
+        try:
+            return future.result(timeout=remaining(deadline))
+        except FutureTimeoutError:
+            self._count_deadline('abandoned_upstream')
+            future.add_done_callback(lambda _: self._count_deadline('late_completions'))
+            logger.warning(f"等待上游超过截止时间，放弃等待: 文本长度={len(api_params['text'])}")
+            return None
+    
+    def _count_deadline(self, name: str):
+        with self._deadline_lock:
+            self.deadline_stats[name] += 1
+    
+    @staticmethod
+    def _deadline_result() -> Dict[str, Any]:
+        return {"success": False, "message": "请求已超过截止时间", "deadline_exceeded": True}
+    
+    def get_deadline_stats(self) -> Dict[str, int]:
+        """获取截止时间相关的丢弃统计"""
+        with self._deadline_lock:
+            return dict(self.deadline_stats)
+    
+    def _call_upstream(self, api_params: Dict[str, Any], observe: bool = True):
+        """
+        从Key池租用一个Key调用上游，被限流时摘除该Key并换用其他Key重试一次
+
+        observe为True时成功调用的耗时（只计上游调用本身，不含等待Key）计入延迟模型
+        """
+        exclude = None
+        for attempt in range(2):
+            lease = self.key_pool.acquire(exclude=exclude)
+            outcome = 'error'
+            try:
+                start = time.monotonic()
+                response = SpeechSynthesizer.call(api_key=lease.key, **api_params)
+                latency = time.monotonic() - start
+                status = response.get_response()
+                if status.status_code == 200:
+                    outcome = 'success'
+                    if observe:
+                        self.latency_model.observe(
+                            api_params['model'], api_params['voice'], api_params['format'],
+                            api_params['sample_rate'], len(api_params['text']), latency,
+                            len(response.get_audio_data())
+                        )
+                elif is_throttled(status.status_code, getattr(status, 'code', None)):
+                    outcome = 'throttled'
+            finally:
+                self.key_pool.release(lease, outcome)
+            if outcome != 'throttled' or attempt or len(self.key_pool) < 2:
+                return response
+            logger.warning(f"上游限流，换用其他API Key重试: {lease.name}")
+            exclude = lease.name
+        return response
+    
+    def _build_api_params(self, model_name: str, text: str, voice: str,
+                          format: str, sample_rate: int) -> Dict[str, Any]:
+        """构建上游API调用参数"""
+        api_params = self.model_configs['models'][model_name]['api_parameters'].copy()
+        api_params.update({
+            'text': text,
+            'voice': voice,
+            'format': format,
+            'sample_rate': sample_rate
+        })
+        return api_params
+    
+    def probe_upstream(self, model_name: str, text: str = 'Hi.') -> Dict[str, Any]:
+        """
+        探测上游可用性：用极短文本直接调用上游（不经过缓存和调度器）
+        
+        探测同样从Key池租用Key，占用并发额度，被限流时摘除该Key
+        
+        Returns:
+            {"success": bool, "latency": 秒, "message": 错误信息}
+        """
+        config = self.model_configs['models'][model_name]
+        api_params = self._build_api_params(
+            model_name, text, config['default_voice'],
+            config['default_format'], config['default_sample_rate']
+        )
+        try:
+            lease = self.key_pool.acquire()
+        except NoAvailableKeyError:
+            return {"success": False, "latency": 0.0, "message": "没有健康的API Key"}
+        outcome = 'error'
+        start = time.monotonic()
+        try:
+            response = SpeechSynthesizer.call(api_key=lease.key, **api_params)
+            latency = time.monotonic() - start
+            status = response.get_response()
+            if status.status_code == 200:
+                outcome = 'success'
+                return {"success": True, "latency": latency, "message": ""}
+            if is_throttled(status.status_code, getattr(status, 'code', None)):
+                outcome = 'throttled'
+            return {"success": False, "latency": latency, "message": str(status.message)}
+        except Exception as e:
+            return {"success": False, "latency": time.monotonic() - start, "message": str(e)}
+        finally:
+            self.key_pool.release(lease, outcome)
+    
+    def _build_result(self, audio_data: bytes, cost: float, params: Dict[str, Any],
+                      cache_hit: bool = False, return_bytes: bool = False) -> Dict[str, Any]:
+        """构建合成成功的返回结果"""
+        request_tracker.set_stage('encoding')
+        result = {
+            "success": True,
+            "message": "语音合成成功",
+            "cost": cost,
+            "cache_hit": cache_hit,
+            "text_length": len(params['text']),
+            "voice": params['voice'],
+            "format": params['format'],
+            "sample_rate": params['sample_rate'],
+            "model": params['model']
+        }
+        if return_bytes:
+            result['audio'] = audio_data
+        else:
+            result['audio_data'] = base64.b64encode(audio_data).decode('utf-8')
+        return result
+    
+    def get_packing_stats(self) -> Dict[str, Any]:
+        """获取短文本打包统计"""
+        return self.packer.get_stats()
+    
+    def get_latency_stats(self) -> Dict[str, Any]:
+        """获取各模型/音色的延迟回归系数"""
+        return self.latency_model.get_stats()
+    
+    def get_key_pool_stats(self) -> Dict[str, Any]:
+        """获取各上游API Key的负载和调用统计"""
+        return self.key_pool.get_stats()
+    
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """获取各模型调度器的队列统计"""
+        return {model_name: scheduler.get_stats() for model_name, scheduler in self.schedulers.items()}
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取合成缓存统计信息"""
+        if not self.cache:
+            return {'enabled': False}
+        stats = self.cache.get_stats()
+        stats['enabled'] = True
+        if self.peer_cache:
+            stats['peers'] = self.peer_cache.get_stats()
+        return stats
+    
     def save_audio_to_file(self, audio_base64: str, filename: str) -> bool:
-        """将base64编码的音频数据保存为文件"""
+        """将base64编码的音频数据保存为文件（同步原子写入）"""
         try:
             audio_data = base64.b64decode(audio_base64)
-            with open(filename, 'wb') as f:
-                f.write(audio_data)
+            write_file_atomic(filename, audio_data)
             logger.info(f"音频文件已保存: {filename}")
             return True
         except Exception as e:
             logger.error(f"保存音频文件失败: {str(e)}")
             return False
+    
+    def save_audio_async(self, audio: Union[str, bytes], filename: str) -> bool:
+        """将音频数据（base64字符串或原始字节）交给后台写入器保存，队列持续满载时返回False"""
+        return self.audio_writer.submit(filename, audio, is_base64=isinstance(audio, str))
 
 
 # 创建全局TTS服务实例
@@ -0,0 +1,97 @@
+"""
+多音色并发合成
+同一段文本按多个音色并发合成（并发数不超过当前模型的调度容量），按完成顺序逐条输出结果，
+单个音色失败不影响其他音色，总耗时接近单次合成
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Generator, Union
+
+logger = logging.getLogger(__name__)
+
+# 结果中不随每条记录重复输出的字段
+_OMITTED_FIELDS = ('message', 'text_length', 'model')
+
+
+class VoiceFanout:
+    """一段文本的多音色合成任务"""
+
+    def __init__(self, tts_service, text: str, voices: Union[str, List[str], None] = 'all',
+                 format: Optional[str] = None, sample_rate: Optional[int] = None,
+                 priority: Optional[str] = None, deadline: Optional[float] = None,
+                 slim: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            tts_service: TTS服务实例
+            text: 要合成的文本
+            voices: 音色列表，"all"或未指定时使用当前模型的全部音色
+            format / sample_rate / priority / deadline / slim: 同 synthesize_speech
+
+        Raises:
+            ValueError: 文本无效、音色列表为空或包含不支持的音色
+        """
+        if not tts_service.validate_text(text):
+            raise ValueError('文本内容无效或过长')
+        available = list(tts_service.get_available_voices())
+        if voices is None or voices == 'all':
+            voices = available
+        if not isinstance(voices, list) or not voices or not all(isinstance(voice, str) for voice in voices):
+            raise ValueError('voices必须是音色名称列表或"all"')
+        unknown = [voice for voice in voices if voice not in available]
+        if unknown:
+            raise ValueError(f"不支持的音色: {', '.join(unknown)}")
+
+        self.tts_service = tts_service
+        self.text = text
+        self.voices = list(dict.fromkeys(voices))
+        self.format = format
+        self.sample_rate = sample_rate
+        self.priority = priority
+        self.deadline = deadline
+        self.slim = slim
+        self.concurrency = min(len(self.voices), tts_service.schedulers[tts_service.current_model].capacity)
+
+    def _synthesize(self, voice: str) -> Dict[str, Any]:
+        try:
+            result = self.tts_service.synthesize_speech(
+                self.text, voice, self.format, self.sample_rate, priority=self.priority,
+                slim=self.slim, deadline=self.deadline
+            )
+        except Exception as e:
+            logger.exception(f"音色{voice}合成异常: {e}")
+            result = {"success": False, "message": str(e)}
+        result = {key: value for key, value in result.items() if key not in _OMITTED_FIELDS or not result['success']}
+        result['voice'] = voice
+        return result
+
+    def stream(self) -> Generator[Dict[str, Any], None, None]:
+        """按完成顺序输出每个音色的结果，最后输出汇总记录；中途停止迭代时取消未开始的合成"""
+        start = time.monotonic()
+        succeeded = 0
+        total_cost = 0.0
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='fanout')
+        futures = [executor.submit(self._synthesize, voice) for voice in self.voices]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                if result['success']:
+                    succeeded += 1
+                    total_cost += result.get('cost', 0.0)
+                result['elapsed_ms'] = round((time.monotonic() - start) * 1000, 1)
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        yield {
+            "summary": True,
+            "text_length": len(self.text),
+            "voices": len(self.voices),
+            "succeeded": succeeded,
+            "failed": len(self.voices) - succeeded,
+            "total_cost": round(total_cost, 6),
+            "elapsed_ms": round((time.monotonic() - start) * 1000, 1)
+        }